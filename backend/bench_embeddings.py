@@ -0,0 +1,116 @@
+"""
+Benchmark de los backends de EmbeddingService en CPU: PyTorch (SentenceTransformer)
+contra ONNX Runtime y ONNX cuantizado a int8 (EMBEDDING_BACKEND).
+
+    python bench_embeddings.py --backends torch onnx onnx-int8 --texts 2000 --threads 4
+
+Por backend mide:
+- throughput en bloque (textos/s), como generate_many en la ingesta y el re-embedding
+- latencia de una consulta (p50/p95), como el chat
+- deriva frente a torch: coseno medio entre los vectores del mismo texto y
+  recall@k de las búsquedas (qué fracción del top-k de torch se mantiene)
+
+Usa textos sintéticos con el mismo formato que product_text. No necesita base de
+datos; el backend ONNX requiere el extra [onnx] (pip install -e ".[onnx]").
+"""
+import argparse
+import os
+import random
+import time
+import numpy as np
+from src.modules.intelligence.reembed import product_text
+from src.modules.intelligence.service import BACKENDS, EmbeddingService
+
+WORDS = [
+    "laptop", "monitor", "teclado", "mouse", "impresora", "router", "servidor", "licencia",
+    "soporte", "anual", "inalámbrico", "gamer", "oficina", "industrial", "pulgadas", "memoria",
+    "disco", "SSD", "RAM", "antivirus", "nube", "instalación", "mantenimiento", "cable",
+]
+
+
+def synthetic_texts(count: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        name = " ".join(rng.choices(WORDS, k=3)).capitalize()
+        description = " ".join(rng.choices(WORDS, k=rng.randrange(6, 20)))
+        texts.append(product_text(f"{name} {i}", description, round(rng.uniform(5, 5000), 2), rng.randrange(0, 500)))
+    return texts
+
+
+def bench_backend(model: str, backend: str, texts: list[str], queries: list[str]) -> dict:
+    service = EmbeddingService(model, backend=backend)
+    service.load()
+    service._encode_many(texts[:8])  # primera inferencia fuera de la medición
+
+    started = time.perf_counter()
+    vectors = service._encode_many(texts)
+    bulk = time.perf_counter() - started
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        started = time.perf_counter()
+        query_vectors.append(service._encode_many([query])[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "service": service,
+        "texts_per_second": len(texts) / bulk,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "vectors": vectors,
+        "queries": np.stack(query_vectors),
+    }
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _top_k(queries: np.ndarray, vectors: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(_unit(queries) @ _unit(vectors).T), axis=1)[:, :k]
+
+
+def drift(reference: dict, result: dict, k: int) -> tuple[float, float]:
+    """Coseno medio texto a texto y recall@k de las consultas contra el top-k de referencia."""
+    cosine = float(np.mean(np.sum(_unit(reference["vectors"]) * _unit(result["vectors"]), axis=1)))
+    expected = _top_k(reference["queries"], reference["vectors"], k)
+    found = _top_k(result["queries"], result["vectors"], k)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)])
+    return cosine, float(recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, help="EMBEDDING_THREADS para todos los backends")
+    args = parser.parse_args()
+
+    if args.threads:
+        os.environ["EMBEDDING_THREADS"] = str(args.threads)
+    texts = synthetic_texts(args.texts)
+    # Consultas cortas al estilo del chat: nombre + un par de palabras
+    rng = random.Random(7)
+    queries = [f"{' '.join(rng.choices(WORDS, k=3))} barato" for _ in range(args.queries)]
+
+    results = {}
+    for backend in args.backends:
+        print(f"⏳ {backend}: cargando {args.model}...")
+        results[backend] = bench_backend(args.model, backend, texts, queries)
+
+    reference = results.get("torch")
+    print(f"\n{'backend':<10} {'textos/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'coseno':>8} {f'recall@{args.k}':>10}")
+    for backend, result in results.items():
+        cosine, recall = drift(reference, result, args.k) if reference is not None else (None, None)
+        quality = f"{cosine:8.4f} {recall:10.3f}" if cosine is not None else f"{'-':>8} {'-':>10}"
+        print(f"{backend:<10} {result['texts_per_second']:10.1f} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} {quality}")
+    if reference is None:
+        print("(sin torch en --backends no hay referencia para medir la deriva)")
+
+
+if __name__ == "__main__":
+    main()
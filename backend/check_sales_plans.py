@@ -0,0 +1,89 @@
+"""
+Verifica que las consultas de ventas usen sus índices (EXPLAIN contra Postgres).
+
+    python check_sales_plans.py                 # contra los datos actuales
+    python check_sales_plans.py --seed 200000   # agrega ventas sintéticas (se descartan al final)
+
+Cada consulta es la misma forma que usan el chat, /auth/profile, /ingestion/sales y el
+borrado de productos. Con --seed todo corre en una transacción que se revierte: las
+ventas sintéticas y sus estadísticas no quedan en la base. Los índices deben existir
+(los crea el arranque de la API con ensure_indexes). Sale con código 1 si alguna
+consulta no usa el índice esperado.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from sqlalchemy import select, text, func
+from sqlalchemy.dialects import postgresql
+from src.shared.database import SessionLocal, engine
+from src.modules.intelligence.models import Sale, Product
+
+SEED_SQL = """
+INSERT INTO sales (product_id, quantity, price_total, sale_date, category, region, customer_type, customer_name, seller_name, payment_method)
+SELECT CASE WHEN i % 1000 = 0 THEN CAST(:product_id AS INTEGER) END, 1 + i % 5, (i % 500) * 10.0,
+       TIMESTAMP '2023-01-01' + (i % 730) * INTERVAL '1 day' + (i % 1440) * INTERVAL '1 minute',
+       (ARRAY['Software', 'Hardware', 'Servicios'])[1 + i % 3], 'Global', 'Individual',
+       'Cliente Plan ' || (i % 2000), 'Vendedor Plan ' || (i % 40), 'Card'
+FROM generate_series(1, :rows) AS i
+"""
+
+
+def checks(customer: str, seller: str, product_id: int) -> list:
+    """(descripción, índice esperado, consulta)"""
+    return [
+        ("historial de un cliente (chat)", "ix_sales_customer_name_sale_date",
+         select(Sale).where(Sale.customer_name.in_([customer])).order_by(Sale.sale_date.desc()).limit(10)),
+        ("ventas de un vendedor (/auth/profile)", "ix_sales_seller_name_sale_date",
+         select(Sale).where(Sale.seller_name == seller).order_by(Sale.sale_date.desc())),
+        ("últimas ventas (/ingestion/sales)", "ix_sales_sale_date",
+         select(Sale).order_by(Sale.sale_date.desc()).limit(100)),
+        ("ventas de un mes", "ix_sales_sale_date",
+         select(func.sum(Sale.price_total)).where(Sale.sale_date >= "2024-03-01", Sale.sale_date < "2024-04-01")),
+        ("ventas de un producto (FK al borrar)", "ix_sales_product_id",
+         select(Sale.id).where(Sale.product_id == product_id).limit(1)),
+    ]
+
+
+def _indexes(plan: dict) -> set:
+    found = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= _indexes(child)
+    return found
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="ventas sintéticas a insertar antes de medir")
+    args = parser.parse_args()
+
+    failed = 0
+    async with SessionLocal() as db:
+        product_id = await db.scalar(select(func.min(Product.id))) or 0
+        if args.seed:
+            print(f"Insertando {args.seed} ventas sintéticas (se revierten al final)...")
+            await db.execute(text(SEED_SQL), {"rows": args.seed, "product_id": product_id or None})
+            await db.execute(text("ANALYZE sales"))
+        customer = await db.scalar(select(Sale.customer_name).where(Sale.customer_name.is_not(None)).limit(1)) or ""
+        seller = await db.scalar(select(Sale.seller_name).where(Sale.seller_name.is_not(None)).limit(1)) or ""
+        total = await db.scalar(select(func.count()).select_from(Sale))
+        print(f"{total} ventas en sales\n")
+
+        for description, index, query in checks(customer, seller, product_id):
+            sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+            result = await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+            plan = result.scalar()
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            used = _indexes(plan)
+            ok = index in used
+            failed += not ok
+            print(f"{'✅' if ok else '❌'} {description}: espera {index}, usa {', '.join(sorted(used)) or plan['Node Type']}")
+        await db.rollback()
+    await engine.dispose()
+    if failed:
+        print(f"\n{failed} consulta(s) sin el índice esperado")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
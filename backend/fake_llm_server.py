@@ -0,0 +1,71 @@
+"""
+Servidor LLM falso compatible con la API de OpenAI (/v1/chat/completions).
+
+Sirve para probar /chat y /chat/stream sin llamar a Groq:
+
+    uvicorn fake_llm_server:app --port 8001
+
+    LLM_MODEL=openai/fake-model LLM_API_BASE=http://127.0.0.1:8001/v1 LLM_API_KEY=fake \
+        uvicorn src.main:app
+
+FAKE_LLM_DELAY (segundos, por defecto 0.05) simula la latencia entre tokens.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Fake LLM")
+
+DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.05"))
+
+
+def _answer(messages: list) -> str:
+    question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    return f"Respuesta de prueba para: {question}"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake-model")
+    answer = _answer(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(DELAY)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(answer.split()), "total_tokens": len(answer.split())},
+        }
+
+    async def events():
+        for i, word in enumerate(answer.split(" ")):
+            await asyncio.sleep(DELAY)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -1,21 +1,47 @@
+"""
+Recalcula embeddings de productos por lotes, con checkpoint por lote.
+
+    python fix_embeddings.py                         # solo productos sin vector
+    python fix_embeddings.py --target all            # todo el catálogo (ej. nuevo modelo)
+    python fix_embeddings.py --target model --model all-MiniLM-L6-v2       # con y sin normalizar
+    python fix_embeddings.py --target model --model "all-MiniLM-L6-v2|norm"  # un model_key exacto
+    python fix_embeddings.py --resume 7              # retoma el job 7 donde quedó
+
+Cada lote se confirma junto con su checkpoint: si el proceso se corta, --resume
+sigue desde el último lote guardado. El mismo job se puede lanzar desde
+POST /intelligence/embeddings/reembed.
+"""
+import argparse
 import asyncio
 from src.shared.database import SessionLocal
-from sqlalchemy import select
-from src.modules.intelligence.models import Product
-from src.modules.intelligence.service import EmbeddingService
-import json
+from src.modules.intelligence import reembed
+
+
+def _print_progress(job: dict):
+    progress = f"{job['progress'] * 100:5.1f}%" if job["progress"] is not None else "  -  "
+    print(f"{progress} {job['processed']}/{job['total']} (id <= {job['last_product_id']}) {job['vectors_per_second']} vectores/s")
+
 
 async def main():
-    embedding_service = EmbeddingService()
-    async with SessionLocal() as db:
-        result = await db.execute(select(Product).where(Product.embedding.is_(None)))
-        products = result.scalars().all()
-        for p in products:
-            payload = json.dumps({"name": p.name, "description": p.description, "price": p.price, "stock": p.stock})
-            vec = await embedding_service.generate(payload)
-            p.embedding = vec
-            print(f"Generated embedding for {p.name}")
-        await db.commit()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=reembed.TARGETS, default="missing")
+    parser.add_argument("--model", help="con --target model: modelo de los vectores a recalcular; el nombre solo incluye sus "
+                             "vectores con y sin normalizar ('modelo|norm' = solo esos). Sin valor: los que no lo registran")
+    parser.add_argument("--batch-size", type=int, default=reembed.BATCH_SIZE)
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="retomar un job existente")
+    args = parser.parse_args()
+
+    if args.resume:
+        job_id = args.resume
+    else:
+        async with SessionLocal() as db:
+            job = await reembed.create_job(db, args.target, args.model, args.batch_size)
+            job_id = job.id
+            print(f"Job de re-embedding {job_id}: {job.total} productos (target={job.target})")
+
+    result = await reembed.run_job(job_id, on_progress=_print_progress)
+    print(f"✅ Job {job_id} {result['status']}: {result['processed']} vectores, {result['vectors_per_second']} vectores/s")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
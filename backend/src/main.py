@@ -1,4 +1,5 @@
 import asyncio
+import os
 import sys
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -25,6 +26,34 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    # Columnas nuevas en tablas existentes (create_all no las agrega)
+    from src.shared.migrations import run_migrations
+    await run_migrations(engine)
+
+    # Índices nuevos sobre tablas existentes (CONCURRENTLY, sin bloquear escrituras)
+    from src.shared.migrations import ensure_indexes
+    try:
+        created = [name for name, status in (await ensure_indexes(engine)).items() if status == "created"]
+        if created:
+            print(f"🗂️ Índices creados: {', '.join(created)}")
+    except Exception as e:
+        print(f"\n❌ ERROR CREANDO ÍNDICES: {e}\n")
+
+    # Resumen diario de ventas de los reportes (se reconstruye una vez desde sales)
+    from src.modules.reports.rollup import ensure_rollup
+    try:
+        await ensure_rollup()
+    except Exception as e:
+        print(f"\n❌ ERROR RECONSTRUYENDO RESUMEN DE VENTAS: {e}\n")
+
+    # Índice ANN de products.embedding (crea/ajusta según VECTOR_INDEX_TYPE)
+    from src.modules.intelligence.vector_index import ensure_vector_index
+    try:
+        status = await ensure_vector_index(engine)
+        print(f"🔎 Índice vectorial: {status}")
+    except Exception as e:
+        print(f"\n❌ ERROR CREANDO ÍNDICE VECTORIAL: {e}\n")
+
     # Inyección de usuarios por defecto
     async with SessionLocal() as db:
         admin_user = await db.execute(select(User).where(User.email == "admin@epsilon.com"))
@@ -40,8 +69,33 @@ async def lifespan(app: FastAPI):
             print("\n✅ CONEXION EXITOSA Y TABLAS CREADAS!\n")
     except Exception as e:
         print(f"\n❌ ERROR DE INICIO: {e}\n")
+
+    # Modelo de embeddings compartido por worker (carga + warm-up fuera del event loop).
+    # Se precarga el del espacio vectorial activo, que puede diferir de EMBEDDING_MODEL tras un cambio de modelo.
+    if os.getenv("EMBEDDING_PRELOAD", "true").lower() in ("1", "true", "yes"):
+        from src.modules.intelligence.spaces import active_embedding_service
+        try:
+            async with SessionLocal() as db:
+                service = await active_embedding_service(db)
+            await asyncio.to_thread(service.warmup)
+        except Exception as e:
+            print(f"\n❌ ERROR CARGANDO MODELO DE EMBEDDINGS: {e}\n")
+
+    # Worker de ingesta en segundo plano (desactivable si corre como proceso aparte)
+    from src.modules.data_ingestion.worker import get_ingestion_worker
+    if os.getenv("INGESTION_WORKER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        get_ingestion_worker().start()
     yield
 
+    await get_ingestion_worker().stop()
+
+    from src.modules.intelligence.service import loaded_embedding_services
+    for service in loaded_embedding_services():
+        service.shutdown()
+
+    from src.modules.interaction.llm import get_llm_client
+    await get_llm_client().close()
+
 app = FastAPI(
     title="Agente Inteligente API",
     description="Backend con Arquitectura Hexagonal para Sistema de Agentes Inteligentes",
@@ -70,6 +124,15 @@ app.include_router(chat_router)
 from src.modules.reports.router import router as reports_router
 app.include_router(reports_router)
 
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from src.modules.intelligence.service import EmbeddingQueueFullError
+
+@app.exception_handler(EmbeddingQueueFullError)
+async def embedding_queue_full_handler(request: Request, exc: EmbeddingQueueFullError):
+    # Backpressure: la cola de inferencia está llena, el cliente debe reintentar
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 @app.get("/health")
 async def health_check():
     """
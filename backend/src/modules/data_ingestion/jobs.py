@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from sqlalchemy import update, select, exists, and_, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.modules.data_ingestion.models import IngestionJob, RawData
+
+
+async def mark_running(db: AsyncSession, job_ids: set):
+    """
+    Marca los jobs como 'running' la primera vez que el worker toma una de sus filas.
+    Un job 'receiving' (archivo todavía subiéndose) solo registra started_at.
+    """
+    if not job_ids:
+        return
+    await db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id.in_(job_ids), IngestionJob.status.in_(["queued", "receiving"]))
+        .values(
+            status=case((IngestionJob.status == "queued", "running"), else_=IngestionJob.status),
+            started_at=func.coalesce(IngestionJob.started_at, func.now()),
+        )
+    )
+
+
+async def seal_job(db: AsyncSession, job_id: int):
+    """
+    Cierra la recepción de un job 'receiving' (ya se guardaron todos sus bloques).
+    Si el worker ya procesó todo lo recibido, el job termina aquí mismo.
+    """
+    await db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.status == "receiving")
+        .values(status=case((IngestionJob.started_at.is_(None), "queued"), else_="running"))
+    )
+    await finish_jobs(db, {job_id})
+
+
+async def record_progress(db: AsyncSession, stats: dict):
+    """
+    Suma el avance de un batch a cada job:
+    stats = {job_id: {"rows", "new", "duplicates", "errors", "last_error"}}.
+    Se ejecuta en la misma transacción que inserta las ventas/productos.
+    """
+    for job_id, job_stats in stats.items():
+        values = {
+            "processed_rows": IngestionJob.processed_rows + job_stats["rows"],
+            "new_rows": IngestionJob.new_rows + job_stats["new"],
+            "duplicate_rows": IngestionJob.duplicate_rows + job_stats["duplicates"],
+            "error_count": IngestionJob.error_count + job_stats["errors"],
+        }
+        if job_stats["last_error"]:
+            values["last_error"] = job_stats["last_error"]
+        await db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(**values))
+
+
+async def finish_jobs(db: AsyncSession, job_ids: set):
+    """
+    Cierra los jobs que ya no tienen datos crudos pendientes ni en proceso.
+    record_progress bloquea antes la fila del job, así que esto no compite con seal_job.
+    """
+    if not job_ids:
+        return
+    pending = exists().where(RawData.job_id == IngestionJob.id, RawData.status.in_(["pending", "processing"]))
+    base = update(IngestionJob).where(
+        IngestionJob.id.in_(job_ids),
+        IngestionJob.status.in_(["queued", "running"]),
+        ~pending,
+    )
+    # Si ninguna fila entró, el job se considera fallido
+    all_failed = and_(IngestionJob.processed_rows == 0, IngestionJob.error_count > 0)
+    await db.execute(base.where(all_failed).values(status="failed", finished_at=func.now()))
+    await db.execute(base.where(~all_failed).values(status="done", finished_at=func.now()))
+
+
+async def fail_job(db: AsyncSession, job_id: int, error: str):
+    await db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.status.notin_(["done", "failed"]))
+        .values(status="failed", last_error=error[:1000], finished_at=func.now())
+    )
+
+
+async def get_job(db: AsyncSession, job_id: int) -> IngestionJob | None:
+    result = await db.execute(select(IngestionJob).where(IngestionJob.id == job_id))
+    return result.scalar_one_or_none()
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    elapsed = None
+    if job.started_at:
+        end = job.finished_at or datetime.now(timezone.utc)
+        elapsed = max((end - job.started_at).total_seconds(), 0.0)
+    processed = job.processed_rows or 0
+    return {
+        "id": job.id,
+        "source": job.source,
+        "filename": job.filename,
+        "status": job.status,
+        "total_rows": job.total_rows,
+        "processed_rows": processed,
+        "new_rows": job.new_rows or 0,
+        "duplicate_rows": job.duplicate_rows or 0,
+        "error_count": job.error_count or 0,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+        "rows_per_second": round(processed / elapsed, 1) if elapsed else None,
+    }
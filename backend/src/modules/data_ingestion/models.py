@@ -1,7 +1,24 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey, Text, Index, text
 from sqlalchemy.sql import func
 from src.shared.database import Base
 
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String)              # Ej: "excel_upload", "manual_entry"
+    filename = Column(String, nullable=True)
+    status = Column(String, default="queued", index=True)  # receiving | queued | running | done | failed
+    total_rows = Column(Integer, default=0)
+    processed_rows = Column(Integer, default=0)
+    new_rows = Column(Integer, default=0)        # filas insertadas
+    duplicate_rows = Column(Integer, default=0)  # filas ya cargadas antes (misma huella)
+    error_count = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 class RawData(Base):
     __tablename__ = "raw_data"
 
@@ -9,3 +26,19 @@ class RawData(Base):
     source = Column(String, index=True)  # Ej: "web_scraping_ventas"
     payload = Column(JSON)               # El JSON crudo se guarda aqui
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    job_id = Column(Integer, ForeignKey("ingestion_jobs.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Cola de procesamiento: pending -> processing -> done | failed (ver data_ingestion/queue.py)
+    status = Column(String, nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    # Identidad de la subida para las huellas de ventas (ver normalization.sale_fingerprints):
+    # hash del contenido del archivo/payload, o un id propio en ventas manuales
+    upload_key = Column(String(64), nullable=True)
+    row_offset = Column(Integer, nullable=True)  # posición de la primera fila del bloque en la subida
+
+    __table_args__ = (
+        # Índice parcial: el claim solo recorre filas pendientes o en proceso
+        Index("ix_raw_data_claimable", "id", postgresql_where=text("status IN ('pending', 'processing')")),
+    )
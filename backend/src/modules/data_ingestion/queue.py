@@ -0,0 +1,74 @@
+import os
+from datetime import timedelta
+from sqlalchemy import select, update, delete, or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.modules.data_ingestion.models import RawData
+
+# Reintentos por dato crudo antes de marcarlo como 'failed'
+MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+# Un claim 'processing' más viejo que esto se considera de un worker caído y se vuelve a tomar.
+# Debe ser mayor que lo que tarda el batch más lento.
+CLAIM_TIMEOUT = float(os.getenv("INGESTION_CLAIM_TIMEOUT", "300"))
+# Horas que se conservan los datos crudos ya procesados ('done') antes de purgarlos
+RETENTION_HOURS = float(os.getenv("INGESTION_RETENTION_HOURS", "24"))
+
+
+async def claim_raw_data(db: AsyncSession, limit: int) -> list[RawData]:
+    """
+    Toma hasta `limit` datos crudos pendientes (o con claim vencido) y los marca como 'processing'.
+
+    FOR UPDATE SKIP LOCKED hace que varios workers (en uno o varios procesos/hosts)
+    reciban filas distintas sin esperarse entre sí. El claim se confirma en su propia
+    transacción corta, así el procesamiento posterior no retiene locks de fila.
+    """
+    stale = func.now() - timedelta(seconds=CLAIM_TIMEOUT)
+    claimable = (
+        select(RawData.id)
+        .where(or_(
+            RawData.status == "pending",
+            and_(RawData.status == "processing", RawData.claimed_at < stale),
+        ))
+        .order_by(RawData.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(RawData)
+        .where(RawData.id.in_(claimable.scalar_subquery()))
+        .values(status="processing", attempts=RawData.attempts + 1, claimed_at=func.now())
+        .returning(RawData)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(stmt)
+    return sorted(result.scalars().all(), key=lambda item: item.id)
+
+
+async def release_claims(db: AsyncSession, ids: list[int], count_attempt: bool = True):
+    """Devuelve a 'pending' datos crudos tomados que no se llegaron a procesar."""
+    if not ids:
+        return
+    values = {"status": "pending", "claimed_at": None}
+    if not count_attempt:
+        values["attempts"] = RawData.attempts - 1
+    await db.execute(
+        update(RawData)
+        .where(RawData.id.in_(ids), RawData.status == "processing")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def purge_processed(db: AsyncSession) -> int:
+    """Borra los datos crudos 'done' más viejos que INGESTION_RETENTION_HOURS."""
+    cutoff = func.now() - timedelta(hours=RETENTION_HOURS)
+    result = await db.execute(
+        delete(RawData)
+        .where(RawData.status == "done", RawData.processed_at < cutoff)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+async def queue_counts(db: AsyncSession) -> dict:
+    result = await db.execute(select(RawData.status, func.count()).group_by(RawData.status))
+    return dict(result.all())
@@ -0,0 +1,99 @@
+import hashlib
+import math
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+# Extensiones aceptadas por /ingestion/upload-sales
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+
+def is_supported(filename: str) -> bool:
+    return bool(filename) and filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def _json_safe(value):
+    """Convierte un valor de pandas/openpyxl a algo serializable en la columna JSON de raw_data."""
+    if value is None or value is pd.NaT:
+        return ""
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    if isinstance(value, (datetime, date)):
+        # Mismo formato que reconoce el procesador de ventas
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return "" if np.isnan(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return value
+
+
+def _dataframe_records(df: pd.DataFrame) -> list[dict]:
+    columns = [str(c) for c in df.columns]
+    return [
+        {column: _json_safe(value) for column, value in zip(columns, row)}
+        for row in df.itertuples(index=False, name=None)
+    ]
+
+
+def _csv_chunks(fileobj, chunk_rows: int):
+    for df in pd.read_csv(fileobj, chunksize=chunk_rows):
+        yield _dataframe_records(df)
+
+
+def _xlsx_chunks(fileobj, chunk_rows: int):
+    # read_only: openpyxl recorre las filas sin cargar la hoja completa en memoria
+    from openpyxl import load_workbook
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append({column: _json_safe(value) for column, value in zip(columns, row)})
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _xls_chunks(fileobj, chunk_rows: int):
+    # El formato .xls antiguo no se puede leer por filas: se carga y se parte en bloques
+    df = pd.read_excel(fileobj)
+    for start in range(0, len(df), chunk_rows):
+        yield _dataframe_records(df.iloc[start:start + chunk_rows])
+
+
+def iter_upload_chunks(fileobj, filename: str, chunk_rows: int):
+    """
+    Generador (síncrono) de bloques de hasta `chunk_rows` registros del archivo subido.
+    Solo un bloque vive en memoria a la vez; se consume desde un hilo aparte.
+    """
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return _csv_chunks(fileobj, chunk_rows)
+    if name.endswith(".xlsx"):
+        return _xlsx_chunks(fileobj, chunk_rows)
+    if name.endswith(".xls"):
+        return _xls_chunks(fileobj, chunk_rows)
+    raise ValueError(f"Formato no soportado: {filename}")
+
+
+def content_digest(fileobj) -> str:
+    """sha256 del contenido del archivo (identifica la subida); lo deja al inicio para leerlo."""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    while block := fileobj.read(1024 * 1024):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
@@ -3,15 +3,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import Optional, List
 from src.shared.database import get_db
-from src.modules.data_ingestion.models import RawData
-from src.modules.intelligence.processor import ContentProcessor
-import pandas as pd
-import io
+from src.modules.data_ingestion.models import RawData, IngestionJob
+from src.modules.data_ingestion.jobs import get_job, job_to_dict, seal_job, fail_job
+from src.modules.data_ingestion.readers import is_supported, iter_upload_chunks, content_digest
+from src.modules.data_ingestion.worker import get_ingestion_worker
+from src.modules.data_ingestion.queue import queue_counts
+import asyncio
+import hashlib
+import json
+import os
+import uuid
 from src.modules.auth.dependencies import get_current_user, RequireRole
 from src.modules.intelligence.models import User
+from src.shared.versioning import CATALOG, bump_version
+from src.modules.reports.rollup import apply_sales, sale_values
 
 router = APIRouter(prefix="/ingestion", tags= ["Ingestion"], dependencies=[Depends(get_current_user)])
-processor = ContentProcessor()
+
+# Filas por bloque al leer archivos subidos (cada bloque es un RawData)
+CHUNK_ROWS = int(os.getenv("INGESTION_CHUNK_ROWS", "2000"))
 
 from sqlalchemy import text
 @router.get("/fix-db")
@@ -41,22 +51,35 @@ class ManualSaleRequest(BaseModel):
     seller_name: str
     category: str = "Hardware"
 
-@router.post("/")
+async def enqueue(db: AsyncSession, source: str, payload, total_rows: int, filename: str | None = None,
+                  upload_key: str | None = None) -> IngestionJob:
+    """
+    Guarda el dato crudo asociado a un job nuevo y avisa al worker de ingesta.
+    El procesamiento (ventas, productos, embeddings) ocurre en segundo plano.
+    upload_key identifica la subida en las huellas de ventas (por defecto, hash del payload:
+    reenviar el mismo payload no duplica ventas).
+    """
+    if upload_key is None:
+        upload_key = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    job = IngestionJob(source=source, filename=filename, status="queued", total_rows=total_rows)
+    db.add(job)
+    await db.flush()
+    db.add(RawData(source=source, payload=payload, job_id=job.id, upload_key=upload_key, row_offset=0))
+    await db.commit()
+    get_ingestion_worker().notify()
+    return job
+
+@router.post("/", status_code=202)
 async def ingest_data(request: IngestionRequest, db: AsyncSession = Depends(get_db)):
-    """ Endpoint genérico modificado para procesar síncronamente """
+    """ Endpoint genérico: encola los datos y responde de inmediato con el id del job """
     try:
         final_payload = request.payload
         if isinstance(final_payload, dict):
             final_payload['access_level'] = request.access_level
         
-        new_data = RawData(source=request.source, payload=final_payload)
-        db.add(new_data)
-        await db.commit()
-        await db.refresh(new_data)
-        
-        # Procesar inmediatamente
-        processed = await processor.process_batch(db, limit=10)
-        return {"status": "success", "id": new_data.id, "processed_items": processed, "message": "Datos guardados y procesados"}
+        total_rows = len(final_payload) if isinstance(final_payload, list) else 1
+        job = await enqueue(db, request.source, final_payload, total_rows)
+        return {"status": "queued", "job_id": job.id, "message": "Datos recibidos, procesando en segundo plano"}
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -107,7 +130,8 @@ async def update_sale(sale_id: int, request: EditSaleRequest, db: AsyncSession =
     sale = result.scalar_one_or_none()
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
-        
+
+    previous = sale_values(sale)
     sale.customer_name = request.customer_name
     sale.quantity = request.quantity
     sale.price_total = request.price_total
@@ -120,9 +144,11 @@ async def update_sale(sale_id: int, request: EditSaleRequest, db: AsyncSession =
     except:
         pass
         
-    if sale.product:
+    if sale.product and sale.product.name != request.product_name:
         sale.product.name = request.product_name
-        
+        await bump_version(db, CATALOG)
+
+    await apply_sales(db, added=[sale_values(sale)], removed=[previous])
     await db.commit()
     return {"status": "success", "message": "Venta actualizada"}
 
@@ -133,62 +159,79 @@ async def delete_sale(sale_id: int, db: AsyncSession = Depends(get_db)):
     if not sale:
         raise HTTPException(status_code=404, detail="Venta no encontrada")
         
+    await apply_sales(db, removed=[sale_values(sale)])
     await db.delete(sale)
     await db.commit()
     return {"status": "success", "message": "Venta eliminada"}
 
-@router.post("/manual-sale")
+@router.post("/manual-sale", status_code=202)
 async def manual_sale(sale: ManualSaleRequest, db: AsyncSession = Depends(get_db)):
     """ Ingreso de una venta manual individual """
     try:
         payload = sale.model_dump()
         payload['source'] = 'manual_entry'
         
-        new_data = RawData(source="manual_entry", payload=payload)
-        db.add(new_data)
-        await db.commit()
-        
-        # Procesar lote (limite alto para destrancar cola si hay retrasos)
-        processed = await processor.process_batch(db, limit=50)
-        return {"status": "success", "message": "Venta procesada exitosamente."}
+        # Cada venta manual es una venta nueva, aunque coincida con otra en todos sus campos
+        job = await enqueue(db, "manual_entry", payload, total_rows=1, upload_key=uuid.uuid4().hex)
+        return {"status": "queued", "job_id": job.id, "message": "Venta recibida, procesando en segundo plano."}
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error guardando venta: {str(e)}")
 
-@router.post("/upload-sales")
+@router.post("/upload-sales", status_code=202)
 async def upload_sales(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
-    """ Subida masiva de ventas mediante Excel o CSV """
+    """
+    Subida masiva de ventas mediante Excel o CSV.
+
+    El archivo se lee por bloques de INGESTION_CHUNK_ROWS filas (read_csv con chunksize,
+    openpyxl en modo read_only) y cada bloque se guarda como un RawData propio: el worker
+    empieza a procesar mientras se sigue leyendo y la memoria no depende del tamaño del archivo.
+    """
+    if not is_supported(file.filename):
+        raise HTTPException(status_code=400, detail="Formato no soportado. Usa CSV o Excel.")
+
+    # El job queda en 'receiving' hasta guardar el último bloque
+    job = IngestionJob(source="excel_upload", filename=file.filename, status="receiving", total_rows=0)
+    db.add(job)
+    await db.commit()
+
+    worker = get_ingestion_worker()
+    total_rows = 0
     try:
-        content = await file.read()
-        
-        # Detectar el formato
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(content))
-        elif file.filename.endswith('.xlsx') or file.filename.endswith('.xls'):
-            df = pd.read_excel(io.BytesIO(content))
-        else:
-            raise HTTPException(status_code=400, detail="Formato no soportado. Usa CSV o Excel.")
-            
-        # Convertir dataframe a lista de diccionarios, rellenando nulos
-        df = df.fillna("")
-        records = df.to_dict(orient="records")
-        
-        # Para ser flexibles, en lugar de mapear agresivamente aquí, lo mandamos todo como RawData
-        # y que el procesador lo lea.
-        payload = {
-            "source": "excel_upload",
-            "filename": file.filename,
-            "records": records
-        }
-        
-        new_data = RawData(source="excel_upload", payload=records)
-        db.add(new_data)
+        # Hash del contenido: volver a subir el mismo archivo repite las huellas de sus filas
+        upload_key = await asyncio.to_thread(content_digest, file.file)
+        # Starlette ya guardó la subida en un archivo temporal: se lee desde ahí sin file.read()
+        chunks = iter_upload_chunks(file.file, file.filename, CHUNK_ROWS)
+        while True:
+            records = await asyncio.to_thread(next, chunks, None)
+            if records is None:
+                break
+            db.add(RawData(source="excel_upload", payload=records, job_id=job.id,
+                           upload_key=upload_key, row_offset=total_rows))
+            total_rows += len(records)
+            job.total_rows = total_rows
+            await db.commit()
+            worker.notify()
+
+        await seal_job(db, job.id)
         await db.commit()
-        
-        # Procesar todo al instante (se queda cargando la petición)
-        processed = await processor.process_batch(db, limit=50) # Procesar varios raudatas si se acumulan
-        
-        return {"status": "success", "message": f"Archivo procesado: {len(records)} filas leídas y vectorizadas."}
-        
+        return {"status": "queued", "job_id": job.id, "message": f"Archivo recibido: {total_rows} filas en cola de procesamiento."}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error procesando el archivo: {str(e)}")
\ No newline at end of file
+        await db.rollback()
+        # Los bloques ya guardados se procesan igual; el job queda marcado como fallido
+        await fail_job(db, job.id, f"Error leyendo el archivo: {e}")
+        await db.commit()
+        raise HTTPException(status_code=500, detail=f"Error procesando el archivo: {str(e)}")
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """ Estado de un job de ingesta: filas procesadas, errores y throughput """
+    job = await get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job_to_dict(job)
+
+@router.get("/worker", dependencies=[Depends(RequireRole(["admin"]))])
+async def ingestion_worker_status(db: AsyncSession = Depends(get_db)):
+    """ Métricas del worker de ingesta de este proceso y estado de la cola raw_data """
+    return {"worker": get_ingestion_worker().stats(), "queue": await queue_counts(db)}
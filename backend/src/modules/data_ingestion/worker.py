@@ -0,0 +1,148 @@
+import asyncio
+import os
+import time
+from src.shared.database import SessionLocal
+from src.modules.intelligence.processor import ContentProcessor
+from src.modules.intelligence.service import EmbeddingQueueFullError, loaded_embedding_services
+from src.modules.data_ingestion.queue import purge_processed
+
+
+class IngestionWorker:
+    """
+    Worker en segundo plano que vacía la tabla raw_data.
+
+    Los endpoints de ingesta solo guardan el dato crudo (asociado a un IngestionJob)
+    y llaman a notify(); el worker procesa batches hasta que no queda nada y luego
+    espera un aviso nuevo o INGESTION_POLL_INTERVAL segundos (así también levanta
+    datos insertados por otros procesos).
+
+    Las filas se toman con FOR UPDATE SKIP LOCKED (ver queue.py), así que se pueden
+    correr N workers en paralelo: INGESTION_WORKERS tareas por proceso, más los
+    procesos independientes que hagan falta.
+    """
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("INGESTION_BATCH_SIZE", "10"))
+        self.poll_interval = float(os.getenv("INGESTION_POLL_INTERVAL", "5"))
+        self.retry_delay = float(os.getenv("INGESTION_RETRY_DELAY", "1"))
+        self.concurrency = max(1, int(os.getenv("INGESTION_WORKERS", "1")))
+        self.purge_interval = float(os.getenv("INGESTION_PURGE_INTERVAL", "3600"))
+        self.processor = ContentProcessor()
+        self._wakeup = None
+        self._tasks = []
+        self._last_purge = 0.0
+
+        # Métricas
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.last_error = None
+        self.busy_seconds = 0.0
+
+    def start(self):
+        if not any(not task.done() for task in self._tasks):
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+            print(f"📥 Worker de ingesta iniciado ({self.concurrency} tareas)")
+
+    def notify(self):
+        """Despierta al worker si está esperando (no bloquea)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def wait(self):
+        await asyncio.gather(*self._tasks)
+
+    async def run_once(self) -> int:
+        """Procesa un batch de raw_data y devuelve cuántos datos crudos tomó (0 = cola vacía)."""
+        started = time.perf_counter()
+        async with SessionLocal() as db:
+            claimed, processed = await self.processor.process_next(db, limit=self.batch_size)
+        self.busy_seconds += time.perf_counter() - started
+        if claimed:
+            self.batches += 1
+            self.rows += processed
+        return claimed
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while await self.run_once():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except EmbeddingQueueFullError:
+                # Cola de inferencia llena (el chat tiene prioridad): reintentar en breve
+                await asyncio.sleep(self.retry_delay)
+                continue
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"❌ Error en worker de ingesta: {e}")
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            await self._maybe_purge()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _maybe_purge(self):
+        """Purga periódica de datos crudos ya procesados (en tiempo ocioso)."""
+        if time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            async with SessionLocal() as db:
+                purged = await purge_processed(db)
+                await db.commit()
+            if purged:
+                print(f"🧹 Datos crudos purgados: {purged}")
+        except Exception as e:
+            print(f"❌ Error purgando datos crudos: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": sum(1 for task in self._tasks if not task.done()),
+            "batch_size": self.batch_size,
+            "poll_interval": self.poll_interval,
+            "batches": self.batches,
+            "rows": self.rows,
+            "rows_per_second": (self.rows / self.busy_seconds) if self.busy_seconds else 0,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+# Instancia compartida por proceso (worker de uvicorn)
+_ingestion_worker: IngestionWorker | None = None
+
+
+def get_ingestion_worker() -> IngestionWorker:
+    global _ingestion_worker
+    if _ingestion_worker is None:
+        _ingestion_worker = IngestionWorker()
+    return _ingestion_worker
+
+
+async def _main():
+    # Modo proceso independiente: python -m src.modules.data_ingestion.worker
+    worker = get_ingestion_worker()
+    worker.start()
+    try:
+        await worker.wait()
+    finally:
+        for service in loaded_embedding_services():
+            service.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
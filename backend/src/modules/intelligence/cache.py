@@ -0,0 +1,191 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# Sobrecarga aproximada por entrada (clave sha256 + nodo del OrderedDict)
+_ENTRY_OVERHEAD_BYTES = 160
+# Cada cuántas filas escritas en disco se vuelve a aplicar el límite de filas y antigüedad
+_PRUNE_EVERY_ROWS = 1000
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings indexada por (modelo, sha256(texto)).
+
+    - Nivel 1: LRU en memoria acotada por bytes.
+    - Nivel 2 (opcional): archivo SQLite persistente compartido entre reinicios y workers.
+
+    El archivo guarda vectores de varios modelos a la vez (espacio activo y sombra, o
+    backends distintos): cada uno solo lee los suyos. Se acota por antigüedad
+    (disk_max_age_seconds) y por cantidad de filas (disk_max_rows, se van las más viejas).
+    """
+
+    def __init__(self, model_key: str, max_bytes: int, path: str | None = None,
+                 disk_max_rows: int = 0, disk_max_age_seconds: float = 0):
+        self.model_key = model_key
+        self.max_bytes = max_bytes
+        self.path = path
+        # 0 = sin límite
+        self.disk_max_rows = disk_max_rows
+        self.disk_max_age_seconds = disk_max_age_seconds
+        self._rows_since_prune = 0
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        # Métricas
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    # --- Nivel en memoria ---
+
+    def get(self, key: str) -> np.ndarray | None:
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        if self.max_bytes <= 0:
+            return
+        # Copia propia: las filas que llegan suelen ser vistas de una matriz de lote
+        vector = np.array(vector, dtype=np.float32, copy=True)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= previous.nbytes + _ENTRY_OVERHEAD_BYTES
+        self._entries[key] = vector
+        self.current_bytes += vector.nbytes + _ENTRY_OVERHEAD_BYTES
+
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes + _ENTRY_OVERHEAD_BYTES
+            self.evictions += 1
+
+    # --- Nivel persistente (SQLite) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (model, text_hash))"
+            )
+            # Archivos creados antes de la columna created_at: sus filas cuentan desde ahora
+            columns = {row[1] for row in db.execute("PRAGMA table_info(embeddings)")}
+            if "created_at" not in columns:
+                db.execute("ALTER TABLE embeddings ADD COLUMN created_at REAL NOT NULL DEFAULT 0")
+                db.execute("UPDATE embeddings SET created_at = ?", (time.time(),))
+            db.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_created_at ON embeddings (created_at)")
+            db.commit()
+            self._db = db
+            self._prune(db)
+        return self._db
+
+    def _prune(self, db: sqlite3.Connection):
+        """Borra las filas vencidas y, si sobran, las más viejas (de cualquier modelo)."""
+        removed = 0
+        if self.disk_max_age_seconds > 0:
+            removed += db.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.disk_max_age_seconds,)
+            ).rowcount
+        if self.disk_max_rows > 0:
+            excess = db.execute("SELECT count(*) FROM embeddings").fetchone()[0] - self.disk_max_rows
+            if excess > 0:
+                removed += db.execute(
+                    "DELETE FROM embeddings WHERE rowid IN"
+                    " (SELECT rowid FROM embeddings ORDER BY created_at LIMIT ?)",
+                    (excess,),
+                ).rowcount
+        db.commit()
+        self.disk_evictions += removed
+        self._rows_since_prune = 0
+
+    def _disk_get_many(self, keys: list[str]) -> dict:
+        found = {}
+        with self._db_lock:
+            db = self._connect()
+            # SQLite limita la cantidad de parámetros por sentencia
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = db.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_key, *chunk),
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _disk_put_many(self, items: list[tuple[str, np.ndarray]]):
+        with self._db_lock:
+            db = self._connect()
+            now = time.time()
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(self.model_key, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items],
+            )
+            db.commit()
+            self._rows_since_prune += len(items)
+            if self._rows_since_prune >= _PRUNE_EVERY_ROWS:
+                self._prune(db)
+
+    # --- API usada por EmbeddingService ---
+
+    async def lookup(self, keys: list[str]) -> dict:
+        """Devuelve {clave: vector} para las claves en cache (memoria y luego disco)."""
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self.get(key)
+            if vector is not None:
+                found[key] = vector
+                self.hits += 1
+            else:
+                missing.append(key)
+
+        if missing and self.path:
+            from_disk = await asyncio.to_thread(self._disk_get_many, missing)
+            for key, vector in from_disk.items():
+                self.put(key, vector)
+                found[key] = vector
+            self.disk_hits += len(from_disk)
+
+        self.misses += len(set(missing) - found.keys())
+        return found
+
+    async def store(self, items: list[tuple[str, np.ndarray]]):
+        for key, vector in items:
+            self.put(key, vector)
+        if items and self.path:
+            await asyncio.to_thread(self._disk_put_many, items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_key,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "persistent_path": self.path,
+            "disk_max_rows": self.disk_max_rows,
+            "disk_max_age_seconds": self.disk_max_age_seconds,
+            "disk_evictions": self.disk_evictions,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": ((self.hits + self.disk_hits) / lookups) if lookups else 0,
+        }
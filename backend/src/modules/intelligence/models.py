@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, Date, DateTime, ForeignKey, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from datetime import datetime
 from pgvector.sqlalchemy import Vector
 from src.shared.database import Base
+from src.modules.intelligence.vector_index import table_indexes
 
 class User(Base):
     __tablename__ = "users"
@@ -15,12 +17,17 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    # Índice ANN (HNSW/IVFFlat) sobre embedding, ver vector_index.py
+    __table_args__ = table_indexes()
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     description = Column(Text)
-    # Vector de 384 dimensiones (Estándar all-MiniLM-L6-v2)
+    # Vector de 384 dimensiones (Estándar all-MiniLM-L6-v2). Tras un cambio de modelo
+    # (spaces.py) la columna real puede tener otra dimensión; esto solo aplica a create_all.
     embedding = Column(Vector(384))
+    # Modelo que generó el vector (EmbeddingService.model_key); NULL = anterior a este registro
+    embedding_model = Column(String, nullable=True)
     
     # Control de Acceso: 'public' (Clientes) vs 'private' (Admin)
     access_level = Column(String, default='private')
@@ -33,23 +40,94 @@ class Product(Base):
     # Fine-Tuning de IA
     agent_instruction = Column(Text, nullable=True)
 
+    # Huella del dato crudo de origen (solo productos genéricos de ingesta), ver normalization.py
+    fingerprint = Column(String(64), nullable=True, unique=True, index=True)
+
+class EmbeddingSpace(Base):
+    """
+    Espacio vectorial: modelo + columna de products que guarda sus vectores.
+    El activo vive en products.embedding; uno nuevo se llena en una columna sombra
+    y se activa renombrando columnas (ver spaces.py).
+    """
+    __tablename__ = "embedding_spaces"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model_name = Column(String)                      # nombre para SentenceTransformer
+    model_key = Column(String)                       # EmbeddingService.model_key
+    dim = Column(Integer)
+    column_name = Column(String)                     # 'embedding' si está activo
+    status = Column(String, default="backfilling")   # backfilling | indexing | ready | active | retired | failed
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    activated_at = Column(DateTime(timezone=True), nullable=True)
+
+class EmbeddingJob(Base):
+    """Re-embedding de productos por lotes con checkpoint (ver reembed.py)."""
+    __tablename__ = "embedding_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    target = Column(String)                          # missing | all | model
+    model = Column(String, nullable=True)            # con target='model': vectores de este modelo (NULL = sin registrar)
+    space_id = Column(Integer, ForeignKey("embedding_spaces.id"), nullable=True)  # columna sombra a llenar (NULL = activa)
+    status = Column(String, default="queued")        # queued | running | done | failed
+    batch_size = Column(Integer)
+    last_product_id = Column(Integer, default=0)     # checkpoint: último id ya confirmado
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    vectors_per_second = Column(Float, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 class Sale(Base):
     __tablename__ = "sales"
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)  # FK: borrar un producto no recorre sales
     quantity = Column(Integer)
     price_total = Column(Float)
-    sale_date = Column(DateTime, default=datetime.utcnow)
+    sale_date = Column(DateTime, default=datetime.utcnow, index=True)  # rangos y "últimas ventas"
     category = Column(String) # Software / Hardware
     region = Column(String)
     customer_type = Column(String) # Corporate / Individual
     customer_name = Column(String) # Nombre del cliente (para métricas netas)
     seller_name = Column(String) # Nombre del vendedor
     payment_method = Column(String, nullable=True) # Cash, Card, Transfer, etc.
+    # Huella de la fila de ingesta: reimportar el mismo archivo no duplica ventas
+    fingerprint = Column(String(64), nullable=True, unique=True, index=True)
+
+    # Historial por cliente/vendedor más reciente primero (chat, /auth/profile) sin ordenar en memoria.
+    # En tablas existentes los crea ensure_indexes (migrations.py) con CONCURRENTLY.
+    __table_args__ = (
+        Index("ix_sales_customer_name_sale_date", customer_name, sale_date.desc()),
+        Index("ix_sales_seller_name_sale_date", seller_name, sale_date.desc()),
+    )
 
     product = relationship("Product")
 
+class SalesDailyRollup(Base):
+    """
+    Ventas sumadas por día y dimensiones del dashboard (ver reports/rollup.py).
+    Las dimensiones NULL se guardan como '' para que la clave única las agrupe.
+    """
+    __tablename__ = "sales_daily_rollup"
+    __table_args__ = (
+        UniqueConstraint("day", "category", "seller_name", "customer_name", "region", name="uq_sales_daily_rollup_key"),
+        Index("ix_sales_daily_rollup_customer_day", "customer_name", "day"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    category = Column(String, nullable=False, default="")
+    seller_name = Column(String, nullable=False, default="")
+    customer_name = Column(String, nullable=False, default="")
+    region = Column(String, nullable=False, default="")
+    price_total = Column(Float, nullable=False, default=0.0)
+    quantity = Column(BigInteger, nullable=False, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+
 class Staff(Base):
     __tablename__ = "staff"
 
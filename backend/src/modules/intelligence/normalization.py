@@ -0,0 +1,245 @@
+from datetime import datetime
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+# Nombre canónico -> alias aceptados (JSON manual en inglés o Excel/CSV en español).
+# El primer alias presente en la fila gana, igual que las cadenas de payload.get anteriores.
+SALE_ALIASES = {
+    "product_name": ["product_name", "Producto"],
+    "sale_date": ["sale_date", "Fecha"],
+    "quantity": ["quantity", "Unidades"],
+    "price_total": ["price_total", "Coste Total"],
+    "customer_name": ["customer_name", "Nombre"],
+    "seller_name": ["seller_name", "Empleado"],
+    "payment_method": ["payment_method", "Metodo de Pago"],
+    "category": ["category", "Categoria", "Categoría"],
+    "region": ["region"],
+    "customer_type": ["customer_type"],
+    "access_level": ["access_level"],
+}
+
+# Valores por defecto cuando ningún alias viene en la fila
+SALE_DEFAULTS = {
+    "product_name": "Producto Desconocido",
+    "customer_name": "Cliente Genérico",
+    "seller_name": "Vendedor Sin Asignar",
+    "payment_method": None,
+    "category": "General",
+    "region": "Global",
+    "customer_type": "Individual",
+    "access_level": "private",
+}
+
+# Una fila es una venta si trae fecha o total (en cualquiera de sus alias)
+SALE_MARKERS = SALE_ALIASES["sale_date"] + SALE_ALIASES["price_total"]
+
+# Formatos de fecha reconocidos en columnas de texto
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y"]
+
+# Columnas de la tabla sales que produce normalize_sales
+SALE_COLUMNS = [
+    "quantity", "price_total", "sale_date", "category", "region",
+    "customer_type", "customer_name", "seller_name", "payment_method",
+    "fingerprint",
+]
+
+# Campos normalizados que identifican una venta (access_level no cambia la venta)
+FINGERPRINT_FIELDS = [
+    "product_name", "sale_date", "quantity", "price_total", "category", "region",
+    "customer_type", "customer_name", "seller_name", "payment_method",
+]
+
+
+def _integral_to_int(values: pd.Series) -> pd.Series:
+    """
+    Columna que pandas leyó como float por tener huecos (ej. códigos de producto 123 y
+    filas sin el alias) -> objetos, con los valores enteros de vuelta como int: así
+    str() da "123" y no "123.0".
+    """
+    if not pd.api.types.is_float_dtype(values):
+        return values
+    integral = values.notna() & (values % 1 == 0)
+    result = values.astype(object)
+    result[integral] = values[integral].astype(np.int64).astype(object)
+    return result
+
+
+def _coalesce(df: pd.DataFrame, aliases: list[str], text: bool = False) -> pd.Series | None:
+    """
+    Primer alias no nulo de cada fila. Los alias presentes se resuelven una vez por bloque.
+    Con text=True los alias numéricos no se convierten a float (ver _integral_to_int).
+    """
+    present = [alias for alias in aliases if alias in df.columns]
+    if not present:
+        return None
+    columns = [_integral_to_int(df[alias]) if text else df[alias] for alias in present]
+    result = columns[0]
+    for column in columns[1:]:
+        result = result.where(result.notna(), column)
+    return result
+
+
+def sale_mask(df: pd.DataFrame) -> np.ndarray:
+    markers = [column for column in SALE_MARKERS if column in df.columns]
+    if not markers:
+        return np.zeros(len(df), dtype=bool)
+    return df[markers].notna().any(axis=1).to_numpy()
+
+
+def _infer_formats(values: np.ndarray) -> list[str]:
+    """Ordena los formatos poniendo primero el que reconoce el primer valor de la columna."""
+    sample = values[0]
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+        except (TypeError, ValueError):
+            continue
+        return [fmt] + [f for f in DATE_FORMATS if f != fmt]
+    return DATE_FORMATS
+
+
+def _parse_text_dates(text: np.ndarray) -> np.ndarray:
+    """Aplica el formato inferido a toda la columna; solo lo que no calza pasa al siguiente."""
+    result = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[us]")
+    pending = np.arange(len(text))
+    for fmt in _infer_formats(text):
+        parsed = pd.to_datetime(text[pending], format=fmt, errors="coerce").to_numpy(dtype="datetime64[us]")
+        ok = ~np.isnat(parsed)
+        result[pending[ok]] = parsed[ok]
+        pending = pending[~ok]
+        if not len(pending):
+            break
+    return result
+
+
+def parse_dates(values: pd.Series | None, length: int) -> np.ndarray:
+    """
+    Fechas de venta como datetime64[us]:
+    - texto: el formato inferido se aplica a toda la columna y solo lo que no calza
+      pasa al siguiente formato
+    - números: timestamp en milisegundos (así los serializa pandas)
+    - lo que no se reconoce queda con la fecha actual (UTC)
+    """
+    result = np.full(length, np.datetime64("NaT"), dtype="datetime64[us]")
+    if values is not None:
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if values.dt.tz is not None:
+                values = values.dt.tz_convert(None)
+            result = values.to_numpy(dtype="datetime64[us]")
+        elif kind in ("integer", "floating", "mixed-integer-float"):
+            millis = pd.to_numeric(values, errors="coerce")
+            result = pd.to_datetime(millis, unit="ms", errors="coerce").to_numpy(dtype="datetime64[us]")
+        else:
+            # Texto (caso común: CSV/Excel/JSON) o columna mixta texto + números
+            objects = values.to_numpy(dtype=object)
+            is_text = np.fromiter((type(v) is str for v in objects), dtype=bool, count=len(objects))
+            if is_text.any():
+                result[is_text] = _parse_text_dates(objects[is_text])
+            if not is_text.all():
+                millis = pd.to_numeric(pd.Series(objects[~is_text]), errors="coerce")
+                result[~is_text] = pd.to_datetime(millis, unit="ms", errors="coerce").to_numpy(dtype="datetime64[us]")
+    missing = np.isnat(result)
+    if missing.any():
+        result[missing] = np.datetime64(datetime.utcnow(), "us")
+    return result
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def sale_fingerprints(columns: dict, source: str, upload_key: str | None = None, positions=None) -> np.ndarray:
+    """
+    Huella de cada venta.
+
+    Con upload_key (hash del contenido del archivo o id de la entrada, ver RawData):
+    sha256 de upload_key + posición de la fila en toda la subida. Las filas idénticas
+    legítimas de un archivo (aunque caigan en bloques distintos) tienen posiciones
+    distintas, y solo volver a subir el mismo archivo repite las huellas.
+
+    Sin upload_key (datos encolados antes de registrarlo): sha256 de origen + campos
+    normalizados + ordinal de la fila idéntica dentro del bloque.
+    """
+    if upload_key is not None:
+        return np.array([_digest(f"{upload_key}\x1f{position}") for position in positions], dtype=object)
+
+    values = [columns[field].tolist() for field in FINGERPRINT_FIELDS]
+    seen = {}
+    result = []
+    for row in zip(*values):
+        key = "\x1f".join(map(str, row))
+        ordinal = seen.get(key, 0)
+        seen[key] = ordinal + 1
+        result.append(_digest(f"{source}\x1f{key}\x1f{ordinal}"))
+    return np.array(result, dtype=object)
+
+
+def product_fingerprint(source: str, payload: dict) -> str:
+    """Huella de un producto genérico (RAG): origen + payload JSON con claves ordenadas."""
+    return _digest(f"{source}\x1f{json.dumps(payload, sort_keys=True, default=str)}")
+
+
+def normalize_sales(records: list[dict], source: str = "", upload_key: str | None = None, positions=None) -> pd.DataFrame:
+    """
+    Normaliza un bloque de ventas en forma columnar.
+
+    Devuelve un DataFrame con product_name, access_level y SALE_COLUMNS (incluida la
+    huella `fingerprint`, ver sale_fingerprints; `positions` es la posición de cada
+    registro en la subida), en el mismo orden que `records` (índice 0..n-1), listo
+    para convertirse en filas de insert.
+    """
+    df = pd.DataFrame.from_records(records)
+    n = len(records)
+    columns = {}
+
+    for column, default in SALE_DEFAULTS.items():
+        values = _coalesce(df, SALE_ALIASES[column], text=True)
+        if values is None:
+            columns[column] = np.full(n, default, dtype=object)
+        else:
+            values = values.to_numpy(dtype=object, copy=True)
+            values[pd.isna(values)] = default
+            columns[column] = values
+
+    # Columnas de texto siempre como texto (un Excel puede traer códigos numéricos de
+    # producto, cliente o vendedor); None (payment_method por defecto) se mantiene
+    for column in SALE_DEFAULTS:
+        values = columns[column]
+        if pd.api.types.infer_dtype(values, skipna=True) != "string":
+            columns[column] = np.array([value if value is None else str(value) for value in values], dtype=object)
+
+    quantity = _coalesce(df, SALE_ALIASES["quantity"])
+    if quantity is None:
+        columns["quantity"] = np.ones(n, dtype=np.int64)
+    else:
+        # int(): trunca decimales; lo que no es número queda en 1
+        quantity = pd.to_numeric(quantity, errors="coerce").to_numpy(dtype=np.float64, na_value=1.0)
+        columns["quantity"] = np.trunc(quantity).astype(np.int64)
+
+    price_total = _coalesce(df, SALE_ALIASES["price_total"])
+    if price_total is None:
+        columns["price_total"] = np.zeros(n, dtype=np.float64)
+    else:
+        columns["price_total"] = pd.to_numeric(price_total, errors="coerce").to_numpy(dtype=np.float64, na_value=0.0)
+
+    # datetime64[us] -> objetos datetime de Python (lo que espera asyncpg)
+    columns["sale_date"] = parse_dates(_coalesce(df, SALE_ALIASES["sale_date"]), n).astype(object)
+    columns["fingerprint"] = sale_fingerprints(columns, source, upload_key, positions)
+
+    # dtype=object explícito: pandas no debe reinterpretar textos/None ni fechas
+    return pd.DataFrame({
+        column: pd.Series(values, dtype=object) if values.dtype == object else values
+        for column, values in columns.items()
+    })
+
+
+def sale_rows(df: pd.DataFrame, product_ids) -> list[dict]:
+    """Filas para insert(sales) a partir del bloque normalizado y los ids de producto resueltos."""
+    keys = SALE_COLUMNS + ["product_id"]
+    # tolist() entrega tipos nativos de Python de una sola vez por columna
+    values = [df[column].to_numpy().tolist() for column in SALE_COLUMNS]
+    values.append(np.asarray(product_ids).tolist())
+    return [dict(zip(keys, row)) for row in zip(*values)]
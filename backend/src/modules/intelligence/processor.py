@@ -1,146 +1,373 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from src.modules.data_ingestion.models import RawData
 from src.modules.intelligence.models import Product, Sale
-from src.modules.intelligence.service import EmbeddingService
+from src.shared.database import SessionLocal
+from src.modules.intelligence.service import EmbeddingQueueFullError
+from src.modules.intelligence.spaces import active_embedding_service, locked_embedding_service
+from src.modules.data_ingestion.jobs import mark_running, record_progress, finish_jobs
+from src.modules.data_ingestion.queue import MAX_ATTEMPTS, claim_raw_data, release_claims
+from src.shared.versioning import CATALOG, bump_version
+from src.modules.reports.rollup import apply_sales
+from src.modules.intelligence.normalization import normalize_sales, product_fingerprint, sale_mask, sale_rows
 import json
-from datetime import datetime
+import numpy as np
+import pandas as pd
 
-class ContentProcessor:
-    def __init__(self):
-        self.embedding_service = EmbeddingService()
+# Clave del advisory lock que serializa la creación de productos por nombre
+PRODUCT_CREATE_LOCK = 728401
 
+class ContentProcessor:
     async def process_batch(self, db: AsyncSession, limit: int = 100):
-        # Buscar datos crudos (se traen todos, idealmente filtrados por "no procesados")
-        result = await db.execute(select(RawData).limit(limit))
-        raw_items = result.scalars().all()
+        _, processed = await self.process_next(db, limit)
+        return processed
+
+    async def process_next(self, db: AsyncSession, limit: int = 100) -> tuple[int, int]:
+        """Procesa un batch y devuelve (datos crudos tomados, filas procesadas)."""
+        # Tomar datos crudos pendientes con SKIP LOCKED: cada worker recibe filas distintas.
+        # El claim y el paso de los jobs a 'running' se confirman de inmediato.
+        raw_items = await claim_raw_data(db, limit)
+        if not raw_items:
+            await db.commit()
+            return 0, 0
+        job_ids = {item.job_id for item in raw_items if item.job_id is not None}
+        await mark_running(db, job_ids)
+        await db.commit()
 
+        claimed_ids = [item.id for item in raw_items]
+        try:
+            return len(raw_items), await self._process_claimed(db, raw_items, job_ids)
+        except BaseException as e:
+            # El batch no se guardó: liberar el claim para que otro intento lo tome ya
+            # (una cola de inferencia llena no cuenta como intento fallido del dato)
+            await db.rollback()
+            await release_claims(db, claimed_ids, count_attempt=not isinstance(e, EmbeddingQueueFullError))
+            await db.commit()
+            raise
+
+    async def _process_claimed(self, db: AsyncSession, raw_items: list, job_ids: set) -> int:
         processed_count = 0
-        
-        # Cache para evitar re-generar embeddings o buscar el mismo producto muchas veces en el mismo batch
-        product_cache = {}
+        # Avance por job: {job_id: {"rows", "new", "duplicates", "errors", "last_error"}}
+        job_stats = {
+            job_id: {"rows": 0, "new": 0, "duplicates": 0, "errors": 0, "last_error": None}
+            for job_id in job_ids
+        }
 
+        # 1. Normalizar en Python (sin tocar la BD): un dato mal formado solo descarta su item
+        parsed = []  # (item, ventas, productos, filas)
         for item in raw_items:
             payload_raw = item.payload
             
             # Convertir payload único en lista para procesar de forma uniforme
             payload_list = payload_raw if isinstance(payload_raw, list) else [payload_raw]
+            try:
+                if item.attempts > MAX_ATTEMPTS:
+                    # Claim vencido repetidas veces (ej. el worker muere con este dato)
+                    raise RuntimeError(f"Se superó el máximo de intentos ({MAX_ATTEMPTS})")
+                sales, products = self._parse_payloads(item, payload_list)
+            except Exception as e:
+                self._mark_failed(item, e, len(payload_list), job_stats)
+                continue
+            parsed.append((item, sales, products, len(payload_list)))
 
-            for payload_data in payload_list:
-                # 1. Detectar si es una venta o un producto genérico
-                is_sale = False
-                if isinstance(payload_data, dict):
-                    # Si tiene claves de venta, lo tratamos como tal
-                    if 'sale_date' in payload_data or 'price_total' in payload_data:
-                        is_sale = True
-
-                if is_sale:
-                    # --- PROCESAR VENTA ---
-                    product_name = payload_data.get('product_name', payload_data.get('Producto', 'Producto Desconocido'))
-                    
-                    # Buscar producto existente o crear uno base
-                    if product_name in product_cache:
-                        product_id = product_cache[product_name]
-                    else:
-                        # Buscar en DB
-                        p_result = await db.execute(select(Product).where(Product.name == product_name))
-                        prod = p_result.scalar_one_or_none()
-                        
-                        if not prod:
-                            # Crear producto base para esta venta
-                            payload_str = json.dumps(payload_data)
-                            vector = await self.embedding_service.generate(payload_str)
-                            prod = Product(
-                                name=product_name,
-                                description=f"Auto-creado desde venta: {product_name}",
-                                embedding=vector,
-                                access_level=payload_data.get('access_level', 'private')
-                            )
-                            db.add(prod)
-                            await db.flush() # Para obtener el ID
-                        
-                        product_id = prod.id
-                        product_cache[product_name] = product_id
-
-                    # Parsear fecha
-                    sale_date_val = payload_data.get('sale_date', payload_data.get('Fecha'))
+        # 2. Escribir todo el batch en bloque. Si falla, se repite item por item (cada uno en
+        # su savepoint) para descartar solo el dato culpable y guardar el resto.
+        created = 0
+        written = []
+        counts = {}  # {raw_data.id: [filas nuevas, filas duplicadas]}
+        if parsed:
+            vectors, model_key = await self._embed_new_products(parsed)
+            # Altas de productos en su propia transacción corta, antes de que esta toque products
+            await self._create_products(parsed, vectors, model_key)
+            # Antes del primer acceso a products de esta transacción: fija el espacio activo
+            # hasta el commit (ver locked_embedding_service). Si activate() cambió el modelo
+            # mientras se codificaba (raro), se recodifica con el nuevo.
+            active = await locked_embedding_service(db, write=True)
+            if vectors and active.model_key != model_key:
+                vectors, model_key = await self._embed_new_products(parsed)
+            try:
+                async with db.begin_nested():
+                    created, counts = await self._write_rows(db, parsed, vectors, model_key)
+                written = parsed
+            except Exception as e:
+                print(f"⚠️ Falló la inserción en bloque ({e}), reintentando item por item...")
+                for entry in parsed:
                     try:
-                        if isinstance(sale_date_val, str):
-                            # Try multiple formats
-                            try:
-                                sale_date = datetime.strptime(sale_date_val, "%Y-%m-%d %H:%M:%S")
-                            except:
-                                try:
-                                    sale_date = datetime.strptime(sale_date_val, "%Y-%m-%d")
-                                except:
-                                    try:
-                                        sale_date = datetime.strptime(sale_date_val, "%d/%m/%Y")
-                                    except:
-                                        sale_date = datetime.utcnow()
-                        elif isinstance(sale_date_val, (int, float)):
-                            # Pandas might pass timestamp in ms
-                            sale_date = datetime.fromtimestamp(sale_date_val / 1000)
-                        else:
-                            sale_date = datetime.utcnow()
-                    except:
-                        sale_date = datetime.utcnow()
-
-                    # Mapear columnas dinamicamente (Soporta JSON manual o Excel)
-                    qty = payload_data.get('quantity', payload_data.get('Unidades', 1))
-                    ptotal = payload_data.get('price_total', payload_data.get('Coste Total', 0))
-                    cname = payload_data.get('customer_name', payload_data.get('Nombre', 'Cliente Genérico'))
-                    sname = payload_data.get('seller_name', payload_data.get('Empleado', 'Vendedor Sin Asignar'))
-                    pmethod = payload_data.get('payment_method', payload_data.get('Metodo de Pago'))
-                    # Extraer categoria si exite (Software vs Hardware)
-                    cat = payload_data.get('category', payload_data.get('Categoria', payload_data.get('Categoría', 'General')))
-                    
-                    # Convertir a numerico por consistencia
-                    try: qty = int(qty)
-                    except: qty = 1
-                    try: ptotal = float(ptotal)
-                    except: ptotal = 0.0
-
-                    # Crear registro de venta
-                    new_sale = Sale(
-                        product_id=product_id,
-                        quantity=qty,
-                        price_total=ptotal,
-                        sale_date=sale_date,
-                        category=cat,
-                        region=payload_data.get('region', 'Global'),
-                        customer_type=payload_data.get('customer_type', 'Individual'),
-                        customer_name=cname,
-                        seller_name=sname,
-                        payment_method=pmethod
-                    )
-                    db.add(new_sale)
-
-                else:
-                    # --- PROCESAR PRODUCTO GENERICO (RAG) ---
-                    payload_str = json.dumps(payload_data)
-                    vector = await self.embedding_service.generate(payload_str)
-
-                    if not vector:
-                        continue
-
-                    product_name = f"Dato Crudo {item.id}"
-                    if isinstance(payload_data, dict):
-                        for key in ['name', 'product_name', 'nombre', 'title']:
-                            if key in payload_data:
-                                product_name = payload_data[key]
-                                break
-
-                    new_product = Product(
-                        name=product_name, 
-                        description=payload_str, 
-                        embedding=vector,
-                        access_level=payload_data.get('access_level', 'private')
-                    )
-                    db.add(new_product)
-
-            # Borrar dato crudo una vez procesado
-            await db.delete(item)
-            processed_count += len(payload_list)
+                        async with db.begin_nested():
+                            item_created, item_counts = await self._write_rows(db, [entry], vectors, model_key)
+                    except Exception as item_error:
+                        self._mark_failed(entry[0], item_error, entry[3], job_stats)
+                    else:
+                        created += item_created
+                        counts.update(item_counts)
+                        written.append(entry)
+
+        for item, _, _, rows in written:
+            processed_count += rows
+            item.status = "done"
+            item.last_error = None
+            item.processed_at = func.now()
+            if item.job_id in job_stats:
+                new_rows, duplicate_rows = counts.get(item.id, (0, 0))
+                job_stats[item.job_id]["rows"] += rows
+                job_stats[item.job_id]["new"] += new_rows
+                job_stats[item.job_id]["duplicates"] += duplicate_rows
 
+        if created:
+            # Cambió el catálogo: invalida caches que dependen de los productos
+            await bump_version(db, CATALOG)
+
+        await record_progress(db, job_stats)
+        await db.flush()  # el nuevo estado de raw_data debe verse al cerrar los jobs
+        await finish_jobs(db, job_ids)
         await db.commit()
-        return processed_count
\ No newline at end of file
+        return processed_count
+
+    @staticmethod
+    def _mark_failed(item: RawData, error: Exception, rows: int, job_stats: dict):
+        print(f"❌ Error procesando dato crudo {item.id} (intento {item.attempts}): {error}")
+        item.last_error = str(error)[:1000]
+        item.claimed_at = None
+        if item.attempts < MAX_ATTEMPTS:
+            # Se reintenta en un batch posterior
+            item.status = "pending"
+            return
+        item.status = "failed"
+        if item.job_id in job_stats:
+            job_stats[item.job_id]["errors"] += rows
+            job_stats[item.job_id]["last_error"] = f"raw_data {item.id}: {error}"[:1000]
+
+    @staticmethod
+    async def _find_products(db: AsyncSession, names) -> dict:
+        """{nombre: id} de los productos existentes (un solo SELECT ... WHERE name IN)."""
+        if not names:
+            return {}
+        # products.name no es único: si hay duplicados se usa el más antiguo
+        result = await db.execute(
+            select(Product.name, func.min(Product.id)).where(Product.name.in_(list(names))).group_by(Product.name)
+        )
+        return dict(result.all())
+
+    @staticmethod
+    async def _existing_fingerprints(db: AsyncSession, column, fingerprints) -> set:
+        if not fingerprints:
+            return set()
+        result = await db.execute(select(column).where(column.in_(list(fingerprints))))
+        return set(result.scalars().all())
+
+    @staticmethod
+    def _sale_products(parsed: list) -> dict:
+        """
+        {nombre: (access_level, payload)} con la primera venta de cada producto mencionado
+        en el batch (para auto-crearlo).
+        """
+        names = {}
+        for _, sales, _, _ in parsed:
+            if sales is None:
+                continue
+            first = sales["frame"].drop_duplicates("product_name")
+            for index, name, access_level in zip(first.index, first["product_name"], first["access_level"]):
+                names.setdefault(name, (access_level, sales["payloads"][index]))
+        return names
+
+    async def _embed_new_products(self, parsed: list) -> tuple[dict, str]:
+        """
+        Calcula en una sola pasada los vectores de los productos que se van a crear,
+        antes de abrir la sección crítica de escritura, con el modelo del espacio activo
+        (sin lock: _process_claimed lo confirma antes de escribir). Devuelve ({texto: vector}, model_key).
+
+        Las búsquedas van en una sesión propia que se cierra antes de la inferencia: una
+        transacción abierta sobre products haría esperar al renombrado de activate().
+        """
+        sale_products = self._sale_products(parsed)
+        generic = [product for _, _, products, _ in parsed for product in products]
+        async with SessionLocal() as db:
+            service = await active_embedding_service(db)
+            existing = await self._find_products(db, sale_products)
+            # Los productos genéricos ya cargados (misma huella) no pasan por el modelo
+            known = await self._existing_fingerprints(db, Product.fingerprint, {p["fingerprint"] for p in generic})
+        texts = [json.dumps(payload) for name, (_, payload) in sale_products.items() if name not in existing]
+        texts += [product["text"] for product in generic if product["fingerprint"] not in known]
+        if not texts:
+            return {}, service.model_key
+        try:
+            vectors = await service.generate_many(texts)
+        except EmbeddingQueueFullError:
+            raise
+        except Exception as e:
+            # Se guardan sin vector; fix_embeddings.py (target 'missing') los completa después
+            print(f"Error generando embeddings del batch: {e}")
+            return {}, service.model_key
+        return dict(zip(texts, vectors)), service.model_key
+
+    async def _create_products(self, parsed: list, vectors: dict, model_key: str) -> int:
+        """
+        Da de alta los productos que mencionan las ventas y todavía no existen, en una
+        transacción propia que se confirma antes de escribir el batch: el advisory lock
+        que serializa las altas se suelta tras el INSERT y no cubre el executemany de
+        ventas ni el resumen diario. Devuelve la cantidad de productos creados.
+        """
+        sale_products = self._sale_products(parsed)
+        if not sale_products:
+            return 0
+        async with SessionLocal() as db:
+            # Lock sobre products antes de leerla (ver locked_embedding_service). Si activate()
+            # cambió el modelo mientras se codificaba, se crean sin vector (fix_embeddings.py)
+            active = await locked_embedding_service(db, write=True)
+            if active.model_key != model_key:
+                vectors = {}
+            existing = await self._find_products(db, sale_products)
+            if all(name in existing for name in sale_products):
+                return 0
+            # Sin índice único en products.name no sirve ON CONFLICT: un advisory lock serializa
+            # las altas por nombre entre workers y se vuelve a buscar bajo el lock
+            await db.execute(select(func.pg_advisory_xact_lock(PRODUCT_CREATE_LOCK)))
+            existing = await self._find_products(db, sale_products)
+            new_products = []
+            for name, (access_level, payload) in sale_products.items():
+                if name in existing:
+                    continue
+                vector = vectors.get(json.dumps(payload))
+                new_products.append({
+                    "name": name,
+                    "description": f"Auto-creado desde venta: {name}",
+                    "access_level": access_level,
+                    "embedding": vector,
+                    "embedding_model": active.model_key if vector is not None else None,
+                })
+            try:
+                # INSERT multi-fila. Sin sort_by_parameter_order/RETURNING: ese modo castea cada
+                # valor al tipo declarado (VECTOR(384)) y falla si el espacio activo tiene otra
+                # dimensión (ver spaces.py).
+                async with db.begin_nested():
+                    await db.execute(insert(Product), new_products)
+                created = len(new_products)
+            except Exception as e:
+                # Se repite producto por producto: el que falla deja sin producto solo a sus
+                # ventas, y _write_rows descarta esos items
+                print(f"⚠️ Falló el alta de productos en bloque ({e}), reintentando uno por uno...")
+                created = 0
+                for product in new_products:
+                    try:
+                        async with db.begin_nested():
+                            await db.execute(insert(Product), [product])
+                    except Exception as product_error:
+                        print(f"❌ No se pudo crear el producto '{product['name']}': {product_error}")
+                    else:
+                        created += 1
+            if created:
+                # Cambió el catálogo: invalida caches que dependen de los productos
+                await bump_version(db, CATALOG)
+            await db.commit()
+        return created
+
+    async def _write_rows(self, db: AsyncSession, parsed: list, vectors: dict, model_key: str) -> tuple[int, dict]:
+        """
+        Inserta productos genéricos y ventas de los items dados en bloque (los productos
+        de las ventas ya los creó _create_products).
+        Devuelve (productos creados, {raw_data.id: [filas nuevas, filas duplicadas]}).
+        """
+        sale_products = self._sale_products(parsed)
+        product_ids = await self._find_products(db, sale_products)
+        missing = [name for name in sale_products if name not in product_ids]
+        if missing:
+            # Su alta falló: el batch se repite item por item y solo caen los items que los usan
+            raise ValueError(f"Productos no creados: {', '.join(missing[:5])}")
+
+        generic = []
+        for item, _, products, _ in parsed:
+            for product in products:
+                vector = vectors.get(product["text"])
+                generic.append((item.id, {
+                    "name": product["name"],
+                    "description": product["text"],
+                    "access_level": product["access_level"],
+                    "embedding": vector,
+                    "embedding_model": model_key if vector is not None else None,
+                    "fingerprint": product["fingerprint"],
+                }))
+
+        sales = []
+        for item, sale_block, _, _ in parsed:
+            if sale_block is not None:
+                frame = sale_block["frame"]
+                sales.extend((item.id, row) for row in sale_rows(frame, frame["product_name"].map(product_ids)))
+
+        counts = {item.id: [0, 0] for item, _, _, _ in parsed}
+        inserted_products = await self._insert_new(db, Product.__table__, generic, counts)
+        # Ventas en un executemany de Core (insertmanyvalues agrupa miles de filas por sentencia)
+        inserted_sales = await self._insert_new(db, Sale.__table__, sales, counts)
+        # Solo las ventas que entraron (no las duplicadas) suman al resumen diario
+        await apply_sales(db, added=inserted_sales)
+        return len(inserted_products), counts
+
+    @staticmethod
+    async def _insert_new(db: AsyncSession, table, owned_rows: list, counts: dict) -> list[dict]:
+        """
+        Inserta filas con huella usando ON CONFLICT (fingerprint) DO NOTHING; RETURNING
+        dice cuáles entraron. owned_rows = [(raw_data.id, fila)]. Suma a counts las
+        nuevas y duplicadas de cada item y devuelve las filas insertadas.
+        """
+        rows, owners, seen = [], [], set()
+        for owner, row in owned_rows:
+            if row["fingerprint"] in seen:
+                # Repetida dentro del mismo batch (ej. el mismo archivo encolado dos veces)
+                counts[owner][1] += 1
+                continue
+            seen.add(row["fingerprint"])
+            rows.append(row)
+            owners.append(owner)
+        if not rows:
+            return []
+
+        result = await db.execute(
+            pg_insert(table).on_conflict_do_nothing(index_elements=["fingerprint"]).returning(table.c.fingerprint),
+            rows,
+        )
+        inserted = set(result.scalars().all())
+        for owner, row in zip(owners, rows):
+            counts[owner][0 if row["fingerprint"] in inserted else 1] += 1
+        return [row for row in rows if row["fingerprint"] in inserted]
+
+    def _parse_payloads(self, item: RawData, payload_list: list) -> tuple[dict | None, list]:
+        """
+        Separa los payloads de un dato crudo en un bloque de ventas normalizado (columnar,
+        ver normalization.py) y una lista de productos genéricos.
+        """
+        for payload_data in payload_list:
+            if not isinstance(payload_data, dict):
+                raise ValueError(f"Payload inválido (se esperaba un objeto JSON): {str(payload_data)[:100]}")
+
+        # 1. Detectar ventas en bloque: filas con fecha o total en cualquiera de sus alias
+        is_sale = sale_mask(pd.DataFrame.from_records(payload_list)) if payload_list else []
+
+        # --- PROCESAR VENTAS ---
+        sale_payloads = [payload for payload, flag in zip(payload_list, is_sale) if flag]
+        sales = None
+        if sale_payloads:
+            # Posición de cada venta en toda la subida (el bloque empieza en row_offset)
+            positions = np.flatnonzero(is_sale) + (item.row_offset or 0)
+            frame = normalize_sales(sale_payloads, item.source or "", item.upload_key, positions)
+            sales = {"frame": frame, "payloads": sale_payloads}
+
+        # --- PROCESAR PRODUCTOS GENERICOS (RAG) ---
+        products = []
+        for payload_data, flag in zip(payload_list, is_sale):
+            if flag:
+                continue
+            payload_str = json.dumps(payload_data)
+
+            product_name = f"Dato Crudo {item.id}"
+            for key in ['name', 'product_name', 'nombre', 'title']:
+                if key in payload_data:
+                    product_name = payload_data[key]
+                    break
+
+            products.append({
+                "name": product_name,
+                "text": payload_str,
+                "access_level": payload_data.get('access_level', 'private'),
+                "fingerprint": product_fingerprint(item.source or "", payload_data),
+            })
+        return sales, products
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import time
+from sqlalchemy import select, update, func, true, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.shared.database import SessionLocal
+from src.modules.intelligence.models import EmbeddingJob, EmbeddingSpace, Product
+from src.modules.intelligence.service import EmbeddingService, EmbeddingQueueFullError, get_embedding_service, model_keys
+from src.modules.intelligence.spaces import active_embedding_service, locked_embedding_service, shadow_update
+from src.shared.versioning import CATALOG, bump_version
+
+# Productos leídos, codificados y confirmados por vuelta (cada vuelta es un checkpoint)
+BATCH_SIZE = int(os.getenv("REEMBED_BATCH_SIZE", "512"))
+# Espera antes de reintentar si la cola de inferencia está llena (la comparte con el chat)
+RETRY_DELAY = float(os.getenv("REEMBED_RETRY_DELAY", "1"))
+
+TARGETS = ("missing", "all", "model")
+
+# Columnas que forman el texto del vector (lo mismo que /products/{id}/recalculate)
+TEXT_COLUMNS = (Product.id, Product.name, Product.description, Product.price, Product.stock)
+
+
+def product_text(name, description, price, stock) -> str:
+    return json.dumps({"name": name, "description": description, "price": price, "stock": stock})
+
+
+def _target_filter(job: EmbeddingJob, space: EmbeddingSpace | None = None):
+    if space is not None:
+        # Backfill de una columna sombra (spaces.py): solo lo que falta en ella
+        return text(f"{space.column_name} IS NULL")
+    if job.target == "missing":
+        return Product.embedding.is_(None)
+    if job.target == "model":
+        if job.model is None:
+            # Vectores generados antes de registrar el modelo
+            return Product.embedding.is_not(None) & Product.embedding_model.is_(None)
+        return Product.embedding_model.in_(model_keys(job.model))
+    return true()
+
+
+async def create_job(db: AsyncSession, target: str, model: str | None = None, batch_size: int | None = None,
+                     space_id: int | None = None) -> EmbeddingJob:
+    if target not in TARGETS:
+        raise ValueError(f"target inválido: {target} (usa {', '.join(TARGETS)})")
+    job = EmbeddingJob(target=target, model=model if target == "model" else None, space_id=space_id,
+                       status="queued", batch_size=batch_size or BATCH_SIZE, last_product_id=0)
+    db.add(job)
+    await db.flush()
+    space = await db.get(EmbeddingSpace, space_id) if space_id else None
+    job.total = await db.scalar(select(func.count()).select_from(Product).where(_target_filter(job, space)))
+    await db.commit()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: int) -> EmbeddingJob | None:
+    result = await db.execute(select(EmbeddingJob).where(EmbeddingJob.id == job_id))
+    return result.scalar_one_or_none()
+
+
+async def _encode(service: EmbeddingService, texts: list[str]):
+    while True:
+        try:
+            return await service.generate_many(texts)
+        except EmbeddingQueueFullError:
+            await asyncio.sleep(RETRY_DELAY)
+
+
+async def run_job(job_id: int, service: EmbeddingService | None = None, on_progress=None) -> dict:
+    """
+    Recorre products por id (keyset: id > checkpoint ORDER BY id LIMIT batch_size),
+    codifica cada lote con generate_many y confirma vectores + checkpoint en la misma
+    transacción. Si el proceso muere, volver a correr el job retoma desde el último
+    lote confirmado.
+
+    Sin space_id escribe products.embedding con el modelo activo y se detiene (failed)
+    si otro espacio se activa durante el job; con space_id llena la columna sombra de
+    ese espacio con su modelo.
+    """
+    async with SessionLocal() as db:
+        job = await get_job(db, job_id)
+        if job is None:
+            raise ValueError(f"No existe el job de re-embedding {job_id}")
+        if job.status == "done":
+            return job_to_dict(job)
+        space = await db.get(EmbeddingSpace, job.space_id) if job.space_id else None
+        if space is not None:
+            service = get_embedding_service(space.model_name)
+            write = shadow_update(space.column_name)
+        else:
+            service = service or await active_embedding_service(db)
+        condition = _target_filter(job, space)
+        # Al retomar (--resume) el total se recalcula con lo que queda después del checkpoint:
+        # el catálogo pudo cambiar desde que se creó el job
+        remaining = await db.scalar(
+            select(func.count()).select_from(Product).where(Product.id > job.last_product_id, condition)
+        )
+        job.total = (job.processed or 0) + remaining
+        job.status = "running"
+        job.last_error = None
+        job.started_at = func.now()
+        job.finished_at = None
+        await db.commit()
+        await db.refresh(job)
+
+        started = time.perf_counter()
+        run_processed = 0
+        try:
+            while True:
+                result = await db.execute(
+                    select(*TEXT_COLUMNS)
+                    .where(Product.id > job.last_product_id, condition)
+                    .order_by(Product.id)
+                    .limit(job.batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+
+                # La conexión no queda tomada mientras el modelo trabaja
+                await db.commit()
+                vectors = await _encode(service, [product_text(*row[1:]) for row in rows])
+
+                # UPDATE por clave primaria en bloque (executemany)
+                if space is None:
+                    # Fija el espacio activo hasta el commit del lote: si activate() lo cambió,
+                    # estos vectores ya no corresponden a products.embedding
+                    active = await locked_embedding_service(db, write=True)
+                    if active.model_key != service.model_key:
+                        raise RuntimeError(
+                            f"El modelo activo cambió ({service.model_key} -> {active.model_key}); job detenido"
+                        )
+                    await db.execute(update(Product), [
+                        {"id": row.id, "embedding": vector, "embedding_model": service.model_key}
+                        for row, vector in zip(rows, vectors)
+                    ])
+                else:
+                    await db.execute(write, [
+                        {"id": row.id, "vector": vector, "model": service.model_key}
+                        for row, vector in zip(rows, vectors)
+                    ])
+                run_processed += len(rows)
+                job.last_product_id = rows[-1].id
+                job.processed = job.processed + len(rows)
+                job.vectors_per_second = round(run_processed / (time.perf_counter() - started), 1)
+                job.updated_at = func.now()
+                await db.commit()
+                await db.refresh(job)
+                if on_progress is not None:
+                    on_progress(job_to_dict(job))
+
+            job.status = "done"
+            job.finished_at = func.now()
+            if space is None and run_processed:
+                # Una sola vez por job: invalidar caches (chat, reportes) en cada lote no aporta nada
+                await bump_version(db, CATALOG)
+            await db.commit()
+        except BaseException as e:
+            await db.rollback()
+            await db.execute(
+                update(EmbeddingJob)
+                .where(EmbeddingJob.id == job_id)
+                .values(status="failed", last_error=str(e)[:1000] or type(e).__name__, finished_at=func.now())
+            )
+            if space is None and run_processed:
+                # Los lotes ya confirmados cambiaron products.embedding
+                await bump_version(db, CATALOG)
+            await db.commit()
+            raise
+        await db.refresh(job)
+        return job_to_dict(job)
+
+
+def job_to_dict(job: EmbeddingJob) -> dict:
+    return {
+        "id": job.id,
+        "target": job.target,
+        "model": job.model,
+        "space_id": job.space_id,
+        "status": job.status,
+        "batch_size": job.batch_size,
+        "last_product_id": job.last_product_id,
+        "total": job.total,
+        "processed": job.processed or 0,
+        "progress": round(min((job.processed or 0) / job.total, 1.0), 4) if job.total else None,
+        "vectors_per_second": job.vectors_per_second,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# Job lanzado desde la API en este proceso (uno a la vez)
+_task = None
+
+
+def start_job(job_id: int) -> bool:
+    """Corre el job en segundo plano. Devuelve False si ya hay uno en curso en este proceso."""
+    global _task
+    if _task is not None and not _task.done():
+        return False
+
+    async def _run():
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            print(f"❌ Re-embedding {job_id} falló: {e}")
+
+    _task = asyncio.create_task(_run())
+    return True
@@ -2,12 +2,15 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.shared.database import get_db
 from src.modules.intelligence.processor import ContentProcessor
+from src.modules.intelligence.service import EmbeddingQueueFullError
 
 from pydantic import BaseModel
 from typing import Optional
 from sqlalchemy import select, update
 from src.modules.intelligence.models import Product, Staff, Client
 from src.modules.auth.dependencies import get_current_user, RequireRole
+from src.shared.versioning import CATALOG, CRM, bump_version
+from src.modules.interaction.entity_index import get_client_index, get_staff_index
 
 router = APIRouter(prefix="/intelligence", tags=["Intelligence"], dependencies=[Depends(get_current_user)])
 
@@ -20,9 +23,127 @@ async def process_content(limit: int = 100, db: AsyncSession = Depends(get_db)):
     try:
         count = await processor.process_batch(db, limit)
         return {"status": "success", "processed_count": count, "message": f"Se procesaron {count} elementos."}
+    except EmbeddingQueueFullError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/embeddings/status", dependencies=[Depends(RequireRole(["admin"]))])
+async def embeddings_status(db: AsyncSession = Depends(get_db)):
+    """
+    Métricas del modelo de embeddings activo: tiempo de carga y huella de memoria.
+    """
+    from src.modules.intelligence.spaces import active_embedding_service
+    return (await active_embedding_service(db)).stats()
+
+@router.get("/vector-index", dependencies=[Depends(RequireRole(["admin"]))])
+async def vector_index_status(db: AsyncSession = Depends(get_db)):
+    """
+    Configuración y estado del índice ANN de products.embedding.
+    """
+    from src.modules.intelligence import vector_index
+    info = await vector_index.get_index_info(db)
+    return {"settings": vector_index.settings(), "index": info, "rebuild": vector_index.rebuild_state}
+
+@router.post("/vector-index/rebuild", dependencies=[Depends(RequireRole(["admin"]))])
+async def rebuild_vector_index():
+    """
+    Reconstruye el índice ANN en segundo plano (CONCURRENTLY, sin bloquear búsquedas
+    ni escrituras). El progreso se consulta en GET /intelligence/vector-index.
+    """
+    from src.shared.database import engine
+    from src.modules.intelligence.vector_index import start_rebuild
+    if not start_rebuild(engine):
+        raise HTTPException(status_code=409, detail="Ya hay una reconstrucción del índice en curso")
+    return {"status": "accepted", "message": "Reconstrucción del índice iniciada."}
+
+@router.post("/embeddings/reembed", status_code=202, dependencies=[Depends(RequireRole(["admin"]))])
+async def start_reembed(target: str = "missing", model: Optional[str] = None, batch_size: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """
+    Recalcula embeddings de productos por lotes en segundo plano.
+    target: 'missing' (sin vector), 'all' o 'model' (generados con `model`: nombre del modelo
+    o model_key exacto como 'modelo|norm'; sin `model`, los que no tienen modelo registrado). El avance se consulta en GET /intelligence/embeddings/jobs/{id}.
+    """
+    from src.modules.intelligence import reembed
+    if target not in reembed.TARGETS:
+        raise HTTPException(status_code=400, detail=f"target inválido (usa {', '.join(reembed.TARGETS)})")
+    job = await reembed.create_job(db, target, model, batch_size)
+    if not reembed.start_job(job.id):
+        raise HTTPException(status_code=409, detail="Ya hay un re-embedding en curso")
+    return {"status": "accepted", "job": reembed.job_to_dict(job)}
+
+@router.post("/embeddings/jobs/{job_id}/resume", status_code=202, dependencies=[Depends(RequireRole(["admin"]))])
+async def resume_reembed(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Retoma un re-embedding interrumpido desde su último lote confirmado."""
+    from src.modules.intelligence import reembed
+    job = await reembed.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de re-embedding no encontrado")
+    if job.status == "done":
+        raise HTTPException(status_code=409, detail="El job ya terminó")
+    if not reembed.start_job(job.id):
+        raise HTTPException(status_code=409, detail="Ya hay un re-embedding en curso")
+    return {"status": "accepted", "job": reembed.job_to_dict(job)}
+
+@router.get("/embeddings/jobs/{job_id}", dependencies=[Depends(RequireRole(["admin"]))])
+async def reembed_status(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Avance de un re-embedding: procesados/total, checkpoint y vectores por segundo."""
+    from src.modules.intelligence import reembed
+    job = await reembed.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de re-embedding no encontrado")
+    return reembed.job_to_dict(job)
+
+@router.get("/embeddings/spaces", dependencies=[Depends(RequireRole(["admin"]))])
+async def list_embedding_spaces(db: AsyncSession = Depends(get_db)):
+    """Espacios vectoriales (modelo + columna): el activo, los que se están llenando y los retirados."""
+    from src.modules.intelligence import spaces
+    return [spaces.space_to_dict(space) for space in await spaces.list_spaces(db)]
+
+@router.post("/embeddings/spaces", status_code=202, dependencies=[Depends(RequireRole(["admin"]))])
+async def create_embedding_space(model_name: str, db: AsyncSession = Depends(get_db)):
+    """
+    Prepara el cambio a otro modelo: crea la columna sombra y la llena en segundo plano
+    (luego construye su índice). Se activa con POST /intelligence/embeddings/spaces/{id}/activate.
+    """
+    from src.modules.intelligence import spaces
+    try:
+        space, job = await spaces.create_space(db, model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not spaces.start(spaces.backfill(space.id)):
+        raise HTTPException(status_code=409, detail="Ya hay un cambio de modelo en curso")
+    return {"status": "accepted", "space": spaces.space_to_dict(space), "job_id": job.id}
+
+@router.post("/embeddings/spaces/{space_id}/backfill", status_code=202, dependencies=[Depends(RequireRole(["admin"]))])
+async def resume_embedding_space(space_id: int, db: AsyncSession = Depends(get_db)):
+    """Retoma el llenado de una columna sombra interrumpido (desde su último checkpoint)."""
+    from src.modules.intelligence import spaces
+    space = await spaces.get_space(db, space_id)
+    if space is None:
+        raise HTTPException(status_code=404, detail="Espacio vectorial no encontrado")
+    if space.status not in ("backfilling", "indexing", "failed"):
+        raise HTTPException(status_code=409, detail=f"El espacio está '{space.status}'")
+    if not spaces.start(spaces.backfill(space_id)):
+        raise HTTPException(status_code=409, detail="Ya hay un cambio de modelo en curso")
+    return {"status": "accepted", "space": spaces.space_to_dict(space)}
+
+@router.post("/embeddings/spaces/{space_id}/activate", dependencies=[Depends(RequireRole(["admin"]))])
+async def activate_embedding_space(space_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Cambia la búsqueda al espacio indicado de forma atómica (renombrado de columnas).
+    También sirve para volver a un espacio 'retired'.
+    """
+    from src.modules.intelligence import spaces
+    if await spaces.get_space(db, space_id) is None:
+        raise HTTPException(status_code=404, detail="Espacio vectorial no encontrado")
+    # La sesión de la petición no debe retener locks mientras se renombran columnas
+    await db.close()
+    try:
+        return await spaces.activate(space_id)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
@@ -101,6 +222,7 @@ async def update_product(product_id: int, product: ProductUpdate, db: AsyncSessi
     )
     
     await db.execute(stmt)
+    await bump_version(db, CATALOG)
     await db.commit()
     
     return {"status": "success", "message": "Producto actualizado correctamente"}
@@ -110,27 +232,25 @@ async def recalculate_vector(product_id: int, db: AsyncSession = Depends(get_db)
     """
     Recalcula el embedding de un producto especifico.
     """
-    from src.modules.intelligence.service import EmbeddingService
-    import json
+    from src.modules.intelligence.spaces import locked_embedding_service
+    from src.modules.intelligence.reembed import product_text
     
+    # Escribe products.embedding: el espacio activo queda fijo hasta el commit
+    # (el lock va antes de leer el producto, ver locked_embedding_service)
+    embedding_service = await locked_embedding_service(db, write=True)
     result = await db.execute(select(Product).where(Product.id == product_id))
     product = result.scalar_one_or_none()
     
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
         
-    payload = {
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "stock": product.stock
-    }
-    payload_str = json.dumps(payload)
+    payload_str = product_text(product.name, product.description, product.price, product.stock)
     
-    embedding_service = EmbeddingService()
     vector = await embedding_service.generate(payload_str)
     
     product.embedding = vector
+    product.embedding_model = embedding_service.model_key if vector is not None else None
+    await bump_version(db, CATALOG)
     await db.commit()
     
     return {"status": "success", "message": "Vector de IA recalculado."}
@@ -140,23 +260,19 @@ async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_
     """
     Crea un nuevo producto en el inventario calculando su vector de IA automáticamente.
     """
-    from src.modules.intelligence.service import EmbeddingService
-    import json
+    from src.modules.intelligence.spaces import locked_embedding_service
+    from src.modules.intelligence.reembed import product_text
     
     new_product = Product(**product.model_dump())
     
-    # Calcular vector inicial
-    payload = {
-        "name": new_product.name,
-        "description": new_product.description,
-        "price": new_product.price,
-        "stock": new_product.stock
-    }
-    embedding_service = EmbeddingService()
-    vec = await embedding_service.generate(json.dumps(payload))
+    # Calcular vector inicial (el espacio activo queda fijo hasta el commit)
+    embedding_service = await locked_embedding_service(db, write=True)
+    vec = await embedding_service.generate(product_text(new_product.name, new_product.description, new_product.price, new_product.stock))
     new_product.embedding = vec
+    new_product.embedding_model = embedding_service.model_key if vec is not None else None
     
     db.add(new_product)
+    await bump_version(db, CATALOG)
     await db.commit()
     await db.refresh(new_product)
     return {"status": "success", "message": "Producto creado correctamente", "product_id": new_product.id}
@@ -173,6 +289,7 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Producto no encontrado")
         
     await db.delete(existing_product)
+    await bump_version(db, CATALOG)
     await db.commit()
     return {"status": "success", "message": "Producto eliminado"}
 
@@ -237,8 +354,11 @@ async def create_staff(staff: StaffCreate, db: AsyncSession = Depends(get_db)):
     """Crea un nuevo empleado."""
     new_staff = Staff(**staff.model_dump())
     db.add(new_staff)
+    await db.flush()
+    versions = await bump_version(db, CRM)
     await db.commit()
     await db.refresh(new_staff)
+    get_staff_index().apply(new_staff.id, new_staff.name, versions[CRM])
     return {"status": "success", "message": "Empleado creado correctamente", "staff_id": new_staff.id}
 
 @router.put("/staff/{staff_id}", dependencies=[Depends(RequireRole(["admin"]))])
@@ -254,7 +374,9 @@ async def update_staff(staff_id: int, staff_in: StaffUpdate, db: AsyncSession =
     if update_data:
         stmt = update(Staff).where(Staff.id == staff_id).values(**update_data).execution_options(synchronize_session="fetch")
         await db.execute(stmt)
+        versions = await bump_version(db, CRM)
         await db.commit()
+        get_staff_index().apply(staff_id, update_data.get("name", existing_staff.name), versions[CRM])
     return {"status": "success", "message": "Empleado actualizado"}
 
 class UserFromStaffRequest(BaseModel):
@@ -333,7 +455,9 @@ async def delete_staff(staff_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Empleado no encontrado")
         
     await db.delete(existing_staff)
+    versions = await bump_version(db, CRM)
     await db.commit()
+    get_staff_index().apply(staff_id, None, versions[CRM])
     return {"status": "success", "message": "Empleado eliminado"}
 
 @router.get("/clients")
@@ -347,8 +471,11 @@ async def create_client(client: ClientCreate, db: AsyncSession = Depends(get_db)
     """Crea un nuevo cliente."""
     new_client = Client(**client.model_dump())
     db.add(new_client)
+    await db.flush()
+    versions = await bump_version(db, CRM)
     await db.commit()
     await db.refresh(new_client)
+    get_client_index().apply(new_client.id, new_client.name, versions[CRM])
     return {"status": "success", "message": "Cliente creado correctamente", "client_id": new_client.id}
 
 @router.put("/clients/{client_id}", dependencies=[Depends(RequireRole(["admin"]))])
@@ -364,7 +491,9 @@ async def update_client(client_id: int, client_in: ClientUpdate, db: AsyncSessio
     if update_data:
         stmt = update(Client).where(Client.id == client_id).values(**update_data).execution_options(synchronize_session="fetch")
         await db.execute(stmt)
+        versions = await bump_version(db, CRM)
         await db.commit()
+        get_client_index().apply(client_id, update_data.get("name", existing_client.name), versions[CRM])
     return {"status": "success", "message": "Cliente actualizado"}
 
 @router.delete("/clients/{client_id}", dependencies=[Depends(RequireRole(["admin"]))])
@@ -377,7 +506,9 @@ async def delete_client(client_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
         
     await db.delete(existing_client)
+    versions = await bump_version(db, CRM)
     await db.commit()
+    get_client_index().apply(client_id, None, versions[CRM])
     return {"status": "success", "message": "Cliente eliminado"}
 
 
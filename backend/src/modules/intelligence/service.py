@@ -1,25 +1,439 @@
-from sentence_transformers import SentenceTransformer
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import asyncio
 import os
+import threading
+import time
+from typing import TYPE_CHECKING
+from src.modules.intelligence.cache import EmbeddingCache
+from src.modules.intelligence.vector_index import DISTANCE_METRIC
+
+if TYPE_CHECKING:
+    # Se importa al cargar el modelo: importar este módulo (colas, cache, pruebas) no requiere torch
+    from sentence_transformers import SentenceTransformer
+
+# Backends de inferencia en CPU (SentenceTransformer(backend=...), sentence-transformers >= 3.2):
+# 'torch' (por defecto), 'onnx' (ONNX Runtime, mismo modelo en fp32) y 'onnx-int8'
+# (pesos cuantizados a int8; requiere el extra [onnx] y un .onnx cuantizado en el repo del modelo)
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Primera versión de sentence-transformers con backend=...; la base del proyecto admite
+# versiones anteriores porque 'torch' no lo necesita
+ONNX_MIN_VERSION = (3, 2)
+# Archivo cuantizado por defecto (los repos de sentence-transformers publican variantes por CPU)
+DEFAULT_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+def _current_rss_bytes() -> int | None:
+    """Memoria residente actual del proceso (solo Linux, None si no está disponible)."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class EmbeddingQueueFullError(Exception):
+    """La cola de inferencia de embeddings está llena (se responde con HTTP 429)."""
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching delante del modelo: agrupa los textos que llegan dentro de
+    max_wait_ms (o hasta max_batch_size) y los codifica con un solo encode(list).
+    Como máximo max_workers lotes corren a la vez; mientras tanto los textos se
+    acumulan en la cola (hasta max_queue) y forman lotes más grandes.
+    """
+
+    def __init__(self, service: "EmbeddingService", max_batch_size: int, max_wait_ms: float):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._task = None
+        self._loop = None
+        self._workers = None
+        self._inflight = set()
+
+        # Métricas
+        self.batch_count = 0
+        self.item_count = 0
+        self.max_batch_seen = 0
+        self.last_batch_size = 0
+        self.size_histogram = {}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.service.max_queue)
+            self._workers = asyncio.Semaphore(self.service.max_workers)
+            self._task = loop.create_task(self._collect())
+
+    async def submit(self, text: str):
+        self._ensure_started()
+        future = self._loop.create_future()
+        item = (text, future)
+
+        if self.service.queue_mode == "reject":
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.service.rejected_count += 1
+                raise EmbeddingQueueFullError("El servicio de embeddings está saturado, intenta de nuevo en unos segundos.")
+        else:
+            try:
+                await asyncio.wait_for(self._queue.put(item), timeout=self.service.queue_timeout)
+            except asyncio.TimeoutError:
+                self.service.rejected_count += 1
+                raise EmbeddingQueueFullError("Tiempo de espera agotado en la cola de embeddings.")
+
+        return await future
+
+    async def _collect(self):
+        while True:
+            # Reservar un worker antes de armar el lote: si todos están ocupados
+            # los textos siguen acumulándose en la cola.
+            await self._workers.acquire()
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = self._loop.create_task(self._flush(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _flush(self, batch: list):
+        try:
+            texts = [text for text, _ in batch]
+            try:
+                vectors = await self.service._run(self.service._encode_many, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            self._record(len(batch))
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        finally:
+            self._workers.release()
+
+    def _record(self, size: int):
+        self.batch_count += 1
+        self.item_count += size
+        self.last_batch_size = size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        # Histograma por potencias de 2: "1", "2", "4", "8", ...
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.size_histogram[str(bucket)] = self.size_histogram.get(str(bucket), 0) + 1
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batch_count,
+            "items": self.item_count,
+            "avg_batch_size": (self.item_count / self.batch_count) if self.batch_count else 0,
+            "max_batch_seen": self.max_batch_seen,
+            "last_batch_size": self.last_batch_size,
+            "batch_size_histogram": self.size_histogram,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Sufijo de model_key para vectores normalizados ("modelo|norm")
+NORM_SUFFIX = "|norm"
+
+
+def model_keys(model: str) -> tuple[str, ...]:
+    """
+    model_key que puede haber registrado un modelo: el nombre solo acepta sus vectores
+    con y sin normalizar; un model_key completo ("modelo|norm") se toma tal cual.
+    """
+    if "|" in model:
+        return (model,)
+    return (model, f"{model}{NORM_SUFFIX}")
+
 
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, model_name: str | None = None, backend: str | None = None):
         # Modelo Local (HuggingFace)
         # Se descarga la primera vez y luego corre localmente.
         # No requiere API Key.
-        model_name = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        print(f"🔄 Cargando modelo de embeddings local: {model_name}...")
-        self.model = SentenceTransformer(model_name)
-        print("✅ Modelo cargado correctamente.")
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+        # Vectores unitarios al escribir: requisito para inner_product, inocuo para cosine
+        default_normalize = "false" if DISTANCE_METRIC == "l2" else "true"
+        self.normalize = os.getenv("EMBEDDING_NORMALIZE", default_normalize).lower() in ("1", "true", "yes")
+        # Identifica el espacio vectorial: vectores normalizados y sin normalizar no son intercambiables
+        self.model_key = f"{self.model_name}{NORM_SUFFIX}" if self.normalize else self.model_name
+        self.backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+        if self.backend not in BACKENDS:
+            raise ValueError(f"EMBEDDING_BACKEND inválido: {self.backend} (usa {', '.join(BACKENDS)})")
+        # Hilos de inferencia por encode (vacío = lo que decida el backend, normalmente todos los núcleos)
+        threads = os.getenv("EMBEDDING_THREADS")
+        self.threads = int(threads) if threads else None
+        self.onnx_file = os.getenv("EMBEDDING_ONNX_FILE") or (DEFAULT_INT8_FILE if self.backend == "onnx-int8" else None)
+        self.model = None
+        self.load_time_seconds = None
+        self.warmup_time_seconds = None
+        self.model_size_bytes = None
+        self.rss_delta_bytes = None
+        self._load_lock = threading.Lock()
+
+        # Pool acotado para la inferencia (CPU-bound) fuera del event loop.
+        # EMBEDDING_QUEUE_MODE: 'wait' espera turno (hasta EMBEDDING_QUEUE_TIMEOUT s), 'reject' responde 429 al instante.
+        self.max_workers = int(os.getenv("EMBEDDING_WORKERS", "2"))
+        self.max_queue = int(os.getenv("EMBEDDING_QUEUE_SIZE", "64"))
+        self.queue_mode = os.getenv("EMBEDDING_QUEUE_MODE", "wait")
+        self.queue_timeout = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "30"))
+        self._executor = None
+        self._slots = None
+        self.pending = 0
+        self.rejected_count = 0
+        # Tamaño de cada trozo enviado al pool por generate_many (para no monopolizarlo)
+        self.bulk_chunk_size = int(os.getenv("EMBEDDING_BULK_CHUNK", "256"))
+
+        # Cache por (modelo, sha256(texto)): LRU en memoria + archivo SQLite opcional.
+        # int8/ONNX dan vectores casi iguales pero no idénticos: cada backend tiene su clave.
+        self.cache = EmbeddingCache(
+            model_key=self.model_key if self.backend == "torch" else f"{self.model_key}|{self.backend}",
+            max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            # El archivo es compartido por todos los modelos: se acota por filas y antigüedad
+            disk_max_rows=int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "1000000")),
+            disk_max_age_seconds=float(os.getenv("EMBEDDING_CACHE_DISK_MAX_AGE_DAYS", "30")) * 86400,
+        )
+
+        # Micro-batching de peticiones concurrentes (chat, ingesta)
+        self.batcher = EmbeddingBatcher(
+            self,
+            max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5")),
+        )
 
-    async def generate(self, text: str) -> list[float]:
+    def load(self) -> SentenceTransformer:
+        """Carga el modelo una sola vez por proceso (seguro entre hilos)."""
+        if self.model is not None:
+            return self.model
+
+        with self._load_lock:
+            if self.model is None:
+                print(f"🔄 Cargando modelo de embeddings local: {self.model_name}...")
+                rss_before = _current_rss_bytes()
+                start = time.perf_counter()
+                model = self._load_backend()
+                self.load_time_seconds = time.perf_counter() - start
+
+                rss_after = _current_rss_bytes()
+                if rss_before is not None and rss_after is not None:
+                    self.rss_delta_bytes = rss_after - rss_before
+                # Con ONNX los pesos viven en la sesión de onnxruntime (no son parámetros de torch)
+                self.model_size_bytes = sum(p.numel() * p.element_size() for p in model.parameters()) or None
+
+                self.model = model
+                print(f"✅ Modelo cargado correctamente en {self.load_time_seconds:.2f}s ({self.backend}).")
+        return self.model
+
+    def _load_backend(self) -> SentenceTransformer:
+        import sentence_transformers
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            return SentenceTransformer(self.model_name)
+
+        installed = sentence_transformers.__version__
+        if tuple(int(part) for part in installed.split(".")[:2]) < ONNX_MIN_VERSION:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={self.backend} requiere sentence-transformers >= "
+                f"{'.'.join(map(str, ONNX_MIN_VERSION))} (instalado: {installed}); instala el extra [onnx]."
+            )
+
+        # ONNX Runtime en CPU; los hilos se fijan en la sesión de este modelo
+        import onnxruntime
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if self.threads:
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = options
+        if self.onnx_file:
+            model_kwargs["file_name"] = self.onnx_file
+        return SentenceTransformer(self.model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    def warmup(self):
+        """
+        Carga el modelo y ejecuta una codificación de prueba para que la primera
+        petición real no pague la reserva de memoria ni la inicialización perezosa.
+        """
+        self.load()
+        start = time.perf_counter()
+        self._encode_many(["warm-up"])
+        self.warmup_time_seconds = time.perf_counter() - start
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embedding")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        """
+        Ejecuta fn en el pool de embeddings. Como máximo max_workers tareas corren
+        y max_queue esperan; el resto espera o se rechaza según queue_mode.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+
+        if self.queue_mode == "reject" and self._slots.locked():
+            self.rejected_count += 1
+            raise EmbeddingQueueFullError("El servicio de embeddings está saturado, intenta de nuevo en unos segundos.")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_count += 1
+            raise EmbeddingQueueFullError("Tiempo de espera agotado en la cola de embeddings.")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def _encode_many(self, texts: list[str]) -> np.ndarray:
+        vectors = self.load().encode(
+            texts,
+            batch_size=self.batcher.max_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize,
+        )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def shutdown(self):
+        self.batcher.shutdown()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "model_name": self.model_name,
+            "model_key": self.model_key,
+            "backend": self.backend,
+            "threads": self.threads,
+            "onnx_file": self.onnx_file,
+            "normalized": self.normalize,
+            "loaded": self.model is not None,
+            "load_time_seconds": self.load_time_seconds,
+            "warmup_time_seconds": self.warmup_time_seconds,
+            "model_size_bytes": self.model_size_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "process_rss_bytes": _current_rss_bytes(),
+            "queue": {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "mode": self.queue_mode,
+                "pending": self.pending,
+                "rejected": self.rejected_count,
+            },
+            "batching": self.batcher.stats(),
+            "cache": self.cache.stats(),
+        }
+
+    async def generate(self, text: str) -> np.ndarray | None:
+        """Vector float32 de una sola frase, o None si no se pudo generar."""
         if not text:
-            return []
+            return None
 
         try:
-            # Generate embedding
-            # encode devuelve un numpy array, lo convertimos a lista
-            vector = self.model.encode(text).tolist()
+            key = self.cache.key(text)
+            cached = await self.cache.lookup([key])
+            if key in cached:
+                return cached[key]
+
+            # Generate embedding (se agrupa con otras peticiones concurrentes)
+            vector = await self.batcher.submit(text)
+            await self.cache.store([(key, vector)])
             return vector
+        except EmbeddingQueueFullError:
+            raise
         except Exception as e:
             print(f"Error generando embedding local: {e}")
-            return []
\ No newline at end of file
+            return None
+
+    async def generate_many(self, texts: list[str]) -> np.ndarray:
+        """
+        Codifica una lista de textos en bloque y devuelve una matriz float32
+        contigua de forma (len(texts), dim). pgvector acepta cada fila tal cual,
+        sin convertirla a lista de floats de Python.
+        Solo se codifican los textos únicos que no están en cache.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [self.cache.key(text) for text in texts]
+        known = await self.cache.lookup(list(dict.fromkeys(keys)))
+
+        # Textos pendientes sin repetir (dos filas idénticas se codifican una vez)
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in known and key not in pending:
+                pending[key] = text
+
+        pending_keys = list(pending)
+        pending_texts = list(pending.values())
+        for start in range(0, len(pending_texts), self.bulk_chunk_size):
+            chunk = await self._run(self._encode_many, pending_texts[start:start + self.bulk_chunk_size])
+            new_items = list(zip(pending_keys[start:start + len(chunk)], chunk))
+            await self.cache.store(new_items)
+            known.update(new_items)
+
+        dim = len(next(iter(known.values())))
+        vectors = np.empty((len(texts), dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            vectors[i] = known[key]
+        return vectors
+
+
+# Instancias compartidas por proceso (worker de uvicorn), una por modelo
+_embedding_services: dict[str, EmbeddingService] = {}
+
+
+def get_embedding_service(model_name: str | None = None) -> EmbeddingService:
+    """
+    Devuelve el EmbeddingService del modelo indicado (por defecto EMBEDDING_MODEL).
+    Cada modelo se carga una sola vez por proceso; durante un cambio de modelo
+    (ver spaces.py) conviven el activo y el nuevo.
+    """
+    model_name = model_name or os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    service = _embedding_services.get(model_name)
+    if service is None:
+        service = _embedding_services[model_name] = EmbeddingService(model_name)
+    return service
+
+
+def loaded_embedding_services() -> list[EmbeddingService]:
+    return list(_embedding_services.values())
@@ -0,0 +1,338 @@
+"""
+Cambio de modelo de embeddings sin cortar la búsqueda.
+
+1. create_space(modelo): registra el espacio y agrega a products una columna sombra
+   vector(dim) (embedding_s<id>) con su columna de modelo por fila (embedding_model_s<id>).
+2. backfill(id): llena la columna sombra por lotes con el nuevo modelo (job de
+   reembed.py, reanudable) y crea su índice ANN CONCURRENTLY.
+3. activate(id): completa los productos creados entretanto y, en una transacción
+   corta, renombra el par activo (embedding, embedding_model) a embedding_s<id anterior>
+   / embedding_model_s<id anterior> y el par sombra a embedding / embedding_model
+   (con sus índices), sin reescribir filas. El chat y la ingesta siguen consultando
+   products.embedding, ahora con el modelo nuevo; el espacio anterior queda
+   'retired' y se puede volver a activar igual.
+
+    python -m src.modules.intelligence.spaces create all-mpnet-base-v2
+    python -m src.modules.intelligence.spaces backfill 2
+    python -m src.modules.intelligence.spaces activate 2
+"""
+import argparse
+import asyncio
+import os
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import select, update, text, func, bindparam
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.shared.database import SessionLocal, engine
+from src.modules.intelligence.models import EmbeddingJob, EmbeddingSpace, Product
+from src.modules.intelligence.service import EmbeddingService, get_embedding_service
+from src.modules.intelligence.vector_index import build_column_index, index_name_for
+from src.shared.versioning import CATALOG, bump_version, get_version
+
+# Al activar: productos que aún se pueden codificar con products bloqueada (el resto se
+# completa antes, sin lock) y veces que se reintenta si entretanto llegaron más
+ACTIVATE_LOCKED_LIMIT = int(os.getenv("EMBEDDING_ACTIVATE_LOCKED_LIMIT", "32"))
+ACTIVATE_ATTEMPTS = int(os.getenv("EMBEDDING_ACTIVATE_ATTEMPTS", "5"))
+# Productos por lote al ponerse al día sin lock
+CATCH_UP_BATCH = int(os.getenv("EMBEDDING_CATCH_UP_BATCH", "512"))
+# lock_not_available (lock_timeout) y deadlock_detected: se reintenta la activación
+LOCK_CONFLICT_SQLSTATES = ("55P03", "40P01")
+
+# Modelo activo por proceso, revalidado con la versión 'catalog' (activate la incrementa)
+_active = {"version": None, "model_name": None}
+
+
+async def active_model_name(db: AsyncSession) -> str | None:
+    """
+    Modelo del espacio activo, o None si nunca se registró uno (se usa EMBEDDING_MODEL).
+
+    No toma locks: activate() puede cambiarlo justo después. Quien consulta o escribe
+    products.embedding debe confirmarlo con locked_embedding_service().
+    """
+    version = await get_version(db, CATALOG)
+    if _active["version"] != version:
+        result = await db.execute(select(EmbeddingSpace.model_name).where(EmbeddingSpace.status == "active"))
+        _active.update(version=version, model_name=result.scalar_one_or_none())
+    return _active["model_name"]
+
+
+async def active_embedding_service(db: AsyncSession) -> EmbeddingService:
+    """EmbeddingService del modelo que generó products.embedding (consultas y escrituras)."""
+    return get_embedding_service(await active_model_name(db))
+
+
+async def locked_embedding_service(db: AsyncSession, write: bool = False) -> EmbeddingService:
+    """
+    Como active_embedding_service, pero toma un lock sobre products hasta el fin de la
+    transacción: activate() no puede renombrar columnas mientras tanto, así que el
+    modelo devuelto sigue siendo el de products.embedding. Se llama justo antes de
+    buscar o escribir vectores; si difiere del modelo con que se codificó, hay que
+    recodificar.
+
+    Quien va a escribir pasa write=True y toma ROW EXCLUSIVE de entrada: con ACCESS SHARE
+    el INSERT/UPDATE posterior esperaría al EXCLUSIVE de activate() mientras activate()
+    espera a esta transacción para renombrar (deadlock).
+    """
+    mode = "ROW EXCLUSIVE" if write else "ACCESS SHARE"
+    await db.execute(text(f"LOCK TABLE products IN {mode} MODE"))
+    return await active_embedding_service(db)
+
+
+def model_column(column: str) -> str:
+    """Columna con el modelo por fila que acompaña a una columna de vectores."""
+    return column.replace("embedding", "embedding_model", 1)
+
+
+def shadow_update(column: str):
+    """UPDATE por id de una columna sombra y su modelo (no mapeadas en Product), para executemany."""
+    return text(
+        f"UPDATE products SET {column} = :vector, {model_column(column)} = :model WHERE id = :id"
+    ).bindparams(bindparam("vector", type_=Vector()))
+
+
+async def _current_space(db: AsyncSession) -> EmbeddingSpace:
+    """Espacio activo; la primera vez se registra el de EMBEDDING_MODEL sobre products.embedding."""
+    result = await db.execute(select(EmbeddingSpace).where(EmbeddingSpace.status == "active"))
+    space = result.scalar_one_or_none()
+    if space is None:
+        service = get_embedding_service()
+        # vector(n) guarda la dimensión en atttypmod
+        dim = await db.scalar(text(
+            "SELECT atttypmod FROM pg_attribute WHERE attrelid = 'products'::regclass AND attname = 'embedding'"
+        ))
+        space = EmbeddingSpace(model_name=service.model_name, model_key=service.model_key, dim=dim,
+                               column_name="embedding", status="active", activated_at=func.now())
+        db.add(space)
+        await db.flush()
+    return space
+
+
+async def get_space(db: AsyncSession, space_id: int) -> EmbeddingSpace | None:
+    result = await db.execute(select(EmbeddingSpace).where(EmbeddingSpace.id == space_id))
+    return result.scalar_one_or_none()
+
+
+async def list_spaces(db: AsyncSession) -> list[EmbeddingSpace]:
+    result = await db.execute(select(EmbeddingSpace).order_by(EmbeddingSpace.id))
+    return result.scalars().all()
+
+
+async def create_space(db: AsyncSession, model_name: str) -> tuple[EmbeddingSpace, EmbeddingJob]:
+    """Registra el espacio del nuevo modelo, su columna sombra y el job que la llena."""
+    from src.modules.intelligence import reembed
+
+    current = await _current_space(db)
+    service = get_embedding_service(model_name)
+    if service.model_key == current.model_key:
+        raise ValueError(f"El modelo {model_name} ya es el activo")
+    model = await asyncio.to_thread(service.load)
+
+    space = EmbeddingSpace(model_name=model_name, model_key=service.model_key,
+                           dim=model.get_sentence_embedding_dimension(), status="backfilling")
+    db.add(space)
+    await db.flush()
+    space.column_name = f"embedding_s{space.id}"
+    await db.execute(text(f"ALTER TABLE products ADD COLUMN IF NOT EXISTS {space.column_name} vector({int(space.dim)})"))
+    await db.execute(text(f"ALTER TABLE products ADD COLUMN IF NOT EXISTS {model_column(space.column_name)} VARCHAR"))
+    await db.commit()
+    job = await reembed.create_job(db, "missing", space_id=space.id)
+    return space, job
+
+
+async def backfill(space_id: int, on_progress=None) -> dict:
+    """Llena la columna sombra (retoma el último job del espacio) y construye su índice."""
+    from src.modules.intelligence import reembed
+
+    async with SessionLocal() as db:
+        space = await get_space(db, space_id)
+        if space is None or space.status not in ("backfilling", "indexing", "failed"):
+            raise ValueError(f"El espacio {space_id} no está pendiente de backfill")
+        result = await db.execute(
+            select(EmbeddingJob.id).where(EmbeddingJob.space_id == space_id, EmbeddingJob.status != "done")
+            .order_by(EmbeddingJob.id.desc()).limit(1)
+        )
+        job_id = result.scalar_one_or_none()
+        if job_id is None:
+            job_id = (await reembed.create_job(db, "missing", space_id=space_id)).id
+        space.status = "backfilling"
+        await db.commit()
+
+    try:
+        await reembed.run_job(job_id, on_progress=on_progress)
+        await _set_status(space_id, "indexing")
+        await build_column_index(engine, space.column_name)
+        await _set_status(space_id, "ready")
+    except Exception as e:
+        await _set_status(space_id, "failed", str(e))
+        raise
+    async with SessionLocal() as db:
+        return space_to_dict(await get_space(db, space_id))
+
+
+async def _set_status(space_id: int, status: str, error: str | None = None):
+    async with SessionLocal() as db:
+        await db.execute(update(EmbeddingSpace).where(EmbeddingSpace.id == space_id)
+                         .values(status=status, last_error=error[:1000] if error else None))
+        await db.commit()
+
+
+async def _missing_count(db: AsyncSession, space: EmbeddingSpace) -> int:
+    return await db.scalar(select(func.count()).select_from(Product).where(text(f"{space.column_name} IS NULL")))
+
+
+async def _fill_missing(db: AsyncSession, space: EmbeddingSpace, limit: int) -> int:
+    """Codifica en la columna del espacio hasta `limit` productos que aún no tienen vector allí."""
+    from src.modules.intelligence.reembed import TEXT_COLUMNS, product_text
+
+    column = space.column_name
+    result = await db.execute(select(*TEXT_COLUMNS).where(text(f"{column} IS NULL")).order_by(Product.id).limit(limit))
+    rows = result.all()
+    if rows:
+        vectors = await get_embedding_service(space.model_name).generate_many([product_text(*row[1:]) for row in rows])
+        await db.execute(shadow_update(column), [
+            {"id": row.id, "vector": vector, "model": space.model_key} for row, vector in zip(rows, vectors)
+        ])
+    return len(rows)
+
+
+async def _switch(db: AsyncSession, space: EmbeddingSpace) -> EmbeddingSpace | None:
+    """
+    Bajo lock: completa el resto acotado y renombra las columnas. Devuelve el espacio que
+    se retiró, o None si faltan más de ACTIVATE_LOCKED_LIMIT vectores (hay que repetir).
+    """
+    current = await _current_space(db)
+    # EXCLUSIVE: las lecturas siguen, las escrituras esperan; sin colas largas si algo tiene la tabla tomada
+    await db.execute(text("SET LOCAL lock_timeout = '5s'"))
+    await db.execute(text("LOCK TABLE products IN EXCLUSIVE MODE"))
+    if await _missing_count(db, space) > ACTIVATE_LOCKED_LIMIT:
+        return None
+    await _fill_missing(db, space, ACTIVATE_LOCKED_LIMIT)
+
+    retired_column = f"embedding_s{current.id}"
+    shadow_column = space.column_name
+    for source, target in (("embedding", retired_column), (shadow_column, "embedding")):
+        await db.execute(text(f"ALTER TABLE products RENAME COLUMN {source} TO {target}"))
+        await db.execute(text(f"ALTER TABLE products RENAME COLUMN {model_column(source)} TO {model_column(target)}"))
+        await db.execute(text(f"ALTER INDEX IF EXISTS {index_name_for(source)} RENAME TO {index_name_for(target)}"))
+
+    current.status, current.column_name = "retired", retired_column
+    space.status, space.column_name, space.activated_at = "active", "embedding", func.now()
+    space.last_error = None
+    # Invalida el modelo activo cacheado por cada proceso y las respuestas cacheadas del chat
+    await bump_version(db, CATALOG)
+    await db.commit()
+    return current
+
+
+def _lock_conflict(error: DBAPIError) -> bool:
+    """lock_timeout vencido o deadlock con una transacción que ya tenía products tomada."""
+    return getattr(error.orig, "sqlstate", None) in LOCK_CONFLICT_SQLSTATES
+
+
+async def activate(space_id: int) -> dict:
+    """
+    Pasa products.embedding al espacio indicado ('ready', o 'retired' para volver atrás).
+
+    Los productos creados durante el backfill se codifican antes, sin lock, hasta que
+    falten a lo sumo ACTIVATE_LOCKED_LIMIT. Bajo el lock solo se codifica ese resto
+    acotado; si entretanto llegaron más, o el lock no se obtuvo a tiempo (lock_timeout o
+    deadlock), se suelta todo y se vuelve a intentar. Así las escrituras en products solo
+    esperan el renombrado y unos pocos vectores.
+    """
+    async with SessionLocal() as db:
+        space = await get_space(db, space_id)
+        if space is None or space.status not in ("ready", "retired"):
+            raise ValueError(f"El espacio {space_id} no está listo para activarse")
+        # El índice pudo construirse con otra métrica o parámetros (se recrea si no coincide).
+        # CONCURRENTLY espera a las transacciones abiertas, incluida la de esta sesión.
+        column = space.column_name
+        await db.commit()
+        await build_column_index(engine, column)
+
+        for attempt in range(ACTIVATE_ATTEMPTS):
+            # Ponerse al día sin bloquear (productos creados o sin vector durante el backfill)
+            while await _missing_count(db, space) > ACTIVATE_LOCKED_LIMIT:
+                await _fill_missing(db, space, CATCH_UP_BATCH)
+                await db.commit()
+            await db.commit()
+
+            try:
+                retired = await _switch(db, space)
+            except DBAPIError as e:
+                if not _lock_conflict(e):
+                    raise
+                print(f"⏳ Activación del espacio {space_id}: products ocupada ({e.orig}), reintentando...")
+                retired = None
+            if retired is not None:
+                break
+            # Soltar el lock y repetir (el rollback expira los objetos de la sesión)
+            await db.rollback()
+            space = await get_space(db, space_id)
+        else:
+            raise RuntimeError(
+                f"El espacio {space_id} no alcanzó a activarse en {ACTIVATE_ATTEMPTS} intentos; vuelve a activarlo"
+            )
+        print(f"🔀 Espacio vectorial activo: {space.model_key} (antes {retired.model_key})")
+
+        await db.refresh(space)
+        return space_to_dict(space)
+
+
+def space_to_dict(space: EmbeddingSpace) -> dict:
+    return {
+        "id": space.id,
+        "model_name": space.model_name,
+        "model_key": space.model_key,
+        "dim": space.dim,
+        "column": space.column_name,
+        "status": space.status,
+        "last_error": space.last_error,
+        "created_at": space.created_at.isoformat() if space.created_at else None,
+        "activated_at": space.activated_at.isoformat() if space.activated_at else None,
+    }
+
+
+# Backfill/activación lanzados desde la API en este proceso (uno a la vez)
+_task = None
+
+
+def start(coro) -> bool:
+    """Corre backfill/activate en segundo plano. Devuelve False si ya hay uno en curso."""
+    global _task
+    if _task is not None and not _task.done():
+        coro.close()
+        return False
+
+    async def _run():
+        try:
+            await coro
+        except Exception as e:
+            print(f"❌ Cambio de modelo de embeddings falló: {e}")
+
+    _task = asyncio.create_task(_run())
+    return True
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["create", "backfill", "activate", "list"])
+    parser.add_argument("target", nargs="?", help="modelo (create) o id del espacio (backfill/activate)")
+    args = parser.parse_args()
+
+    if args.action == "list":
+        async with SessionLocal() as db:
+            for space in await list_spaces(db):
+                print(space_to_dict(space))
+    elif args.action == "create":
+        async with SessionLocal() as db:
+            space, job = await create_space(db, args.target)
+            print(f"Espacio {space.id} ({space.model_key}, dim {space.dim}) en {space.column_name}: {job.total} productos por codificar")
+    elif args.action == "backfill":
+        print(await backfill(int(args.target), on_progress=lambda job: print(f"{job['processed']}/{job['total']} {job['vectors_per_second']} vectores/s")))
+    else:
+        print(await activate(int(args.target)))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
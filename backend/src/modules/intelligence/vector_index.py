@@ -0,0 +1,275 @@
+import asyncio
+import os
+from datetime import datetime
+from sqlalchemy import Index, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+# Índice ANN sobre products.embedding
+# VECTOR_INDEX_TYPE: 'hnsw' (recomendado), 'ivfflat' o 'none' (búsqueda secuencial)
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+INDEX_NAME = "ix_products_embedding_ann"
+
+# Métrica de similitud: 'l2', 'cosine' o 'inner_product'.
+# Con vectores normalizados (ver EmbeddingService) 'inner_product' da el mismo orden
+# que 'cosine' con el operador más barato (<#>).
+DISTANCE_METRIC = os.getenv("VECTOR_DISTANCE", "l2").lower()
+_OPCLASSES = {"l2": "vector_l2_ops", "cosine": "vector_cosine_ops", "inner_product": "vector_ip_ops"}
+if DISTANCE_METRIC not in _OPCLASSES:
+    raise ValueError(f"VECTOR_DISTANCE inválido: {DISTANCE_METRIC} (usa l2, cosine o inner_product)")
+OPCLASS = _OPCLASSES[DISTANCE_METRIC]
+
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "40"))
+# pgvector >= 0.8: 'relaxed_order' evita perder resultados al filtrar por access_level
+HNSW_ITERATIVE_SCAN = os.getenv("VECTOR_HNSW_ITERATIVE_SCAN", "")
+
+IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", "10"))
+
+
+def distance(column, query_vector):
+    """Expresión de distancia (menor = más similar) acorde a la métrica y al opclass del índice."""
+    if DISTANCE_METRIC == "cosine":
+        return column.cosine_distance(query_vector)
+    if DISTANCE_METRIC == "inner_product":
+        # <#> devuelve el producto interno negado, así que ORDER BY ascendente sigue sirviendo
+        return column.max_inner_product(query_vector)
+    return column.l2_distance(query_vector)
+
+
+def _build_params() -> dict:
+    if INDEX_TYPE == "hnsw":
+        return {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    if INDEX_TYPE == "ivfflat":
+        return {"lists": IVFFLAT_LISTS}
+    return {}
+
+
+def table_indexes() -> tuple:
+    """Índices para __table_args__ de Product (create_all los crea en tablas nuevas)."""
+    if INDEX_TYPE not in ("hnsw", "ivfflat"):
+        return ()
+    return (
+        Index(
+            INDEX_NAME,
+            "embedding",
+            postgresql_using=INDEX_TYPE,
+            postgresql_with=_build_params(),
+            postgresql_ops={"embedding": OPCLASS},
+        ),
+    )
+
+
+def index_name_for(column: str) -> str:
+    """Nombre del índice ANN de una columna de vectores (las columnas sombra usan el suyo)."""
+    return INDEX_NAME if column == "embedding" else f"ix_products_{column}_ann"
+
+
+def _create_sql(column: str = "embedding") -> str:
+    params = ", ".join(f"{k} = {v}" for k, v in _build_params().items())
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name_for(column)} "
+        f"ON products USING {INDEX_TYPE} ({column} {OPCLASS}) WITH ({params})"
+    )
+
+
+def _matches(indexdef: str) -> bool:
+    """Compara la definición existente (pg_indexes.indexdef) con la configuración actual."""
+    if f"USING {INDEX_TYPE} " not in indexdef or OPCLASS not in indexdef:
+        return False
+    return all(f"{k}='{v}'" in indexdef for k, v in _build_params().items())
+
+
+async def _autocommit(engine: AsyncEngine):
+    # CREATE/DROP/REINDEX CONCURRENTLY no pueden correr dentro de una transacción
+    conn = await engine.connect()
+    return await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+
+async def _try_lock(conn) -> bool:
+    """
+    Lock de sesión que serializa crear/borrar/reindexar índices ANN entre workers.
+    Se usa try: esperar el lock dentro de una sentencia bloquearía el CONCURRENTLY de quien lo tiene.
+    """
+    return await conn.scalar(text("SELECT pg_try_advisory_lock(hashtext('agente_vector_index'))"))
+
+
+async def _unlock(conn):
+    await conn.execute(text("SELECT pg_advisory_unlock(hashtext('agente_vector_index'))"))
+
+
+async def build_in_progress(conn, name: str) -> bool:
+    """True si alguna sesión está construyendo ese índice (un índice así se ve como inválido)."""
+    return bool(await conn.scalar(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_stat_progress_create_index p "
+            "JOIN pg_class c ON c.oid = p.index_relid WHERE c.relname = :name)"
+        ),
+        {"name": name},
+    ))
+
+
+async def get_index_info(conn, name: str = INDEX_NAME) -> dict | None:
+    result = await conn.execute(
+        text(
+            "SELECT i.indexdef, pg_relation_size(c.oid) AS size_bytes, x.indisvalid AS valid "
+            "FROM pg_indexes i "
+            "JOIN pg_class c ON c.relname = i.indexname "
+            "JOIN pg_index x ON x.indexrelid = c.oid "
+            "WHERE i.tablename = 'products' AND i.indexname = :name"
+        ),
+        {"name": name},
+    )
+    row = result.fetchone()
+    if not row:
+        return None
+    return {"definition": row.indexdef, "size_bytes": row.size_bytes, "valid": row.valid}
+
+
+async def ensure_vector_index(engine: AsyncEngine) -> str:
+    """
+    Crea el índice si falta y lo recrea si sus parámetros ya no coinciden con la
+    configuración. Se ejecuta con CONCURRENTLY para no bloquear escrituras.
+    Con varios workers arrancando a la vez solo uno lo hace; el resto devuelve 'busy'.
+    """
+    conn = await _autocommit(engine)
+    try:
+        if not await _try_lock(conn):
+            return "busy"
+        try:
+            info = await get_index_info(conn)
+            if INDEX_TYPE not in ("hnsw", "ivfflat"):
+                if info:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}"))
+                    return "dropped"
+                return "disabled"
+
+            if info and info["valid"] and _matches(info["definition"]):
+                return "ok"
+            # Inválido y sin nadie construyéndolo: quedó de un CREATE INDEX CONCURRENTLY interrumpido
+            if info and not info["valid"] and await build_in_progress(conn, INDEX_NAME):
+                return "busy"
+            if info:
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}"))
+            await conn.execute(text(_create_sql()))
+            return "recreated" if info else "created"
+        finally:
+            await _unlock(conn)
+    finally:
+        await conn.close()
+
+
+async def build_column_index(engine: AsyncEngine, column: str) -> str:
+    """
+    Crea (CONCURRENTLY) el índice ANN de una columna sombra antes de activarla,
+    así la búsqueda no pasa por un recorrido secuencial después del cambio. Como en
+    ensure_vector_index, uno existente se recrea si ya no coincide con la configuración
+    (métrica, tipo o parámetros cambiados desde que se construyó).
+    """
+    if INDEX_TYPE not in ("hnsw", "ivfflat"):
+        return "disabled"
+    name = index_name_for(column)
+    conn = await _autocommit(engine)
+    try:
+        if not await _try_lock(conn):
+            raise RuntimeError("Otro proceso está creando o reconstruyendo un índice vectorial; intenta de nuevo")
+        try:
+            info = await get_index_info(conn, name)
+            if info and info["valid"] and _matches(info["definition"]):
+                return "ok"
+            if info and not info["valid"] and await build_in_progress(conn, name):
+                raise RuntimeError(f"El índice {name} se está construyendo en otra sesión")
+            if info:
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            await conn.execute(text(_create_sql(column)))
+            return "recreated" if info else "created"
+        finally:
+            await _unlock(conn)
+    finally:
+        await conn.close()
+
+
+async def rebuild_vector_index(engine: AsyncEngine) -> str:
+    """
+    Reconstruye el índice sin cortar las búsquedas (REINDEX CONCURRENTLY).
+    Útil para IVFFlat, cuyas listas se calculan con los datos existentes al crearlo.
+    """
+    status = await ensure_vector_index(engine)
+    if status != "ok":
+        return status
+
+    conn = await _autocommit(engine)
+    try:
+        if not await _try_lock(conn):
+            return "busy"
+        try:
+            await conn.execute(text(f"REINDEX INDEX CONCURRENTLY {INDEX_NAME}"))
+            return "rebuilt"
+        finally:
+            await _unlock(conn)
+    finally:
+        await conn.close()
+
+
+# Estado de la última reconstrucción lanzada desde la API (por proceso)
+rebuild_state = {"status": "idle", "started_at": None, "finished_at": None, "result": None, "error": None}
+_rebuild_task = None
+
+
+def start_rebuild(engine: AsyncEngine) -> bool:
+    """
+    Lanza la reconstrucción en segundo plano. Debe correr fuera de la petición:
+    CONCURRENTLY espera a que terminen las transacciones abiertas, incluida la
+    de la propia petición HTTP. Devuelve False si ya hay una en curso.
+    """
+    global _rebuild_task
+    if _rebuild_task is not None and not _rebuild_task.done():
+        return False
+
+    async def _run():
+        rebuild_state.update(status="running", started_at=datetime.utcnow(), finished_at=None, result=None, error=None)
+        try:
+            rebuild_state["result"] = await rebuild_vector_index(engine)
+            rebuild_state["status"] = "done"
+        except Exception as e:
+            rebuild_state.update(status="failed", error=str(e))
+        finally:
+            rebuild_state["finished_at"] = datetime.utcnow()
+
+    _rebuild_task = asyncio.create_task(_run())
+    return True
+
+
+async def apply_search_params(db: AsyncSession, ef_search: int | None = None, probes: int | None = None):
+    """
+    Ajusta la precisión/velocidad de la búsqueda ANN solo para la transacción
+    actual (equivalente a SET LOCAL).
+    """
+    if INDEX_TYPE == "hnsw":
+        await db.execute(
+            text("SELECT set_config('hnsw.ef_search', :value, true)"),
+            {"value": str(ef_search or HNSW_EF_SEARCH)},
+        )
+        if HNSW_ITERATIVE_SCAN:
+            await db.execute(
+                text("SELECT set_config('hnsw.iterative_scan', :value, true)"),
+                {"value": HNSW_ITERATIVE_SCAN},
+            )
+    elif INDEX_TYPE == "ivfflat":
+        await db.execute(
+            text("SELECT set_config('ivfflat.probes', :value, true)"),
+            {"value": str(probes or IVFFLAT_PROBES)},
+        )
+
+
+def settings() -> dict:
+    return {
+        "type": INDEX_TYPE,
+        "name": INDEX_NAME,
+        "distance": DISTANCE_METRIC,
+        "opclass": OPCLASS,
+        "build_params": _build_params(),
+        "ef_search": HNSW_EF_SEARCH if INDEX_TYPE == "hnsw" else None,
+        "probes": IVFFLAT_PROBES if INDEX_TYPE == "ivfflat" else None,
+    }
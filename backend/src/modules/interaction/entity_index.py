@@ -0,0 +1,117 @@
+import asyncio
+import re
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.modules.intelligence.models import Client, Staff
+from src.shared.versioning import CRM, get_version
+
+_WORD_RE = re.compile(r"\w+")
+# Palabras más cortas que esto no identifican a nadie por sí solas ("de", "inc", "sa")
+MIN_WORD_LENGTH = 4
+
+
+def _tokens(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class NameIndex:
+    """
+    Índice invertido en memoria para detectar nombres de clientes/personal en una pregunta.
+
+    - Cada palabra del nombre con 4+ letras apunta a su id (ej. "acme" -> {3}).
+    - El nombre completo normalizado también se indexa como frase, para nombres
+      formados solo por palabras cortas (ej. "IBM").
+
+    match() recorre los tokens de la pregunta y sus n-gramas, así que el costo depende
+    del largo de la pregunta y no de la cantidad de clientes.
+
+    La versión 'crm' de data_versions indica si otro worker cambió los datos: en ese
+    caso el índice se recarga completo; los cambios locales se aplican al vuelo.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.version = None
+        self._names = {}     # id -> nombre
+        self._words = {}     # palabra -> {ids}
+        self._phrases = {}   # nombre normalizado -> {ids}
+        self._max_phrase_tokens = 1
+        self._lock = asyncio.Lock()
+
+    def _add(self, entity_id: int, name: str):
+        if not name:
+            return
+        self._names[entity_id] = name
+        tokens = _tokens(name)
+        for word in set(tokens):
+            if len(word) >= MIN_WORD_LENGTH:
+                self._words.setdefault(word, set()).add(entity_id)
+        if tokens:
+            self._phrases.setdefault(" ".join(tokens), set()).add(entity_id)
+            self._max_phrase_tokens = max(self._max_phrase_tokens, len(tokens))
+
+    def _remove(self, entity_id: int):
+        name = self._names.pop(entity_id, None)
+        if name is None:
+            return
+        tokens = _tokens(name)
+        for key, table in [(w, self._words) for w in set(tokens)] + [(" ".join(tokens), self._phrases)]:
+            ids = table.get(key)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del table[key]
+
+    async def ensure_fresh(self, db: AsyncSession):
+        version = await get_version(db, CRM)
+        if self.version == version:
+            return
+        async with self._lock:
+            if self.version == version:
+                return
+            result = await db.execute(select(self.model.id, self.model.name))
+            self._names, self._words, self._phrases, self._max_phrase_tokens = {}, {}, {}, 1
+            for entity_id, name in result.all():
+                self._add(entity_id, name)
+            self.version = version
+
+    def apply(self, entity_id: int, name: str | None, new_version: int):
+        """
+        Aplica un alta/cambio (name) o baja (name=None) hecha por este worker.
+        Si entre medio hubo cambios de otro worker, se fuerza una recarga completa.
+        """
+        if self.version is None:
+            return
+        if self.version != new_version - 1:
+            self.version = None
+            return
+        self._remove(entity_id)
+        if name is not None:
+            self._add(entity_id, name)
+        self.version = new_version
+
+    def match(self, question: str) -> set[int]:
+        tokens = _tokens(question)
+        found = set()
+        for i, token in enumerate(tokens):
+            ids = self._words.get(token)
+            if ids:
+                found |= ids
+            for n in range(1, min(self._max_phrase_tokens, len(tokens) - i) + 1):
+                ids = self._phrases.get(" ".join(tokens[i:i + n]))
+                if ids:
+                    found |= ids
+        return found
+
+
+# Instancias compartidas por proceso (worker de uvicorn)
+_client_index = NameIndex(Client)
+_staff_index = NameIndex(Staff)
+
+
+def get_client_index() -> NameIndex:
+    return _client_index
+
+
+def get_staff_index() -> NameIndex:
+    return _staff_index
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import random
+import httpx
+import litellm
+
+# Errores transitorios que vale la pena reintentar (rate limit, red, 5xx, timeouts)
+_RETRYABLE_ERRORS = tuple(
+    getattr(litellm.exceptions, name)
+    for name in ("RateLimitError", "APIConnectionError", "Timeout", "ServiceUnavailableError", "InternalServerError")
+    if hasattr(litellm.exceptions, name)
+) + (httpx.TransportError,)
+
+
+class LLMClient:
+    """
+    Cliente LLM asíncrono compartido por todo el proceso.
+
+    Usa un único httpx.AsyncClient (conexiones keep-alive reutilizadas entre chats),
+    timeouts explícitos y reintentos con backoff exponencial + jitter.
+    LLM_API_BASE permite apuntar a un servidor compatible con OpenAI, por ejemplo
+    el servidor falso de fake_llm_server.py para pruebas locales.
+    """
+
+    def __init__(self):
+        # Se utilizara Groq (Llama 3.3) para generar las respuestas (Gratis y Rapido)
+        # Actualizado porque llama3-8b-8192 fue decomisado
+        self.model = os.getenv("LLM_MODEL", "groq/llama-3.3-70b-versatile")
+        self.api_key = os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY")
+        self.api_base = os.getenv("LLM_API_BASE") or None
+        self.timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.retry_backoff = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+        self._http = None
+
+    def _session(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+            )
+            # LiteLLM reutiliza esta sesión para los proveedores compatibles con OpenAI (Groq incluido)
+            litellm.aclient_session = self._http
+        return self._http
+
+    def _request_kwargs(self, messages: list, stream: bool = False) -> dict:
+        self._session()
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "api_key": self.api_key,
+            "timeout": self.timeout,
+            "num_retries": 0,  # los reintentos los maneja _with_retries
+            "stream": stream,
+        }
+        if self.api_base:
+            kwargs["api_base"] = self.api_base
+        return kwargs
+
+    async def _with_retries(self, call):
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter: espera aleatoria entre 0 y backoff * 2^intento
+                delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+                print(f"⚠️ Error transitorio del LLM ({type(e).__name__}), reintentando en {delay:.2f}s...")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def complete(self, messages: list) -> str:
+        response = await self._with_retries(lambda: litellm.acompletion(**self._request_kwargs(messages)))
+        return response.choices[0].message.content
+
+    async def stream(self, messages: list):
+        """
+        Genera la respuesta token a token. Solo se reintenta el arranque del stream:
+        una vez enviado el primer fragmento al cliente ya no se puede repetir.
+        """
+        response = await self._with_retries(lambda: litellm.acompletion(**self._request_kwargs(messages, stream=True)))
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            litellm.aclient_session = None
+
+
+# Instancia compartida por proceso (worker de uvicorn)
+_llm_client: LLMClient | None = None
+
+
+def get_llm_client() -> LLMClient:
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
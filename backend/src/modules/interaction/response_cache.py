@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import os
+import time
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("vector", "answer", "generation", "created_at")
+
+    def __init__(self, vector: np.ndarray, answer: str, generation: int):
+        self.vector = vector
+        self.answer = answer
+        self.generation = generation
+        self.created_at = time.monotonic()
+
+
+class SemanticResponseCache:
+    """
+    Cache semántica de respuestas del chat, separada por rol.
+
+    Una pregunta reutiliza la respuesta de otra anterior si la similitud coseno de
+    sus embeddings supera el umbral, la entrada no expiró (TTL) y el catálogo no
+    cambió desde entonces (generation = versión 'catalog' de data_versions).
+    """
+
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._buckets = {}   # rol -> OrderedDict[int, _Entry] (orden LRU)
+        self._matrices = {}  # rol -> (ids, matriz de vectores) reconstruida al cambiar el bucket
+        self._next_id = 0
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, role: str, entry_ids: list):
+        bucket = self._buckets.get(role)
+        for entry_id in entry_ids:
+            bucket.pop(entry_id, None)
+        self._matrices.pop(role, None)
+
+    def _matrix(self, role: str):
+        if role not in self._matrices:
+            bucket = self._buckets[role]
+            ids = list(bucket.keys())
+            self._matrices[role] = (ids, np.stack([bucket[i].vector for i in ids]))
+        return self._matrices[role]
+
+    def lookup(self, role: str, vector: np.ndarray, generation: int) -> str | None:
+        bucket = self._buckets.get(role)
+        if not bucket:
+            self.misses += 1
+            return None
+
+        # Entradas de otra versión del catálogo, de otro modelo (otra dimensión) o vencidas ya no sirven
+        now = time.monotonic()
+        dimension = np.shape(vector)
+        stale = [
+            i for i, e in bucket.items()
+            if e.generation != generation or e.vector.shape != dimension or now - e.created_at > self.ttl_seconds
+        ]
+        if stale:
+            self.invalidations += len(stale)
+            self._drop(role, stale)
+            if not bucket:
+                self.misses += 1
+                return None
+
+        ids, matrix = self._matrix(role)
+        similarities = matrix @ self._unit(vector)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        entry_id = ids[best]
+        bucket.move_to_end(entry_id)
+        self.hits += 1
+        return bucket[entry_id].answer
+
+    def store(self, role: str, vector: np.ndarray, generation: int, answer: str):
+        bucket = self._buckets.setdefault(role, OrderedDict())
+        bucket[self._next_id] = _Entry(self._unit(vector), answer, generation)
+        self._next_id += 1
+        while len(bucket) > self.max_entries:
+            bucket.popitem(last=False)
+            self.evictions += 1
+        self._matrices.pop(role, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries,
+            "entries": {role: len(bucket) for role, bucket in self._buckets.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": (self.hits / lookups) if lookups else 0,
+        }
+
+
+# Instancia compartida por proceso (worker de uvicorn)
+_response_cache: SemanticResponseCache | None = None
+
+
+def get_response_cache() -> SemanticResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = SemanticResponseCache(
+            threshold=float(os.getenv("CHAT_CACHE_THRESHOLD", "0.95")),
+            ttl_seconds=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000")),
+        )
+    return _response_cache
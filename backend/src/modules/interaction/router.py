@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from src.shared.database import get_db
 from src.modules.interaction.service import ChatService
+from src.modules.intelligence.service import EmbeddingQueueFullError
+from src.modules.interaction.response_cache import get_response_cache
+from src.modules.auth.dependencies import RequireRole
+import json
 
 router = APIRouter(prefix="/chat", tags=["Interaction"])
 
@@ -19,7 +24,51 @@ async def ask_agent(request: ChatRequest, db: AsyncSession = Depends(get_db)):
     try:
         resultado = await service.ask(request.message, db, role=request.role)
         return resultado
+    except EmbeddingQueueFullError:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/stream")
+async def ask_agent_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Igual que /chat pero responde con Server-Sent Events: un evento 'data' por
+    fragmento de texto ({"delta": "..."}) y un evento final 'done'.
+    """
+    service = ChatService()
+    try:
+        chunks = await service.ask_stream(request.message, db, role=request.role)
+    except EmbeddingQueueFullError:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        try:
+            async for delta in chunks:
+                yield _sse({"delta": delta})
+            yield _sse({}, event="done")
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error viaja como evento SSE
+            yield _sse({"detail": str(e)}, event="error")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/cache/stats", dependencies=[Depends(RequireRole(["admin"]))])
+async def chat_cache_stats():
+    """
+    Métricas de la cache semántica de respuestas (aciertos, fallos, desalojos).
+    """
+    return get_response_cache().stats()
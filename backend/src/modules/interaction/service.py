@@ -1,43 +1,137 @@
 import os
-from litellm import completion
-import litellm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_
-from src.modules.intelligence.service import EmbeddingService
+from src.modules.intelligence.spaces import active_embedding_service, locked_embedding_service
 from src.modules.intelligence.models import Product, Sale, Staff, Client
+from src.modules.intelligence.vector_index import apply_search_params, distance
+from src.modules.interaction.llm import get_llm_client
+from src.modules.interaction.response_cache import get_response_cache
+from src.modules.interaction.entity_index import get_client_index, get_staff_index
+from src.shared.versioning import CATALOG, get_version
 from sqlalchemy.orm import selectinload
 from dotenv import load_dotenv
 
 load_dotenv()
 os.environ['LITELLM_LOG'] = 'DEBUG'
 
+# Máximo de clientes/empleados detectados que se incluyen en el contexto
+ENTITY_MATCH_LIMIT = int(os.getenv("CHAT_ENTITY_MATCH_LIMIT", "25"))
+
 class ChatService:
 
 
     def __init__(self):
-        self.embedding_service = EmbeddingService()
-        # Se utilizara Groq (Llama 3.3) para generar las respuestas (Gratis y Rapido)
-        # Actualizado porque llama3-8b-8192 fue decomisado
-        self.llm_model = os.getenv("LLM_MODEL", "groq/llama-3.3-70b-versatile")
-        self.api_key = os.getenv("GROQ_API_KEY")
+        # Cliente LLM asíncrono compartido (Groq por defecto, ver llm.py)
+        self.llm = get_llm_client()
+        # Recuperación RAG: cantidad de productos y distancia máxima aceptada (vacío = sin umbral)
+        self.top_k = int(os.getenv("RAG_TOP_K", "20"))
+        max_distance = os.getenv("RAG_MAX_DISTANCE")
+        self.max_distance = float(max_distance) if max_distance else None
+        # Cache semántica de respuestas (por defecto solo para el widget de clientes)
+        self.response_cache = get_response_cache()
+        self.cache_enabled = os.getenv("CHAT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.cache_roles = {r.strip() for r in os.getenv("CHAT_CACHE_ROLES", "customer").split(",") if r.strip()}
 
-    async def ask(self, question: str, db: AsyncSession, role: str = "customer"):
-        # Se convierte la pregunta en vector
-        query_vector = await self.embedding_service.generate(question)
+    async def ask(self, question: str, db: AsyncSession, role: str = "customer", top_k: int | None = None, max_distance: float | None = None):
+        # Modelo del espacio vectorial activo (cambia sin reiniciar, ver spaces.py)
+        embedding_service = await active_embedding_service(db)
+        query_vector = await embedding_service.generate(question)
 
-        # Se busca similitud semantica en la base de datos
-        # El operador <-> mide la distancia (mientras menor sea, mas simillar son)
+        # Cache semántica: preguntas casi idénticas con el mismo catálogo reutilizan la respuesta
+        cache_generation = await self._cache_generation(db, role, query_vector, top_k, max_distance)
+        if cache_generation is not None:
+            cached = self.response_cache.lookup(role, query_vector, cache_generation)
+            if cached is not None:
+                await db.close()
+                return {"response": cached}
 
-        # Usamos l2_distance de pgvector.
-        query = select(Product).order_by(Product.embedding.l2_distance(query_vector)).limit(20)
-        
-        # Filtro de Seguridad (RBAC)
-        if role == "customer":
-            query = query.filter(Product.access_level == "public")
+        messages = await self.build_messages(question, db, role, top_k, max_distance, query_vector=query_vector, query_model=embedding_service.model_key)
+        # Liberar la conexión al pool mientras se espera al LLM (puede tardar segundos)
+        await db.close()
+
+        # Generar respuesta con LLM (Groq) sin bloquear el event loop
+        answer = await self.llm.complete(messages)
+        if cache_generation is not None:
+            self.response_cache.store(role, query_vector, cache_generation, answer)
+        return {
+            "response": answer
+        }
+
+    async def ask_stream(self, question: str, db: AsyncSession, role: str = "customer", top_k: int | None = None, max_distance: float | None = None):
+        """
+        Igual que ask, pero devuelve un generador asíncrono con los fragmentos de texto.
+        El contexto (BD) se arma antes de devolverlo, así el stream no depende de la sesión.
+        """
+        embedding_service = await active_embedding_service(db)
+        query_vector = await embedding_service.generate(question)
+
+        cache_generation = await self._cache_generation(db, role, query_vector, top_k, max_distance)
+        if cache_generation is not None:
+            cached = self.response_cache.lookup(role, query_vector, cache_generation)
+            if cached is not None:
+                await db.close()
+                return self._single_chunk(cached)
+
+        messages = await self.build_messages(question, db, role, top_k, max_distance, query_vector=query_vector, query_model=embedding_service.model_key)
+        await db.close()
+        if cache_generation is None:
+            return self.llm.stream(messages)
+        return self._stream_and_store(messages, role, query_vector, cache_generation)
+
+    async def _cache_generation(self, db: AsyncSession, role: str, query_vector, top_k, max_distance) -> int | None:
+        """Versión del catálogo a usar como clave de cache, o None si la pregunta no se cachea."""
+        if not self.cache_enabled or role not in self.cache_roles or query_vector is None:
+            return None
+        # Parámetros de recuperación distintos pueden dar otra respuesta
+        if top_k is not None or max_distance is not None:
+            return None
+        return await get_version(db, CATALOG)
+
+    @staticmethod
+    async def _single_chunk(text: str):
+        yield text
+
+    async def _stream_and_store(self, messages: list, role: str, query_vector, generation: int):
+        parts = []
+        async for delta in self.llm.stream(messages):
+            parts.append(delta)
+            yield delta
+        # Solo se guarda si el stream terminó completo
+        self.response_cache.store(role, query_vector, generation, "".join(parts))
+
+    async def build_messages(self, question: str, db: AsyncSession, role: str = "customer", top_k: int | None = None, max_distance: float | None = None, query_vector=None, query_model: str | None = None) -> list:
+        # Modelo de products.embedding, fijo hasta el fin de la transacción (ver spaces.py).
+        # Se convierte la pregunta en vector salvo que ya venga calculada con ese mismo modelo.
+        embedding_service = await locked_embedding_service(db)
+        if query_vector is None or query_model != embedding_service.model_key:
+            query_vector = await embedding_service.generate(question)
+
+        # Se busca similitud semantica en la base de datos
+        # La métrica (VECTOR_DISTANCE) define el operador: <-> L2, <=> coseno, <#> producto interno.
+        # En todos los casos, mientras menor sea la distancia, mas similares son.
+        # El vector numpy se envía sin convertir a lista.
+        # Solo se proyectan las columnas que usa el prompt (nunca el embedding) más la distancia.
+        similar_products = []
+        if query_vector is not None:
+            dist = distance(Product.embedding, query_vector)
+            columns = [Product.name, Product.category, Product.description, Product.price]
+            if role == "admin":
+                columns.append(Product.agent_instruction)
+            query = select(*columns, dist.label("distance")).order_by(dist).limit(top_k or self.top_k)
             
-        stmt = query
-        result = await db.execute(stmt)
-        similar_products = result.scalars().all()
+            # Filtro de Seguridad (RBAC)
+            if role == "customer":
+                query = query.filter(Product.access_level == "public")
+
+            threshold = max_distance if max_distance is not None else self.max_distance
+            if threshold is not None:
+                query = query.where(dist <= threshold)
+                
+            # Parámetros de búsqueda del índice ANN (ef_search / probes) para esta transacción
+            await apply_search_params(db)
+            stmt = query
+            result = await db.execute(stmt)
+            similar_products = result.all()
 
         sales_context = ""
         crm_context = ""
@@ -49,23 +143,21 @@ class ChatService:
         # --- BUSQUEDA CONTEXTUAL AVANZADA (ADMIN) ---
         if role == "admin":
             # 1. Analizar Clientes
-            clients_stmt = select(Client)
-            clients_res = await db.execute(clients_stmt)
-            all_clients = clients_res.scalars().all()
-            
+            # Índice de nombres en memoria: costo proporcional al largo de la pregunta
+            client_index = get_client_index()
+            await client_index.ensure_fresh(db)
+            client_ids = client_index.match(q_lower)
+
             relevant_clients = []
-            for c in all_clients:
-                c_name = c.name.lower()
-                c_words = [w for w in c_name.replace(".", "").split() if len(w) > 3]
-                
-                # Coincidencia directa o parcial del nombre del cliente
-                if c_name in q_lower or any(w in q_lower for w in c_words):
-                    relevant_clients.append(c)
-                    mentioned_customers.add(c.name)
+            if client_ids:
+                clients_res = await db.execute(select(Client).where(Client.id.in_(client_ids)).order_by(Client.id).limit(ENTITY_MATCH_LIMIT))
+                relevant_clients = clients_res.scalars().all()
+                mentioned_customers.update(c.name for c in relevant_clients)
             
             # Si el usuario pide "todos los clientes" o usa palabras clave
             if any(k in q_lower for k in ["cliente", "empresa", "comprador", "prospecto"]) and not relevant_clients:
-                relevant_clients = all_clients[:10] # Top 10 por defecTo
+                clients_res = await db.execute(select(Client).order_by(Client.id).limit(10)) # Top 10 por defecTo
+                relevant_clients = clients_res.scalars().all()
             
             if relevant_clients:
                 crm_context += "\n[Base de Datos de Clientes]:\n"
@@ -73,21 +165,19 @@ class ChatService:
                     crm_context += f"- Cliente: {c.name} | Email: {c.contact_email} | Tel: {c.phone} | Industria: {c.industry} | Estado: {c.status} | Tipo: {c.customer_type}\n"
 
             # 2. Analizar Personal (Staff)
-            staff_stmt = select(Staff)
-            staff_res = await db.execute(staff_stmt)
-            all_staff = staff_res.scalars().all()
-            
+            staff_index = get_staff_index()
+            await staff_index.ensure_fresh(db)
+            staff_ids = staff_index.match(q_lower)
+
             relevant_staff = []
-            for s in all_staff:
-                s_name = s.name.lower()
-                s_words = [w for w in s_name.split() if len(w) > 3]
-                
-                if s_name in q_lower or any(w in q_lower for w in s_words):
-                    relevant_staff.append(s)
-                    mentioned_sellers.add(s.name)
+            if staff_ids:
+                staff_res = await db.execute(select(Staff).where(Staff.id.in_(staff_ids)).order_by(Staff.id).limit(ENTITY_MATCH_LIMIT))
+                relevant_staff = staff_res.scalars().all()
+                mentioned_sellers.update(s.name for s in relevant_staff)
             
             if any(k in q_lower for k in ["empleado", "vendedor", "staff", "personal", "equipo", "meta"]) and not relevant_staff:
-                relevant_staff = all_staff[:10]
+                staff_res = await db.execute(select(Staff).order_by(Staff.id).limit(10))
+                relevant_staff = staff_res.scalars().all()
             
             if relevant_staff:
                 crm_context += "\n[Base de Datos de Personal]:\n"
@@ -125,7 +215,7 @@ class ChatService:
 
         # Se construye el contexto para la IA
         context_text = "\n[Catálogo y Conocimiento (RAG)]:\n" + "\n".join([
-            f"- {p.name} [{p.category or 'General'}]: {p.description} (Precio Base: ${p.price})" + (f" [INSTRUCCIÓN INTERNA: {p.agent_instruction}]" if p.agent_instruction and role == "admin" else "")
+            f"- {p.name} [{p.category or 'General'}]: {p.description} (Precio Base: ${p.price})" + (f" [INSTRUCCIÓN INTERNA: {p.agent_instruction}]" if role == "admin" and p.agent_instruction else "")
             for p in similar_products
         ])
         
@@ -162,16 +252,7 @@ class ChatService:
             {context_text}
             """
 
-        # Generar respuesta con LLM (Groq)
-        response = completion(
-            model=self.llm_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": question}
-            ],
-            api_key=self.api_key
-        )
-
-        return {
-            "response": response['choices'][0]['message']['content']
-        }
\ No newline at end of file
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
\ No newline at end of file
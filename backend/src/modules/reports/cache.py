@@ -0,0 +1,71 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+
+class ReportCache:
+    """
+    Cache de resultados de reportes por (endpoint, filtros), válida mientras no cambie
+    la versión de datos de la que dependen (data_versions: 'sales' o 'catalog').
+
+    El ETag sale de la misma clave y versión, así que cualquier worker puede responder
+    304 a un If-None-Match sin tener la entrada en memoria ni recalcular nada.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # clave -> (versión, resultado), orden LRU
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(endpoint: str, filters: dict) -> str:
+        return f"{endpoint}?{json.dumps(filters, sort_keys=True, default=str)}"
+
+    @staticmethod
+    def etag(key: str, version: int) -> str:
+        return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]}-{version}"'
+
+    def get(self, key: str, version: int):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def store(self, key: str, version: int, result):
+        self._entries[key] = (version, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0,
+        }
+
+
+# Instancia compartida por proceso (worker de uvicorn)
+_report_cache: ReportCache | None = None
+
+
+def get_report_cache() -> ReportCache:
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache(max_entries=int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "256")))
+    return _report_cache
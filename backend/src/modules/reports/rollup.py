@@ -0,0 +1,134 @@
+"""
+Resumen diario de ventas (sales_daily_rollup) para los reportes del dashboard.
+
+Cada escritura de ventas aplica su delta en la misma transacción: la ingesta suma
+las filas que realmente insertó, editar resta la versión anterior y suma la nueva,
+y borrar resta. Así /reports/sales y /reports/customers leen unas pocas filas por
+día en vez de recorrer sales, y su costo no depende del volumen de ventas.
+
+Al arrancar, ensure_rollup() reconstruye el resumen desde sales si nunca se hizo
+(tablas existentes antes de este resumen). También se puede forzar a mano:
+
+    python -m src.modules.reports.rollup rebuild
+"""
+import argparse
+import asyncio
+from sqlalchemy import select, func, text, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.shared.database import SessionLocal, engine
+from src.modules.intelligence.models import Sale, SalesDailyRollup
+from src.shared.versioning import SALES, bump_version, get_version
+
+# Dimensiones del resumen (además del día)
+DIMENSIONS = ("category", "seller_name", "customer_name", "region")
+KEY_COLUMNS = ("day",) + DIMENSIONS
+
+# Marca en data_versions: el resumen ya se reconstruyó alguna vez desde sales
+ROLLUP_MARKER = "sales_rollup"
+# Clave del advisory lock que serializa la reconstrucción entre workers
+ROLLUP_LOCK = 728402
+
+
+def sale_values(sale: Sale) -> dict:
+    """Campos de una venta ORM que usa el resumen (antes de editarla o borrarla)."""
+    return {column: getattr(sale, column) for column in ("sale_date", "price_total", "quantity") + DIMENSIONS}
+
+
+async def apply_sales(db: AsyncSession, added: list[dict] = (), removed: list[dict] = ()):
+    """
+    Suma `added` y resta `removed` del resumen diario e incrementa la versión 'sales'.
+    Las filas son dicts con sale_date, price_total, quantity y las dimensiones.
+    El commit lo hace quien llama.
+    """
+    deltas = {}
+    for sign, sales in ((1, added), (-1, removed)):
+        for sale in sales:
+            # Sin fecha no hay día: esas ventas no entran al resumen (la ingesta siempre la completa)
+            if sale["sale_date"] is None:
+                continue
+            key = (sale["sale_date"].date(),) + tuple(sale[column] or "" for column in DIMENSIONS)
+            delta = deltas.setdefault(key, [0.0, 0, 0])
+            delta[0] += sign * (sale["price_total"] or 0)
+            delta[1] += sign * (sale["quantity"] or 0)
+            delta[2] += sign
+    if not deltas:
+        return
+
+    stmt = insert(SalesDailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={
+            "price_total": SalesDailyRollup.price_total + stmt.excluded.price_total,
+            "quantity": SalesDailyRollup.quantity + stmt.excluded.quantity,
+            "sale_count": SalesDailyRollup.sale_count + stmt.excluded.sale_count,
+        },
+    ).returning(SalesDailyRollup.id, SalesDailyRollup.sale_count)
+    # Claves ordenadas: dos transacciones que tocan las mismas filas las bloquean en el mismo orden
+    rows = [
+        dict(zip(KEY_COLUMNS, key), price_total=delta[0], quantity=delta[1], sale_count=delta[2])
+        for key, delta in sorted(deltas.items())
+    ]
+    result = await db.execute(stmt, rows)
+    empty = [row.id for row in result if row.sale_count <= 0]
+    if empty:
+        await db.execute(delete(SalesDailyRollup).where(SalesDailyRollup.id.in_(empty)))
+    await bump_version(db, SALES)
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """
+    Recalcula el resumen completo desde sales. SHARE sobre sales frena las escrituras
+    de ventas hasta el commit, así ningún delta queda fuera ni se cuenta dos veces.
+    """
+    await db.execute(text("LOCK TABLE sales IN SHARE MODE"))
+    await db.execute(text("TRUNCATE sales_daily_rollup"))
+    day = func.date(Sale.sale_date)
+    dimensions = [func.coalesce(getattr(Sale, column), "") for column in DIMENSIONS]
+    source = (
+        select(
+            day, *dimensions,
+            func.coalesce(func.sum(Sale.price_total), 0.0),
+            func.coalesce(func.sum(Sale.quantity), 0),
+            func.count(),
+        )
+        .where(Sale.sale_date.is_not(None))
+        .group_by(day, *dimensions)
+    )
+    await db.execute(
+        insert(SalesDailyRollup).from_select(list(KEY_COLUMNS) + ["price_total", "quantity", "sale_count"], source)
+    )
+    await bump_version(db, SALES, ROLLUP_MARKER)
+    return await db.scalar(select(func.count()).select_from(SalesDailyRollup))
+
+
+async def ensure_rollup() -> bool:
+    """Reconstruye el resumen si nunca se hizo. Devuelve True si lo reconstruyó."""
+    async with SessionLocal() as db:
+        if await get_version(db, ROLLUP_MARKER):
+            return False
+        await db.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK)))
+        # Otro worker pudo terminarlo mientras se esperaba el lock
+        if await get_version(db, ROLLUP_MARKER):
+            await db.rollback()
+            return False
+        rows = await rebuild(db)
+        await db.commit()
+        print(f"📊 Resumen diario de ventas reconstruido: {rows} filas")
+        return True
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["rebuild"])
+    parser.parse_args()
+
+    async with SessionLocal() as db:
+        rows = await rebuild(db)
+        await db.commit()
+    print(f"📊 Resumen diario de ventas reconstruido: {rows} filas")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from pydantic import BaseModel
 from src.shared.database import get_db
 from src.modules.reports.service import ReportService
 from io import BytesIO
+import os
+
+# Tamaño de cada parte enviada al descargar archivos generados
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+def iter_file(file):
+    """Lee el archivo por partes y lo cierra al terminar (o si el cliente corta la descarga)."""
+    try:
+        while chunk := file.read(DOWNLOAD_CHUNK_BYTES):
+            yield chunk
+    finally:
+        file.close()
 
 class CustomDashboardRequest(BaseModel):
     prompt: str
@@ -15,21 +27,32 @@ class ExportCustomRequest(BaseModel):
     data: list
     format: str # 'pdf' | 'excel'
 
-from src.modules.auth.dependencies import get_current_user
+from src.modules.auth.dependencies import get_current_user, RequireRole
 
 router = APIRouter(prefix="/reports", tags=["Reports"], dependencies=[Depends(get_current_user)])
 
 report_service = ReportService()
 
+def cached_response(result, etag: str) -> Response:
+    """
+    200 con el resultado o 304 si el cliente ya lo tiene. 'no-cache' obliga al navegador
+    a revalidar cada vez (If-None-Match), sin reusar la respuesta a ciegas.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if result is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(result, headers=headers)
+
 @router.get("/stats")
-async def get_stats(db: AsyncSession = Depends(get_db)):
+async def get_stats(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Obtiene estadísticas generales del inventario.
     """
-    return await report_service.get_stats(db)
+    return cached_response(*await report_service.get_stats_cached(db, request.headers.get("if-none-match")))
 
 @router.get("/sales")
 async def get_sales_stats(
+    request: Request,
     month: Optional[int] = Query(0, ge=0, le=12),
     year: Optional[int] = Query(None, ge=2000),
     customer_name: Optional[str] = Query(None),
@@ -38,14 +61,23 @@ async def get_sales_stats(
     """
     Obtiene estadísticas de ventas filtradas por mes/año/cliente.
     """
-    return await report_service.get_sales_stats(db, month, year, customer_name)
+    return cached_response(*await report_service.get_sales_stats_cached(
+        db, month, year, customer_name, request.headers.get("if-none-match")
+    ))
 
 @router.get("/customers")
-async def list_customers(db: AsyncSession = Depends(get_db)):
+async def list_customers(request: Request, db: AsyncSession = Depends(get_db)):
     """
     Obtiene la lista de nombres de clientes únicos.
     """
-    return await report_service.list_customers(db)
+    return cached_response(*await report_service.list_customers_cached(db, request.headers.get("if-none-match")))
+
+@router.get("/cache/stats", dependencies=[Depends(RequireRole(["admin"]))])
+async def report_cache_stats():
+    """
+    Métricas de la cache de reportes (aciertos, fallos, 304 y desalojos).
+    """
+    return report_service.cache.stats()
 
 @router.post("/custom")
 async def get_custom_dashboard(
@@ -81,15 +113,19 @@ async def export_custom_dashboard(request: ExportCustomRequest):
 async def download_excel(db: AsyncSession = Depends(get_db)):
     """
     Descarga el inventario completo en formato Excel (.xlsx).
+    El archivo se envía por partes desde el archivo temporal, sin copiarlo entero en memoria.
     """
-    excel_buffer = await report_service.generate_excel(db)
-    
+    excel_file = await report_service.generate_excel(db)
+    size = excel_file.seek(0, os.SEEK_END)
+    excel_file.seek(0)
+
     headers = {
-        'Content-Disposition': 'attachment; filename="inventario.xlsx"'
+        'Content-Disposition': 'attachment; filename="inventario.xlsx"',
+        'Content-Length': str(size)
     }
     
     return StreamingResponse(
-        iter([excel_buffer.getvalue()]),
+        iter_file(excel_file),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers=headers
     )
@@ -1,14 +1,74 @@
 import pandas as pd
 from fpdf import FPDF
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, extract
-from src.modules.intelligence.models import Product, Sale
+from sqlalchemy import select, func, extract, literal_column, tuple_
+from src.modules.intelligence.models import Product, Sale, SalesDailyRollup
+from src.modules.reports.cache import get_report_cache
+from src.shared.versioning import CATALOG, SALES, get_version
+from fastapi.encoders import jsonable_encoder
+from datetime import date
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+import asyncio
 import litellm
 import os
 import json
 
+# Exportación a Excel: filas por lote leído del cursor del servidor y bytes que el
+# archivo temporal mantiene en memoria antes de pasar a disco
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "2000"))
+EXPORT_SPOOL_MAX_BYTES = int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Encabezado -> columna de products (sin embedding)
+EXCEL_COLUMNS = {
+    "ID": Product.id,
+    "Nombre": Product.name,
+    "Descripción": Product.description,
+    "Nivel Acceso": Product.access_level,
+}
+
 class ReportService:
+    def __init__(self):
+        # Resultados por (endpoint, filtros) validados con la versión de datos (ver cache.py)
+        self.cache = get_report_cache()
+
+    async def cached(self, db: AsyncSession, endpoint: str, filters: dict, version_name: str, compute,
+                     if_none_match: str | None = None) -> tuple:
+        """
+        Devuelve (resultado, etag). El resultado es None si el cliente ya tiene esta
+        versión (If-None-Match): basta con leer el contador de data_versions.
+        Si no, se usa la cache del proceso o se recalcula con compute().
+        """
+        version = await get_version(db, version_name)
+        key = self.cache.key(endpoint, filters)
+        etag = self.cache.etag(key, version)
+        if if_none_match and etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+            self.cache.not_modified += 1
+            return None, etag
+
+        result = self.cache.get(key, version)
+        if result is None:
+            # JSON ya serializable: la entrada se comparte entre peticiones
+            result = jsonable_encoder(await compute())
+            self.cache.store(key, version, result)
+        return result, etag
+
+    async def get_stats_cached(self, db: AsyncSession, if_none_match: str | None = None) -> tuple:
+        return await self.cached(db, "stats", {}, CATALOG, lambda: self.get_stats(db), if_none_match)
+
+    async def get_sales_stats_cached(self, db: AsyncSession, month: int = None, year: int = None,
+                                     customer_name: str = None, if_none_match: str | None = None) -> tuple:
+        filters = {"month": month or 0, "year": year, "customer_name": customer_name}
+        return await self.cached(
+            db, "sales", filters, SALES, lambda: self.get_sales_stats(db, month, year, customer_name), if_none_match
+        )
+
+    async def list_customers_cached(self, db: AsyncSession, if_none_match: str | None = None) -> tuple:
+        return await self.cached(db, "customers", {}, SALES, lambda: self.list_customers(db), if_none_match)
+
     async def get_stats(self, db: AsyncSession):
         """
         Obtiene estadísticas generales del inventario.
@@ -31,31 +91,40 @@ class ReportService:
             "private_products": private_products
         }
 
-    async def generate_excel(self, db: AsyncSession) -> BytesIO:
+    async def generate_excel(self, db: AsyncSession) -> SpooledTemporaryFile:
         """
-        Genera un archivo Excel con todos los productos.
+        Genera un archivo Excel con todos los productos, con memoria acotada.
+
+        Las filas llegan por lotes de un cursor del servidor (db.stream + yield_per) con
+        solo las columnas exportadas, y openpyxl en modo write_only las vuelca a disco
+        a medida que se agregan. El .xlsx queda en un archivo temporal (en memoria hasta
+        EXPORT_SPOOL_MAX_BYTES) posicionado al inicio, listo para enviarse por partes.
         """
-        query = select(Product)
-        result = await db.execute(query)
-        products = result.scalars().all()
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Inventario")
+        header = []
+        for title in EXCEL_COLUMNS:
+            cell = WriteOnlyCell(sheet, value=title)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        sheet.append(header)
+
+        def append_rows(rows):
+            for row in rows:
+                sheet.append(tuple(row))
+
+        output = SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+        try:
+            query = select(*EXCEL_COLUMNS.values()).order_by(Product.id).execution_options(yield_per=EXPORT_FETCH_ROWS)
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                # Escribir el lote fuera del event loop (openpyxl es síncrono)
+                await asyncio.to_thread(append_rows, rows)
+            await asyncio.to_thread(workbook.save, output)
+        except Exception:
+            output.close()
+            raise
 
-        # Convertir a DataFrame
-        data = []
-        for p in products:
-            data.append({
-                "ID": p.id,
-                "Nombre": p.name,
-                "Descripción": p.description,
-                "Nivel Acceso": p.access_level
-            })
-        
-        df = pd.DataFrame(data)
-        
-        # Guardar en buffer
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name="Inventario")
-        
         output.seek(0)
         return output
 
@@ -99,92 +168,94 @@ class ReportService:
 
     async def list_customers(self, db: AsyncSession):
         """
-        Lista todos los nombres de clientes únicos que existen en las ventas.
+        Lista todos los nombres de clientes únicos que existen en las ventas
+        (desde el resumen diario, que tiene una fila por cliente y día).
         """
-        query = select(func.distinct(Sale.customer_name)).order_by(Sale.customer_name)
+        query = (
+            select(func.distinct(SalesDailyRollup.customer_name))
+            .where(SalesDailyRollup.customer_name != "")
+            .order_by(SalesDailyRollup.customer_name)
+        )
         result = await db.execute(query)
-        return [row[0] for row in result.all() if row[0]]
+        return [row[0] for row in result.all()]
+
+    @staticmethod
+    def _rollup_filters(month: int = None, year: int = None, customer_name: str = None) -> list:
+        """Condiciones sobre sales_daily_rollup; año/mes como rango de días (usa el índice)."""
+        filters = []
+        if year:
+            if month and month > 0:
+                start = date(year, month, 1)
+                end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+            else:
+                start, end = date(year, 1, 1), date(year + 1, 1, 1)
+            filters += [SalesDailyRollup.day >= start, SalesDailyRollup.day < end]
+        elif month and month > 0:
+            # Mes de cualquier año (sin año no hay rango)
+            filters.append(extract('month', SalesDailyRollup.day) == month)
+        if customer_name and customer_name != "Todos":
+            filters.append(SalesDailyRollup.customer_name == customer_name)
+        return filters
 
     async def get_sales_stats(self, db: AsyncSession, month: int = None, year: int = None, customer_name: str = None):
         """
         Obtiene estadísticas de ventas filtradas por mes, año y/o cliente.
         Si month es None o 0, se considera el año completo.
+
+        Una sola consulta sobre el resumen diario (reports/rollup.py): GROUPING SETS da
+        los totales, el desglose por categoría y el de vendedores en un mismo recorrido,
+        y SUM(...) FILTER arma las columnas software/hardware/servicios de cada vendedor.
         """
+        filters = self._rollup_filters(month, year, customer_name)
+        # Literales en SQL (no parámetros): la expresión del SELECT debe ser idéntica a la del GROUP BY.
+        # Las dimensiones vacías del resumen equivalen a NULL en sales.
+        empty = literal_column("''")
+        category = func.nullif(SalesDailyRollup.category, empty)
+        seller = func.coalesce(func.nullif(SalesDailyRollup.seller_name, empty), literal_column("'Sin Asignar'"))
+        total = func.sum(SalesDailyRollup.price_total)
+
+        # Misma precedencia que antes: software, luego hardware, luego servicios
+        category_lower = func.lower(category)
+        is_software = category_lower.contains("software")
+        is_hardware = category_lower.contains("hardware") & ~is_software
+        is_services = (category_lower.contains("servicios") | category_lower.contains("service")) & ~is_software & ~is_hardware
+
         query = select(
-            func.sum(Sale.price_total).label("total_profit"),
-            func.sum(Sale.quantity).label("total_sold"),
-            func.count(func.distinct(Sale.customer_name)).label("total_clients")
+            # Bits de GROUPING(vendedor, categoría): 3 = totales, 2 = por categoría, 1 = por vendedor
+            func.grouping(seller, category).label("grouping"),
+            seller.label("seller_name"),
+            category.label("category"),
+            total.label("total"),
+            func.sum(SalesDailyRollup.quantity).label("total_sold"),
+            func.count(func.distinct(func.nullif(SalesDailyRollup.customer_name, empty))).label("total_clients"),
+            total.filter(is_software).label("software"),
+            total.filter(is_hardware).label("hardware"),
+            total.filter(is_services).label("servicios"),
+        ).where(*filters).group_by(
+            func.grouping_sets(tuple_(), tuple_(category), tuple_(seller))
         )
-        
-        # Filtrado por año (obligatorio si se provee)
-        if year:
-            query = query.where(extract('year', Sale.sale_date) == year)
-            
-        # Filtrado por mes (opcional, 0 o None significa 'todo el año')
-        if month and month > 0:
-            query = query.where(extract('month', Sale.sale_date) == month)
-
-        # Filtrado por cliente
-        if customer_name and customer_name != "Todos":
-            query = query.where(Sale.customer_name == customer_name)
-            
         result = await db.execute(query)
-        stats = result.fetchone()
-        
-        # Breakdown by category
-        cat_query = select(
-            Sale.category,
-            func.sum(Sale.price_total).label("total")
-        ).group_by(Sale.category)
-        
-        if year:
-            cat_query = cat_query.where(extract('year', Sale.sale_date) == year)
-        if month and month > 0:
-            cat_query = cat_query.where(extract('month', Sale.sale_date) == month)
-        if customer_name and customer_name != "Todos":
-            cat_query = cat_query.where(Sale.customer_name == customer_name)
-            
-        cat_result = await db.execute(cat_query)
-        breakdown = [{"category": row.category, "total": row.total} for row in cat_result]
-
-        # Breakdown by Seller and Category (Software vs Hardware)
-        seller_query = select(
-            Sale.seller_name,
-            Sale.category,
-            func.sum(Sale.price_total).label("total")
-        ).group_by(Sale.seller_name, Sale.category)
-        
-        if year:
-            seller_query = seller_query.where(extract('year', Sale.sale_date) == year)
-        if month and month > 0:
-            seller_query = seller_query.where(extract('month', Sale.sale_date) == month)
-        if customer_name and customer_name != "Todos":
-            seller_query = seller_query.where(Sale.customer_name == customer_name)
-
-        seller_result = await db.execute(seller_query)
-        
-        # Agrupar por vendedor en el formato deseado
-        sellers_map = {}
-        for row in seller_result:
-            s_name = row.seller_name or "Sin Asignar"
-            if s_name not in sellers_map:
-                sellers_map[s_name] = {"name": s_name, "software": 0, "hardware": 0, "servicios": 0, "total": 0}
-            
-            cat_lower = row.category.lower()
-            if "software" in cat_lower:
-                sellers_map[s_name]["software"] += row.total
-            elif "hardware" in cat_lower:
-                sellers_map[s_name]["hardware"] += row.total
-            elif "servicios" in cat_lower or "service" in cat_lower:
-                sellers_map[s_name]["servicios"] += row.total
-            
-            sellers_map[s_name]["total"] += row.total
 
-        seller_stats = list(sellers_map.values())
+        stats = None
+        breakdown = []
+        seller_stats = []
+        for row in result:
+            if row.grouping == 3:
+                stats = row
+            elif row.grouping == 2:
+                breakdown.append({"category": row.category, "total": row.total})
+            else:
+                seller_stats.append({
+                    "name": row.seller_name,
+                    "software": row.software or 0,
+                    "hardware": row.hardware or 0,
+                    "servicios": row.servicios or 0,
+                    "total": row.total or 0,
+                })
         seller_stats.sort(key=lambda x: x["total"], reverse=True)
 
         return {
-            "total_profit": stats.total_profit or 0,
+            "total_profit": stats.total or 0,
             "total_sold": stats.total_sold or 0,
             "total_clients": stats.total_clients or 0,
             "breakdown": breakdown,
@@ -0,0 +1,86 @@
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# create_all solo crea tablas nuevas: las columnas agregadas a tablas existentes
+# se aplican aquí. Cada sentencia debe ser idempotente (IF NOT EXISTS), porque
+# se ejecutan en cada arranque y desde varios workers a la vez.
+MIGRATIONS = [
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS job_id INTEGER REFERENCES ingestion_jobs(id) ON DELETE SET NULL",
+    "CREATE INDEX IF NOT EXISTS ix_raw_data_job_id ON raw_data (job_id)",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS status VARCHAR NOT NULL DEFAULT 'pending'",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS last_error TEXT",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS processed_at TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS ix_raw_data_claimable ON raw_data (id) WHERE status IN ('pending', 'processing')",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS new_rows INTEGER DEFAULT 0",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS upload_key VARCHAR(64)",
+    "ALTER TABLE raw_data ADD COLUMN IF NOT EXISTS row_offset INTEGER",
+    "ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS duplicate_rows INTEGER DEFAULT 0",
+    # Las filas anteriores quedan con huella NULL (no chocan en el índice único, que crea ensure_indexes)
+    "ALTER TABLE sales ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64)",
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS embedding_model VARCHAR",
+    "ALTER TABLE embedding_jobs ADD COLUMN IF NOT EXISTS space_id INTEGER REFERENCES embedding_spaces(id)",
+]
+
+# Índices declarados en los modelos que faltan en tablas existentes y grandes.
+# Se crean con CONCURRENTLY (sin bloquear escrituras), fuera de toda transacción.
+# Los únicos de fingerprint son los árbitros de ON CONFLICT en la ingesta (processor._insert_new).
+CONCURRENT_INDEXES = {
+    "ix_sales_fingerprint": "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_fingerprint ON sales (fingerprint)",
+    "ix_products_fingerprint": "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_products_fingerprint ON products (fingerprint)",
+    "ix_sales_sale_date": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_sale_date ON sales (sale_date)",
+    "ix_sales_product_id": "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_product_id ON sales (product_id)",
+    "ix_sales_customer_name_sale_date":
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_customer_name_sale_date ON sales (customer_name, sale_date DESC)",
+    "ix_sales_seller_name_sale_date":
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sales_seller_name_sale_date ON sales (seller_name, sale_date DESC)",
+}
+
+# Espera entre intentos mientras otro worker crea los índices
+INDEX_LOCK_POLL_SECONDS = 1
+
+
+async def run_migrations(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        # Un solo worker a la vez aplica las migraciones (el lock se libera con el commit)
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('agente_migrations'))"))
+        for statement in MIGRATIONS:
+            await conn.execute(text(statement))
+
+
+async def ensure_indexes(engine: AsyncEngine) -> dict:
+    """
+    Crea los CONCURRENT_INDEXES que falten y devuelve {índice: estado}. Un CREATE INDEX
+    CONCURRENTLY interrumpido deja el índice inválido: se borra y se vuelve a crear.
+    Si otro worker ya los está creando, se espera a que termine (la ingesta necesita
+    los índices únicos de fingerprint antes de arrancar).
+    """
+    conn = await engine.connect()
+    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        # try_lock en un ciclo, no pg_advisory_lock: esperar el lock dentro de una sentencia
+        # abierta bloquearía el CONCURRENTLY del worker que lo tiene
+        while not await conn.scalar(text("SELECT pg_try_advisory_lock(hashtext('agente_indexes'))")):
+            await asyncio.sleep(INDEX_LOCK_POLL_SECONDS)
+        try:
+            status = {}
+            for name, statement in CONCURRENT_INDEXES.items():
+                valid = await conn.scalar(
+                    text("SELECT x.indisvalid FROM pg_class c JOIN pg_index x ON x.indexrelid = c.oid WHERE c.relname = :name"),
+                    {"name": name},
+                )
+                if valid:
+                    status[name] = "ok"
+                    continue
+                if valid is not None:
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                await conn.execute(text(statement))
+                status[name] = "created"
+            return status
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(hashtext('agente_indexes'))"))
+    finally:
+        await conn.close()
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, String, BigInteger, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.shared.database import Base
+
+# Contadores de versión de datos compartidos por todos los workers.
+# Cada escritura incrementa el contador dentro de su misma transacción, así que
+# las caches pueden validar sus resultados con una sola lectura por clave primaria.
+CATALOG = "catalog"  # productos (nombres, descripciones, precios, embeddings)
+CRM = "crm"          # clientes y personal
+SALES = "sales"      # ventas (y su resumen diario)
+
+
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+async def bump_version(db: AsyncSession, *names: str) -> dict:
+    """
+    Incrementa los contadores indicados y devuelve {nombre: nueva versión}.
+    El commit lo hace quien llama.
+    """
+    versions = {}
+    for name in names:
+        stmt = insert(DataVersion).values(name=name, version=1).on_conflict_do_update(
+            index_elements=[DataVersion.name],
+            set_={"version": DataVersion.version + 1},
+        ).returning(DataVersion.version)
+        result = await db.execute(stmt)
+        versions[name] = result.scalar_one()
+    return versions
+
+
+async def get_version(db: AsyncSession, name: str) -> int:
+    result = await db.execute(select(DataVersion.version).where(DataVersion.name == name))
+    return result.scalar_one_or_none() or 0
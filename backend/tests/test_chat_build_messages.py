@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from src.modules.interaction import service as chat
+
+
+class _Result:
+    def all(self):
+        return []
+
+    def scalar_one_or_none(self):
+        return None
+
+
+class _Session:
+    """Sesión falsa: cada consulta devuelve un resultado vacío."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return _Result()
+
+
+class _Service:
+    """Servicio de embeddings falso con un modelo fijo."""
+
+    def __init__(self, model_key):
+        self.model_key = model_key
+        self.generated = []
+
+    async def generate(self, text):
+        self.generated.append(text)
+        return np.zeros(384, dtype=np.float32)
+
+
+@pytest.mark.anyio
+async def test_build_messages_reuses_supplied_query_vector(monkeypatch):
+    # ask() y ask_stream() ya calcularon el vector: build_messages no debe volver a generarlo
+    service = _Service("modelo-a")
+
+    async def locked(db):
+        return service
+
+    monkeypatch.setattr(chat, "locked_embedding_service", locked)
+    db = _Session()
+    messages = await chat.ChatService().build_messages(
+        "¿Qué laptops tienen?", db, "customer",
+        query_vector=np.ones(384, dtype=np.float32), query_model="modelo-a",
+    )
+
+    assert service.generated == []
+    assert messages[-1] == {"role": "user", "content": "¿Qué laptops tienen?"}
+    assert "[Catálogo y Conocimiento (RAG)]" in messages[0]["content"]
+    assert db.statements  # se ejecutó la búsqueda por similitud
+
+
+@pytest.mark.anyio
+async def test_build_messages_reencodes_when_active_model_changed(monkeypatch):
+    # Entre ask() y la búsqueda se activó otro espacio: el vector recibido no sirve
+    service = _Service("modelo-b")
+
+    async def locked(db):
+        return service
+
+    monkeypatch.setattr(chat, "locked_embedding_service", locked)
+    await chat.ChatService().build_messages(
+        "¿Qué laptops tienen?", _Session(), "customer",
+        query_vector=np.ones(384, dtype=np.float32), query_model="modelo-a",
+    )
+
+    assert service.generated == ["¿Qué laptops tienen?"]
@@ -0,0 +1,33 @@
+import sys
+import types
+import pytest
+
+from src.modules.intelligence.service import EmbeddingService
+
+
+def _sentence_transformers(monkeypatch, version: str) -> list:
+    """Instala un sentence_transformers falso de la versión dada; devuelve las llamadas al constructor."""
+    calls = []
+    module = types.ModuleType("sentence_transformers")
+    module.__version__ = version
+    module.SentenceTransformer = lambda *args, **kwargs: calls.append((args, kwargs)) or object()
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    return calls
+
+
+def test_torch_backend_does_not_pass_backend_and_works_on_older_versions(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_THREADS", raising=False)
+    calls = _sentence_transformers(monkeypatch, "2.7.0")
+
+    EmbeddingService("modelo", backend="torch")._load_backend()
+
+    assert calls == [(("modelo",), {})]
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_backends_require_sentence_transformers_3_2(monkeypatch, backend):
+    calls = _sentence_transformers(monkeypatch, "3.1.1")
+
+    with pytest.raises(RuntimeError, match=r"sentence-transformers >= 3\.2 \(instalado: 3\.1\.1\)"):
+        EmbeddingService("modelo", backend=backend)._load_backend()
+    assert calls == []
@@ -0,0 +1,113 @@
+import asyncio
+import numpy as np
+import pytest
+
+from src.modules.intelligence.service import EmbeddingBatcher, EmbeddingQueueFullError
+
+
+class _Service:
+    """EmbeddingService falso: 'codifica' cada texto como [len(texto)] y registra los lotes."""
+
+    def __init__(self, max_workers=1, max_queue=8, queue_mode="wait", queue_timeout=1.0, fail=False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.queue_mode = queue_mode
+        self.queue_timeout = queue_timeout
+        self.rejected_count = 0
+        self.batches = []
+        self.fail = fail
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def _run(self, fn, *args):
+        await self.gate.wait()
+        return fn(*args)
+
+    def _encode_many(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("modelo caído")
+        return np.array([[float(len(text))] for text in texts])
+
+
+async def _wait_until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("la condición no se cumplió a tiempo")
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_are_coalesced_into_one_encode():
+    service = _Service()
+    batcher = EmbeddingBatcher(service, max_batch_size=32, max_wait_ms=50)
+
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    vectors = await asyncio.gather(*(batcher.submit(text) for text in texts))
+
+    assert service.batches == [texts]
+    assert [vector.tolist() for vector in vectors] == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["max_batch_seen"] == 5
+
+
+@pytest.mark.anyio
+async def test_batches_are_capped_at_max_batch_size():
+    service = _Service(max_workers=4)
+    batcher = EmbeddingBatcher(service, max_batch_size=2, max_wait_ms=50)
+
+    await asyncio.gather(*(batcher.submit(text) for text in ["a", "b", "c", "d", "e"]))
+
+    assert sorted(len(batch) for batch in service.batches) == [1, 2, 2]
+    assert sorted(text for batch in service.batches for text in batch) == ["a", "b", "c", "d", "e"]
+
+
+@pytest.mark.anyio
+async def test_encode_errors_reach_every_request_of_the_batch():
+    service = _Service(fail=True)
+    batcher = EmbeddingBatcher(service, max_batch_size=8, max_wait_ms=20)
+
+    results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert [str(result) for result in results] == ["modelo caído", "modelo caído"]
+
+
+async def _fill_worker_and_queue(batcher, service):
+    """Con el único worker ocupado y la cola (tamaño 1) llena, devuelve las dos peticiones en curso."""
+    service.gate.clear()
+    running = asyncio.ensure_future(batcher.submit("en curso"))
+    await _wait_until(lambda: batcher._queue is not None and batcher._queue.empty() and batcher._inflight)
+    queued = asyncio.ensure_future(batcher.submit("en cola"))
+    await _wait_until(lambda: batcher._queue.full())
+    return running, queued
+
+
+@pytest.mark.anyio
+async def test_reject_mode_fails_fast_when_the_queue_is_full():
+    service = _Service(max_workers=1, max_queue=1, queue_mode="reject")
+    batcher = EmbeddingBatcher(service, max_batch_size=8, max_wait_ms=1)
+    running, queued = await _fill_worker_and_queue(batcher, service)
+
+    with pytest.raises(EmbeddingQueueFullError):
+        await batcher.submit("rechazado")
+    assert service.rejected_count == 1
+
+    # Al liberarse el worker, lo que estaba en cola se procesa igual
+    service.gate.set()
+    assert (await running).tolist() == [8.0]
+    assert (await queued).tolist() == [7.0]
+
+
+@pytest.mark.anyio
+async def test_wait_mode_gives_up_after_queue_timeout():
+    service = _Service(max_workers=1, max_queue=1, queue_mode="wait", queue_timeout=0.05)
+    batcher = EmbeddingBatcher(service, max_batch_size=8, max_wait_ms=1)
+    running, queued = await _fill_worker_and_queue(batcher, service)
+
+    with pytest.raises(EmbeddingQueueFullError):
+        await batcher.submit("espera demasiado")
+    assert service.rejected_count == 1
+
+    service.gate.set()
+    await asyncio.gather(running, queued)
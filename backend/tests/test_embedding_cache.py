@@ -0,0 +1,102 @@
+import sqlite3
+import time
+import numpy as np
+import pytest
+
+from src.modules.intelligence import cache as cache_module
+from src.modules.intelligence.cache import EmbeddingCache
+
+
+def _vector(value: float, dim: int = 4) -> np.ndarray:
+    return np.full(dim, value, dtype=np.float32)
+
+
+def _entry_bytes(dim: int = 4) -> int:
+    return _vector(0, dim).nbytes + cache_module._ENTRY_OVERHEAD_BYTES
+
+
+def test_memory_level_is_an_lru_bounded_by_bytes():
+    cache = EmbeddingCache("modelo", max_bytes=2 * _entry_bytes())
+    cache.put("a", _vector(1))
+    cache.put("b", _vector(2))
+    assert cache.get("a") is not None  # 'a' pasa a ser la más reciente
+    cache.put("c", _vector(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    assert cache.current_bytes == 2 * _entry_bytes()
+
+
+def test_put_copies_the_vector_and_replacing_a_key_keeps_the_byte_count():
+    cache = EmbeddingCache("modelo", max_bytes=10 * _entry_bytes())
+    batch = np.stack([_vector(1), _vector(2)])
+    cache.put("a", batch[0])
+    batch[0] = 9
+    cache.put("a", _vector(5))
+
+    assert cache.get("a").tolist() == [5.0] * 4
+    assert cache.current_bytes == _entry_bytes()
+
+
+def test_disabled_memory_level_stores_nothing():
+    cache = EmbeddingCache("modelo", max_bytes=0)
+    cache.put("a", _vector(1))
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_disk_level_is_shared_between_models(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    await EmbeddingCache("modelo-a", 1 << 20, path).store([("k", _vector(1))])
+    await EmbeddingCache("modelo-b", 1 << 20, path).store([("k", _vector(2))])
+
+    # Abrir la cache de un modelo no borra los vectores del otro
+    reader = EmbeddingCache("modelo-a", 1 << 20, path)
+    found = await reader.lookup(["k", "otra"])
+
+    assert found["k"].tolist() == [1.0] * 4
+    assert (reader.disk_hits, reader.misses) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_disk_level_drops_the_oldest_rows_over_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "_PRUNE_EVERY_ROWS", 1)
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache("modelo", 1 << 20, path, disk_max_rows=3)
+    for i in range(5):
+        await cache.store([(f"k{i}", _vector(i))])
+        time.sleep(0.001)  # created_at distinto por fila
+
+    keys = {row[0] for row in sqlite3.connect(path).execute("SELECT text_hash FROM embeddings")}
+    assert keys == {"k2", "k3", "k4"}
+    assert cache.disk_evictions == 2
+
+
+@pytest.mark.anyio
+async def test_disk_level_drops_expired_rows_when_opened(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    await EmbeddingCache("modelo", 1 << 20, path).store([("k", _vector(1))])
+    time.sleep(0.01)
+
+    cache = EmbeddingCache("modelo", 1 << 20, path, disk_max_age_seconds=0.005)
+
+    assert await cache.lookup(["k"]) == {}
+    assert cache.disk_evictions == 1
+
+
+def test_files_without_created_at_are_migrated(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+        " PRIMARY KEY (model, text_hash))"
+    )
+    db.execute("INSERT INTO embeddings VALUES ('modelo', 'k', ?)", (_vector(1).tobytes(),))
+    db.commit()
+    db.close()
+
+    found = EmbeddingCache("modelo", 1 << 20, path, disk_max_age_seconds=3600)._disk_get_many(["k"])
+
+    assert found["k"].tolist() == [1.0] * 4
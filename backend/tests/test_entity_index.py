@@ -0,0 +1,85 @@
+import pytest
+
+from src.modules.intelligence.models import Client
+from src.modules.interaction.entity_index import NameIndex
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalar_one_or_none(self):
+        return self.rows
+
+    def all(self):
+        return self.rows
+
+
+class _Session:
+    """Sesión falsa: la primera consulta es la versión 'crm', la segunda los nombres."""
+
+    def __init__(self, version, names):
+        self.results = [version, names]
+        self.queries = 0
+
+    async def execute(self, statement, *args, **kwargs):
+        result = _Result(self.results[self.queries % 2])
+        self.queries += 1
+        return result
+
+
+def _index(names: dict) -> NameIndex:
+    index = NameIndex(Client)
+    index.version = 1
+    for entity_id, name in names.items():
+        index._add(entity_id, name)
+    return index
+
+
+def test_long_words_match_as_whole_tokens():
+    index = _index({1: "Acme Corp", 2: "Acmeplus Ltda", 3: "Distribuidora Sur"})
+
+    assert index.match("¿Cuánto compró Acme este mes?") == {1}
+    # Antes se buscaba por subcadena y 'acmeplus' también traía a Acme
+    assert index.match("ventas de acmeplus") == {2}
+    assert index.match("pedidos de la distribuidora") == {3}
+    assert index.match("clientes del sur") == set()  # 'sur' es corta y no es el nombre completo
+    assert index.match("nada que ver") == set()
+
+
+def test_short_names_match_only_as_complete_phrases():
+    index = _index({1: "IBM", 2: "Grupo SA de CV"})
+
+    assert index.match("pedidos de IBM") == {1}
+    assert index.match("proveedores sa") == set()  # palabra corta suelta: no identifica
+    assert index.match("facturas de grupo sa de cv") == {2}
+
+
+def test_apply_updates_in_place_and_forces_reload_when_versions_skip():
+    index = _index({1: "Acme Corp"})
+
+    index.apply(1, "Globex Corp", new_version=2)
+    assert index.match("acme") == set()
+    assert index.match("globex") == {1}
+    assert index.version == 2
+
+    index.apply(2, "Initech", new_version=3)
+    index.apply(2, None, new_version=4)
+    assert index.match("initech") == set()
+
+    # Otro worker incrementó la versión entre medio: hay que recargar
+    index.apply(3, "Umbrella", new_version=6)
+    assert index.version is None
+
+
+@pytest.mark.anyio
+async def test_ensure_fresh_reloads_only_when_the_crm_version_changes():
+    index = NameIndex(Client)
+    db = _Session(version=7, names=[(1, "Acme Corp")])
+
+    await index.ensure_fresh(db)
+    await index.ensure_fresh(db)  # misma versión: solo se consulta la versión
+
+    assert index.match("acme") == {1}
+    assert index.version == 7
+    assert db.queries == 3
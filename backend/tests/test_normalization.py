@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+from src.modules.intelligence.normalization import normalize_sales, parse_dates, sale_mask
+
+
+def test_aliases_first_present_wins_and_defaults_fill_the_rest():
+    df = normalize_sales([
+        {"product_name": "Laptop", "Producto": "Ignorado", "sale_date": "2024-05-01", "customer_name": "Ana"},
+        {"Producto": "Mouse", "Fecha": "2024-05-02", "Nombre": "Luis", "Empleado": "Eva", "Categoría": "Accesorios"},
+        {"price_total": 10},
+    ])
+
+    assert df["product_name"].tolist() == ["Laptop", "Mouse", "Producto Desconocido"]
+    assert df["customer_name"].tolist() == ["Ana", "Luis", "Cliente Genérico"]
+    assert df["seller_name"].tolist() == ["Vendedor Sin Asignar", "Eva", "Vendedor Sin Asignar"]
+    assert df["category"].tolist() == ["General", "Accesorios", "General"]
+    assert df["payment_method"].tolist() == [None, None, None]
+
+
+def test_numeric_codes_from_alias_columns_stay_integral():
+    # Filas sin 'Producto' hacen que pandas lea la columna como float (123 -> 123.0)
+    df = normalize_sales([
+        {"product_name": "Laptop", "sale_date": "2024-05-01"},
+        {"Producto": 123, "Fecha": "2024-05-01", "Nombre": 42},
+        {"Producto": 12.5, "Fecha": "2024-05-01"},
+    ])
+
+    assert df["product_name"].tolist() == ["Laptop", "123", "12.5"]
+    assert df["customer_name"].tolist() == ["Cliente Genérico", "42", "Cliente Genérico"]
+
+
+def test_date_formats_timestamps_and_fallback():
+    before = datetime.utcnow() - timedelta(seconds=1)
+    df = normalize_sales([
+        {"sale_date": "2024-05-01 10:30:00"},
+        {"sale_date": "2024-05-02"},
+        {"sale_date": "03/05/2024"},
+        {"sale_date": 1714780800000},  # ms, como los serializa pandas
+        {"sale_date": "no es fecha", "price_total": 1},
+    ])
+
+    dates = df["sale_date"].tolist()
+    assert dates[:4] == [
+        datetime(2024, 5, 1, 10, 30),
+        datetime(2024, 5, 2),
+        datetime(2024, 5, 3),
+        datetime(2024, 5, 4),
+    ]
+    assert dates[4] >= before
+
+
+def test_parse_dates_mixed_formats_in_one_column():
+    values = pd.Series(["01/02/2024", "2024-02-03", None], dtype=object)
+    result = parse_dates(values, 3)
+
+    assert result[0] == np.datetime64("2024-02-01")
+    assert result[1] == np.datetime64("2024-02-03")
+    assert not np.isnat(result[2])  # sin fecha: la actual
+
+
+def test_numeric_coercion():
+    df = normalize_sales([
+        {"quantity": "3", "price_total": "19.5", "sale_date": "2024-05-01"},
+        {"Unidades": 2.9, "Coste Total": 7, "Fecha": "2024-05-01"},
+        {"quantity": "abc", "price_total": "n/a", "sale_date": "2024-05-01"},
+        {"sale_date": "2024-05-01"},
+    ])
+
+    assert df["quantity"].tolist() == [3, 2, 1, 1]
+    assert df["price_total"].tolist() == [19.5, 7.0, 0.0, 0.0]
+
+
+def test_sale_mask_uses_any_date_or_total_alias():
+    df = pd.DataFrame.from_records([{"Fecha": "2024-05-01"}, {"Coste Total": 3}, {"name": "Manual"}])
+
+    assert sale_mask(df).tolist() == [True, True, False]
+
+
+def _sales(count: int, **fields) -> list[dict]:
+    row = {"sale_date": "2024-05-01", "product_name": "Laptop", "price_total": 10, **fields}
+    return [dict(row) for _ in range(count)]
+
+
+def test_fingerprints_follow_upload_identity_and_position():
+    first = normalize_sales(_sales(3), "excel", upload_key="archivo-a", positions=[0, 1, 2])["fingerprint"].tolist()
+    # Otro bloque del mismo archivo: posiciones siguientes (row_offset)
+    second = normalize_sales(_sales(2), "excel", upload_key="archivo-a", positions=[3, 4])["fingerprint"].tolist()
+    reupload = normalize_sales(_sales(3), "excel", upload_key="archivo-a", positions=[0, 1, 2])["fingerprint"].tolist()
+    other_file = normalize_sales(_sales(3), "excel", upload_key="archivo-b", positions=[0, 1, 2])["fingerprint"].tolist()
+
+    # Filas idénticas legítimas de un archivo no se pisan, ni entre bloques
+    assert len(set(first + second)) == 5
+    # Solo volver a subir el mismo archivo repite las huellas
+    assert reupload == first
+    assert not set(other_file) & set(first)
+
+
+def test_legacy_fingerprints_count_identical_rows_within_the_block():
+    df = normalize_sales(_sales(2) + _sales(1, price_total=20), "api")
+    again = normalize_sales(_sales(2) + _sales(1, price_total=20), "api")
+    other_source = normalize_sales(_sales(2) + _sales(1, price_total=20), "excel")
+
+    fingerprints = df["fingerprint"].tolist()
+    assert len(set(fingerprints)) == 3
+    assert again["fingerprint"].tolist() == fingerprints
+    assert not set(other_source["fingerprint"]) & set(fingerprints)
+
+
+def test_legacy_fingerprints_ignore_access_level():
+    public = normalize_sales(_sales(1, access_level="public"), "api")
+    private = normalize_sales(_sales(1, access_level="private"), "api")
+
+    assert public["fingerprint"].tolist() == private["fingerprint"].tolist()
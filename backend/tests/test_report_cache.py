@@ -0,0 +1,109 @@
+import pytest
+
+from src.modules.reports import service as report_service_module
+from src.modules.reports.cache import ReportCache
+from src.modules.reports.router import cached_response
+from src.modules.reports.service import ReportService
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    """Contadores de data_versions en memoria en lugar de la tabla."""
+    current = {"sales": 1, "catalog": 1}
+
+    async def get_version(db, name):
+        return current[name]
+
+    monkeypatch.setattr(report_service_module, "get_version", get_version)
+    return current
+
+
+def _service(max_entries=8) -> ReportService:
+    service = ReportService()
+    service.cache = ReportCache(max_entries=max_entries)
+    return service
+
+
+class _Compute:
+    """Cálculo del reporte que cuenta cuántas veces se ejecutó."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return {"total": self.calls}
+
+
+@pytest.mark.anyio
+async def test_result_is_reused_until_its_version_changes(versions):
+    service = _service()
+    compute = _Compute()
+
+    first, etag = await service.cached(None, "sales", {"year": 2024}, "sales", compute)
+    again, same_etag = await service.cached(None, "sales", {"year": 2024}, "sales", compute)
+    assert (first, again, compute.calls) == ({"total": 1}, {"total": 1}, 1)
+    assert same_etag == etag
+
+    # Una escritura de ventas incrementa la versión: se recalcula y cambia el ETag
+    versions["sales"] = 2
+    fresh, new_etag = await service.cached(None, "sales", {"year": 2024}, "sales", compute)
+    assert fresh == {"total": 2}
+    assert new_etag != etag
+    assert (service.cache.hits, service.cache.misses) == (1, 2)
+
+
+@pytest.mark.anyio
+async def test_filters_are_part_of_the_key(versions):
+    service = _service()
+    compute = _Compute()
+
+    await service.cached(None, "sales", {"year": 2024, "month": 5}, "sales", compute)
+    await service.cached(None, "sales", {"month": 5, "year": 2024}, "sales", compute)
+    await service.cached(None, "sales", {"year": 2023, "month": 5}, "sales", compute)
+
+    assert compute.calls == 2
+
+
+@pytest.mark.anyio
+async def test_matching_if_none_match_returns_304_without_computing(versions):
+    service = _service()
+    compute = _Compute()
+    _, etag = await service.cached(None, "stats", {}, "catalog", compute)
+
+    # Otro worker sin la entrada en memoria responde 304 igual: el ETag sale de clave y versión
+    other = _service()
+    result, same_etag = await other.cached(None, "stats", {}, "catalog", compute, if_none_match=f'"x", W/{etag}')
+
+    assert result is None and same_etag == etag
+    assert compute.calls == 1
+    assert other.cache.not_modified == 1
+
+    response = cached_response(result, etag)
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.anyio
+async def test_stale_if_none_match_gets_the_new_result(versions):
+    service = _service()
+    compute = _Compute()
+    _, old_etag = await service.cached(None, "stats", {}, "catalog", compute)
+
+    versions["catalog"] = 5
+    result, etag = await service.cached(None, "stats", {}, "catalog", compute, if_none_match=old_etag)
+
+    assert result == {"total": 2}
+    assert cached_response(result, etag).status_code == 200
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ReportCache(max_entries=2)
+    cache.store("a", 1, "A")
+    cache.store("b", 1, "B")
+    cache.get("a", 1)
+    cache.store("c", 1, "C")
+
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "A"
+    assert cache.evictions == 1
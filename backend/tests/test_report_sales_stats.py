@@ -0,0 +1,69 @@
+from collections import namedtuple
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.modules.reports.service import ReportService
+
+Row = namedtuple("Row", "grouping seller_name category total total_sold total_clients software hardware servicios")
+
+
+class _Session:
+    """Sesión falsa: guarda la consulta y devuelve las filas dadas."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return iter(self.rows)
+
+
+@pytest.mark.anyio
+async def test_grouping_bits_split_totals_categories_and_sellers():
+    db = _Session([
+        # GROUPING(vendedor, categoría): 3 = totales, 2 = por categoría, 1 = por vendedor
+        Row(3, None, None, 600.0, 12, 4, 300.0, 200.0, 100.0),
+        Row(2, None, "Software", 300.0, 5, 2, 300.0, None, None),
+        Row(2, None, "Hardware", 200.0, 4, 2, None, 200.0, None),
+        Row(2, None, None, 100.0, 3, 1, None, None, None),
+        Row(1, "Ana", None, 150.0, 4, 2, 100.0, None, 50.0),
+        Row(1, "Sin Asignar", None, 450.0, 8, 3, 200.0, 200.0, None),
+    ])
+
+    stats = await ReportService().get_sales_stats(db, month=5, year=2024)
+
+    assert (stats["total_profit"], stats["total_sold"], stats["total_clients"]) == (600.0, 12, 4)
+    assert stats["breakdown"] == [
+        {"category": "Software", "total": 300.0},
+        {"category": "Hardware", "total": 200.0},
+        {"category": None, "total": 100.0},
+    ]
+    # Ordenados por total descendente y sin None en las columnas por categoría
+    assert stats["seller_stats"] == [
+        {"name": "Sin Asignar", "software": 200.0, "hardware": 200.0, "servicios": 0, "total": 450.0},
+        {"name": "Ana", "software": 100.0, "hardware": 0, "servicios": 50.0, "total": 150.0},
+    ]
+
+
+@pytest.mark.anyio
+async def test_empty_period_returns_zeros():
+    # Sin ventas, GROUPING SETS igual devuelve la fila de totales (con SUM nulos)
+    db = _Session([Row(3, None, None, None, None, 0, None, None, None)])
+
+    stats = await ReportService().get_sales_stats(db, year=2024)
+
+    assert stats == {"total_profit": 0, "total_sold": 0, "total_clients": 0, "breakdown": [], "seller_stats": []}
+
+
+@pytest.mark.anyio
+async def test_single_query_over_the_daily_rollup():
+    db = _Session([Row(3, None, None, 0.0, 0, 0, None, None, None)])
+
+    await ReportService().get_sales_stats(db, year=2024, customer_name="Acme")
+
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert "FROM sales_daily_rollup" in sql
+    assert "GROUP BY GROUPING SETS" in sql
+    assert sql.count("FILTER (WHERE") == 3
@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.modules.interaction import response_cache
+from src.modules.interaction.response_cache import SemanticResponseCache
+
+
+def _cache(**kwargs) -> SemanticResponseCache:
+    options = {"threshold": 0.95, "ttl_seconds": 60, "max_entries": 10}
+    options.update(kwargs)
+    return SemanticResponseCache(**options)
+
+
+def test_similar_question_reuses_the_answer_and_a_different_one_misses():
+    cache = _cache()
+    cache.store("customer", np.array([1.0, 0.0, 0.0]), 1, "Tenemos laptops")
+
+    # Misma dirección con otra norma: similitud coseno 1
+    assert cache.lookup("customer", np.array([3.0, 0.1, 0.0]), 1) == "Tenemos laptops"
+    assert cache.lookup("customer", np.array([0.0, 1.0, 0.0]), 1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_roles_do_not_share_answers():
+    cache = _cache()
+    cache.store("admin", np.array([1.0, 0.0]), 1, "Respuesta con datos internos")
+
+    assert cache.lookup("customer", np.array([1.0, 0.0]), 1) is None
+
+
+def test_catalog_version_change_invalidates_entries():
+    cache = _cache()
+    cache.store("customer", np.array([1.0, 0.0]), 1, "Respuesta vieja")
+
+    assert cache.lookup("customer", np.array([1.0, 0.0]), 2) is None
+    assert cache.invalidations == 1
+    assert cache.stats()["entries"] == {"customer": 0}
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = _cache(ttl_seconds=10)
+    cache.store("customer", np.array([1.0, 0.0]), 1, "Respuesta")
+
+    now[0] += 11
+    assert cache.lookup("customer", np.array([1.0, 0.0]), 1) is None
+    assert cache.invalidations == 1
+
+
+def test_entries_from_a_model_with_another_dimension_are_stale():
+    cache = _cache()
+    cache.store("customer", np.ones(384), 1, "Respuesta del modelo anterior")
+
+    # Tras un cambio de espacio vectorial la pregunta llega con otra dimensión
+    assert cache.lookup("customer", np.ones(768), 1) is None
+    assert cache.invalidations == 1
+
+
+def test_oldest_entry_is_evicted_over_max_entries():
+    cache = _cache(max_entries=2)
+    cache.store("customer", np.array([1.0, 0.0, 0.0]), 1, "a")
+    cache.store("customer", np.array([0.0, 1.0, 0.0]), 1, "b")
+    cache.store("customer", np.array([0.0, 0.0, 1.0]), 1, "c")
+
+    assert cache.evictions == 1
+    assert cache.lookup("customer", np.array([1.0, 0.0, 0.0]), 1) is None
+    assert cache.lookup("customer", np.array([0.0, 0.0, 1.0]), 1) == "c"
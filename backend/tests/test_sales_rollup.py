@@ -0,0 +1,104 @@
+from datetime import datetime
+import pytest
+
+from src.modules.reports import rollup
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class _Row:
+    def __init__(self, id, sale_count):
+        self.id = id
+        self.sale_count = sale_count
+
+
+class _Session:
+    """Sesión falsa: guarda cada consulta con sus parámetros y devuelve las filas dadas."""
+
+    def __init__(self, returned=()):
+        self.returned = list(returned)
+        self.calls = []
+
+    async def execute(self, statement, params=None):
+        self.calls.append((statement, params))
+        return _Result(self.returned)
+
+
+@pytest.fixture
+def bumps(monkeypatch):
+    calls = []
+
+    async def bump_version(db, *names):
+        calls.append(names)
+
+    monkeypatch.setattr(rollup, "bump_version", bump_version)
+    return calls
+
+
+def _sale(day, price_total, quantity, category="Software", seller_name="Ana", customer_name=None, region=None):
+    return {
+        "sale_date": datetime(2024, 5, day, 15, 30),
+        "price_total": price_total,
+        "quantity": quantity,
+        "category": category,
+        "seller_name": seller_name,
+        "customer_name": customer_name,
+        "region": region,
+    }
+
+
+@pytest.mark.anyio
+async def test_sales_of_the_same_day_and_dimensions_add_up_into_one_delta(bumps):
+    db = _Session()
+
+    await rollup.apply_sales(db, added=[_sale(2, 100.0, 1), _sale(2, 50.0, 2), _sale(1, 10.0, 1, seller_name=None)])
+
+    _, rows = db.calls[0]
+    # Claves ordenadas (el día 1 primero) y dimensiones nulas guardadas como ''
+    assert [(row["day"].day, row["seller_name"], row["customer_name"]) for row in rows] == [(1, "", ""), (2, "Ana", "")]
+    assert [(row["price_total"], row["quantity"], row["sale_count"]) for row in rows] == [(10.0, 1, 1), (150.0, 3, 2)]
+    assert bumps == [(rollup.SALES,)]
+
+
+@pytest.mark.anyio
+async def test_editing_a_sale_moves_it_between_rollup_rows(bumps):
+    db = _Session()
+    before = _sale(3, 100.0, 1, category="Software")
+    after = _sale(3, 120.0, 1, category="Hardware")
+
+    await rollup.apply_sales(db, added=[after], removed=[before])
+
+    _, rows = db.calls[0]
+    assert [(row["category"], row["price_total"], row["sale_count"]) for row in rows] == [
+        ("Hardware", 120.0, 1),
+        ("Software", -100.0, -1),
+    ]
+
+
+@pytest.mark.anyio
+async def test_rows_left_without_sales_are_deleted(bumps):
+    db = _Session(returned=[_Row(7, 0), _Row(8, 2)])
+
+    await rollup.apply_sales(db, removed=[_sale(4, 30.0, 1)])
+
+    assert len(db.calls) == 2
+    delete, _ = db.calls[1]
+    assert delete.compile().params == {"id_1": [7]}
+
+
+@pytest.mark.anyio
+async def test_sales_without_date_are_ignored(bumps):
+    db = _Session()
+    sale = _sale(5, 10.0, 1)
+    sale["sale_date"] = None
+
+    await rollup.apply_sales(db, added=[sale])
+
+    assert db.calls == []
+    assert bumps == []
@@ -134,11 +134,12 @@ const AdminDashboard = () => {
         setLoading(true);
         try {
             const timestamp = new Date().getTime();
+            // /reports/* responde con ETag: el navegador revalida con If-None-Match y recibe 304 si nada cambió
             const [statsRes, productsRes, salesRes, customersRes, registeredRes, staffRes, clientsRes] = await Promise.all([
-                axios.get(`http://localhost:8000/reports/stats?_t=${timestamp}`),
+                axios.get(`http://localhost:8000/reports/stats`),
                 axios.get(`http://localhost:8000/intelligence/products?_t=${timestamp}`),
-                axios.get(`http://localhost:8000/reports/sales?month=${selectedMonth}&year=${selectedYear}&customer_name=${selectedCustomer}&_t=${timestamp}`),
-                axios.get(`http://localhost:8000/reports/customers?_t=${timestamp}`),
+                axios.get(`http://localhost:8000/reports/sales?month=${selectedMonth}&year=${selectedYear}&customer_name=${selectedCustomer}`),
+                axios.get(`http://localhost:8000/reports/customers`),
                 axios.get(`http://localhost:8000/ingestion/sales?_t=${timestamp}`),
                 axios.get(`http://localhost:8000/intelligence/staff?_t=${timestamp}`),
                 axios.get(`http://localhost:8000/intelligence/clients?_t=${timestamp}`)
@@ -156,6 +157,16 @@ const AdminDashboard = () => {
         setLoading(false);
     };
 
+    // La ingesta se procesa en segundo plano: consultar el job hasta que termine
+    const waitForIngestionJob = async (jobId) => {
+        for (let i = 0; i < 600; i++) {
+            const res = await axios.get(`http://localhost:8000/ingestion/jobs/${jobId}`);
+            if (res.data.status === 'done' || res.data.status === 'failed') return res.data;
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+        return null;
+    };
+
     const handleSaveSale = async () => {
         try {
             await axios.put(`http://localhost:8000/ingestion/sales/${editingSale.id}`, editingSale);
@@ -1093,7 +1104,10 @@ const AdminDashboard = () => {
                                                             const res = await axios.post('http://localhost:8000/ingestion/upload-sales', formData, {
                                                                 headers: { 'Content-Type': 'multipart/form-data' }
                                                             });
-                                                            alert(res.data.message);
+                                                            const job = await waitForIngestionJob(res.data.job_id);
+                                                            alert(job
+                                                                ? `Archivo procesado: ${job.processed_rows} de ${job.total_rows} filas (${job.new_rows} nuevas, ${job.duplicate_rows} ya cargadas, ${job.error_count} con error).`
+                                                                : res.data.message);
                                                             fetchAllData();
                                                         } catch(err) {
                                                             alert('Error al subir el archivo: ' + err.message);
@@ -1118,7 +1132,10 @@ const AdminDashboard = () => {
                                         setIsUploading(true);
                                         try {
                                             const res = await axios.post('http://localhost:8000/ingestion/manual-sale', manualSale);
-                                            alert(res.data.message);
+                                            const job = await waitForIngestionJob(res.data.job_id);
+                                            alert(job && job.status === 'done'
+                                                ? (job.duplicate_rows ? 'La venta ya estaba registrada (duplicada).' : 'Venta procesada exitosamente.')
+                                                : (job?.last_error || res.data.message));
                                             fetchAllData();
                                             // Reset
                                             setManualSale({